@@ -6,6 +6,7 @@ from setuptools.command.sdist import sdist as _sdist
 
 
 cython_modules = [
+    ["word_embedding_loader", "_vocabulary"],
     ["word_embedding_loader", "loader", "word2vec_bin"],
     ["word_embedding_loader", "saver", "word2vec_bin"]
 ]
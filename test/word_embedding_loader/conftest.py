@@ -4,6 +4,7 @@ from __future__ import absolute_import, division, print_function, \
 
 import os
 
+import numpy as np
 import pytest
 
 
@@ -51,3 +52,17 @@ def vocab_file(tmpdir):
         f.flush()
         f.seek(0)
         yield f
+
+
+@pytest.fixture
+def wel_file(tmpdir):
+    from word_embedding_loader.saver import wel
+    vocab = [(b'</s>', 0), (b'the', 1), ('日本語'.encode('utf-8'), 2)]
+    arr = np.array([[0.080054, 0.088388],
+                    [-1.420859, 1.156857],
+                    [-0.16799, 0.10951]], dtype=np.float32)
+    with open(tmpdir.join('wel_file.wel').strpath, 'w+b') as f:
+        wel.save(f, arr, vocab)
+        f.flush()
+        f.seek(0)
+        yield f
@@ -1,14 +1,19 @@
 from __future__ import absolute_import, division, print_function, \
     unicode_literals
 
+import numpy as np
 import pytest
+from numpy.testing import assert_array_equal
+
 import word_embedding_loader.loader.word2vec_bin as word2vec_bin
 
 import word_embedding_loader.loader.glove as glove
+import word_embedding_loader.loader.wel as wel
 import word_embedding_loader.loader.word2vec_text as word2vec_text
 
 
-@pytest.fixture(params=['word2vec_bin_file', 'word2vec_text_file', 'glove_file'])
+@pytest.fixture(params=['word2vec_bin_file', 'word2vec_text_file', 'glove_file',
+                        'wel_file'])
 def context(request):
     if request.param == 'word2vec_bin_file':
         return (word2vec_bin, request.getfixturevalue('word2vec_bin_file'))
@@ -16,6 +21,8 @@ def context(request):
         return (word2vec_text, request.getfixturevalue('word2vec_text_file'))
     elif request.param == 'glove_file':
         return (glove, request.getfixturevalue('glove_file'))
+    elif request.param == 'wel_file':
+        return (wel, request.getfixturevalue('wel_file'))
 
 
 @pytest.mark.parametrize('n, expected', [(2, 2), (3, 3), (5, 3)])
@@ -24,3 +31,31 @@ def test_max_vocab(context, n, expected):
     arr, vocab = module.load(f, max_vocab=n)
     assert len(arr) == expected
     assert len(vocab) == expected
+
+
+@pytest.mark.parametrize('batch_size', [1, 2, 5])
+def test_iter_rows(context, batch_size):
+    module, f = context
+    expected, vocab = module.load(f, dtype=np.float64)
+    f.seek(0)
+    batches = list(module.iter_rows(f, dtype=np.float64, batch_size=batch_size))
+    assert [len(t) for t, _ in batches[:-1]] == \
+        [batch_size] * (len(batches) - 1)
+    tokens = sum((t for t, _ in batches), [])
+    arr = np.concatenate([a for _, a in batches])
+    assert arr.dtype == np.float64
+    assert tokens == sorted(vocab, key=vocab.get)
+    assert_array_equal(arr, expected)
+
+
+def test_iter_rows_max_vocab(context):
+    module, f = context
+    batches = list(module.iter_rows(f, batch_size=1, max_vocab=2))
+    assert len(batches) == 2
+
+
+def test_read_shape(context):
+    module, f = context
+    arr, vocab = module.load(f)
+    f.seek(0)
+    assert module.read_shape(f) == arr.shape
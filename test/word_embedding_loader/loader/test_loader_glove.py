@@ -66,3 +66,19 @@ def test_load_with_vocab(glove_file):
     assert_array_equal(arr[vocab['日本語'.encode('utf-8')]],
                        np.array([0.15164, 0.30177, -0.16763, 0.17684],
                                 dtype=np.float32))
+
+
+@pytest.mark.parametrize('max_vocab', [None, 1500])
+def test_load_grow(max_vocab):
+    n = 3000
+    expected = np.arange(n * 2, dtype=np.float32).reshape(n, 2)
+    f = io.BytesIO(b'\n'.join(
+        ('w%d %d %d' % (i, v[0], v[1])).encode('utf-8')
+        for i, v in enumerate(expected)))
+    arr, vocab = glove.load(f, max_vocab=max_vocab)
+    n_expected = n if max_vocab is None else max_vocab
+    assert arr.shape == (n_expected, 2)
+    assert arr.flags.c_contiguous
+    assert len(vocab) == n_expected
+    assert vocab[b'w1234'] == 1234
+    assert_array_equal(arr, expected[:n_expected])
@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, division, print_function, \
+    unicode_literals
+
+import gzip
+import io
+import multiprocessing
+import warnings
+
+import numpy as np
+import pytest
+from numpy.testing import assert_array_equal
+
+from word_embedding_loader import ParseError, loader
+from word_embedding_loader.loader import _parallel, _text
+
+
+@pytest.fixture(autouse=True)
+def small_ranges(monkeypatch):
+    # Split even tiny files into several ranges
+    monkeypatch.setattr(_parallel, '_MIN_RANGE_BYTES', 1)
+
+
+def _write(tmpdir, lines, header=None):
+    path = tmpdir.join('embedding.txt').strpath
+    if header is not None:
+        lines = [header] + lines
+    with open(path, 'wb') as f:
+        f.write(b'\n'.join(lines))
+    return path
+
+
+def _glove_lines(n, size=3):
+    return [('w%d %s' % (i, ' '.join('%d' % (i * size + j)
+                                     for j in range(size)))).encode('utf-8')
+            for i in range(n)]
+
+
+def _load(mod, path, **kwargs):
+    with warnings.catch_warnings(record=True) as w:
+        warnings.simplefilter('always')
+        with open(path, 'rb') as f:
+            ret = mod.load(f, **kwargs)
+    return ret, [str(x.message) for x in w]
+
+
+@pytest.mark.parametrize('max_vocab', [None, 1, 7, 100])
+@pytest.mark.parametrize('duplicates', [False, True])
+@pytest.mark.parametrize('fmt', ['glove', 'word2vec_text'])
+def test_load(tmpdir, fmt, duplicates, max_vocab):
+    lines = _glove_lines(20)
+    if duplicates:
+        lines[3] = lines[1]
+        lines[12] = lines[8].replace(b' ', b' 1', 1)
+    header = b'20 3' if fmt == 'word2vec_text' else None
+    path = _write(tmpdir, lines, header)
+    mod = getattr(loader, fmt)
+
+    (expected, expected_vocab), expected_warnings = _load(
+        mod, path, max_vocab=max_vocab)
+    for workers in (2, 3):
+        (arr, vocab), w = _load(mod, path, max_vocab=max_vocab,
+                                workers=workers)
+        assert vocab == expected_vocab
+        assert_array_equal(arr, expected)
+        assert w == expected_warnings
+
+
+def test_split_ranges(tmpdir):
+    path = _write(tmpdir, _glove_lines(10))
+    with open(path, 'rb') as f:
+        data = f.read()
+        ranges = _parallel.split_ranges(f, 0, 4)
+    assert len(ranges) == 4
+    assert ranges[0][0] == 0
+    assert ranges[-1][1] == len(data)
+    for (_, e), (s, _) in zip(ranges[:-1], ranges[1:]):
+        assert e == s
+        assert data[s - 1:s] == b'\n'
+
+
+def test_load_fail(tmpdir):
+    lines = _glove_lines(20)
+    lines[15] = b'w15 0 1'
+    path = _write(tmpdir, lines)
+    with open(path, 'rb') as f:
+        with pytest.raises(ParseError):
+            loader.glove.load(f, workers=2)
+
+
+def test_load_not_file():
+    # Falls back to loading in the current process
+    f = io.BytesIO(b'\n'.join(_glove_lines(5)))
+    arr, vocab = loader.glove.load(f, workers=2)
+    assert arr.shape == (5, 3)
+    assert vocab[b'w4'] == 4
+
+
+@pytest.mark.parametrize('fmt', ['glove', 'word2vec_text'])
+def test_load_pools(tmpdir, monkeypatch, fmt):
+    # One pool parses the lines, and none is started for a single range
+    pools = []
+    new_pool = multiprocessing.Pool
+
+    def Pool(*args, **kwargs):
+        pools.append(args)
+        return new_pool(*args, **kwargs)
+
+    monkeypatch.setattr(multiprocessing, 'Pool', Pool)
+    header = b'20 3' if fmt == 'word2vec_text' else None
+    path = _write(tmpdir, _glove_lines(20), header)
+    mod = getattr(loader, fmt)
+    with open(path, 'rb') as f:
+        arr, _ = mod.load(f, workers=2)
+    assert len(pools) == 1
+    assert arr.shape == (20, 3)
+
+    monkeypatch.setattr(_parallel, '_MIN_RANGE_BYTES', _text.BLOCK_SIZE)
+    with open(path, 'rb') as f:
+        assert_array_equal(mod.load(f, workers=2)[0], arr)
+    with open(path, 'rb') as f:
+        assert_array_equal(mod.load_with_vocab(f, {b'w1': 0}, workers=2),
+                           arr[1:2])
+    assert len(pools) == 1
+
+
+def test_load_compressed(tmpdir):
+    # GzipFile has the name of the compressed file, which must not be parsed
+    path = tmpdir.join('embedding.txt.gz').strpath
+    with gzip.open(path, 'wb') as f:
+        f.write(b'\n'.join(_glove_lines(5)))
+    with gzip.open(path, 'rb') as f:
+        assert _parallel.file_path(f) is None
+        arr, vocab = loader.glove.load(f, workers=2)
+    assert arr.shape == (5, 3)
+    assert vocab[b'w4'] == 4
+
+
+@pytest.mark.parametrize('fmt', ['glove', 'word2vec_text'])
+def test_load_with_vocab(tmpdir, fmt):
+    lines = _glove_lines(20)
+    header = b'20 3' if fmt == 'word2vec_text' else None
+    path = _write(tmpdir, lines, header)
+    mod = getattr(loader, fmt)
+    vocab = {b'w17': 0, b'w2': 1, b'w9': 2}
+    with open(path, 'rb') as f:
+        arr = mod.load_with_vocab(f, vocab, workers=3)
+    assert_array_equal(arr, [[51, 52, 53], [6, 7, 8], [27, 28, 29]])
+
+
+@pytest.mark.parametrize('fmt', ['glove', 'word2vec_text'])
+def test_load_with_vocab_duplicates(tmpdir, fmt):
+    # The first occurrence is used, as in load
+    lines = _glove_lines(20)
+    lines[3] = lines[1].replace(b' ', b' 1', 1)
+    lines[15] = lines[1].replace(b' ', b' 2', 1)
+    header = b'20 3' if fmt == 'word2vec_text' else None
+    path = _write(tmpdir, lines, header)
+    mod = getattr(loader, fmt)
+    (expected, vocab), _ = _load(mod, path)
+    with open(path, 'rb') as f:
+        arr = mod.load_with_vocab(f, {b'w1': 0, b'w9': 1}, workers=3)
+    assert_array_equal(arr, expected[[vocab[b'w1'], vocab[b'w9']]])
+    assert_array_equal(arr[0], [3, 4, 5])
+
+
+def test_load_with_vocab_missing(tmpdir):
+    path = _write(tmpdir, _glove_lines(20), b'20 3')
+    with open(path, 'rb') as f:
+        with pytest.raises(ParseError):
+            loader.word2vec_text.load_with_vocab(
+                f, {b'w1': 0, b'missing': 1}, workers=2)
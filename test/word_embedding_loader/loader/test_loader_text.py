@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, division, print_function, \
+    unicode_literals
+
+import io
+import warnings
+
+import numpy as np
+import pytest
+from numpy.testing import assert_array_equal
+
+import word_embedding_loader.loader._text as _text
+import word_embedding_loader.loader.glove as glove
+import word_embedding_loader.loader.word2vec_text as word2vec_text
+from word_embedding_loader import ParseError, ParseWarning
+
+
+def test_parse_values():
+    lines = [b'the 0.418 0.24968\n', b', 0.013441 -0.16899\n']
+    tokens, values = _text.split_lines(lines)
+    assert tokens == [b'the', b',']
+    arr = _text.parse_values(lines, values, np.float32, 2)
+    assert arr.dtype == np.float32
+    assert_array_equal(arr, np.array([[0.418, 0.24968], [0.013441, -0.16899]],
+                                     dtype=np.float32))
+
+
+@pytest.mark.parametrize('line, message', [
+    (b', 0.013441 x\n', b'Parsing error'),
+    (b', 0.013441  0.1\n', b'Parsing error'),
+    (b', 0.013441\n', b'Vector size did not match'),
+])
+def test_parse_values_fail(line, message):
+    lines = [b'the 0.418 0.24968\n', line]
+    tokens, values = _text.split_lines(lines)
+    with pytest.raises(ParseError) as e:
+        _text.parse_values(lines, values, np.float32, 2)
+    assert message in e.value.args[0]
+    assert line in e.value.args[0]
+
+
+@pytest.fixture
+def small_blocks(monkeypatch):
+    # Force every few lines into its own block
+    monkeypatch.setattr(_text, 'BLOCK_SIZE', 32)
+
+
+def test_load_duplicates_across_blocks(small_blocks):
+    n = 50
+    lines = [('w%d %d.5 %d' % (i % 40, i, -i)).encode('utf-8') for i in range(n)]
+    with warnings.catch_warnings(record=True) as w:
+        warnings.simplefilter("always")
+        arr, vocab = glove.load(io.BytesIO(b'\n'.join(lines)))
+    assert len(w) == 10
+    assert all(issubclass(x.category, ParseWarning) for x in w)
+    assert len(vocab) == 40
+    assert_array_equal(arr[:, 1], -np.arange(40, dtype=np.float32))
+
+    f = io.BytesIO(b'\n'.join([b'50 2'] + lines))
+    with warnings.catch_warnings(record=True):
+        warnings.simplefilter("always")
+        arr2, vocab2 = word2vec_text.load(f, max_vocab=30)
+    assert vocab2 == dict((k, v) for k, v in vocab.items() if v < 30)
+    assert_array_equal(arr2, arr[:30])
+
+
+@pytest.mark.parametrize('line', [
+    b'the 0.418 0.24968\n', b'  the 0.418\n', b'the\n', b'the',
+])
+def test_split_token(line):
+    assert _text.split_token(line) == _text.split_lines([line])[0][0]
+
+
+def test_load_with_vocab_skips_other_lines():
+    # Lines of other words are not parsed, thus malformed values are ignored
+    f = io.BytesIO('the 0.418 0.24968\n, x y\nof 1 2 3\n日本語 1 2\n'
+                   .encode('utf-8'))
+    arr = glove.load_with_vocab(f, {'日本語'.encode('utf-8'): 0, b'the': 1})
+    assert_array_equal(arr, np.array([[1, 2], [0.418, 0.24968]],
+                                     dtype=np.float32))
+
+
+@pytest.mark.parametrize('mod', [glove, word2vec_text])
+def test_load_with_vocab_duplicates(small_blocks, mod):
+    # The first occurrence is used, as in load
+    lines = [b'a 1 1', b'b 2 2', b'a 3 3'] * 10
+    if mod is word2vec_text:
+        lines = [b'30 2'] + lines
+    data = b'\n'.join(lines)
+    with warnings.catch_warnings(record=True):
+        warnings.simplefilter("always")
+        arr, vocab = mod.load(io.BytesIO(data))
+    filtered = mod.load_with_vocab(io.BytesIO(data), {b'b': 0, b'a': 1})
+    assert_array_equal(filtered, arr[[vocab[b'b'], vocab[b'a']]])
+    assert_array_equal(filtered, [[2, 2], [1, 1]])
+
+
+def test_scan_offsets(small_blocks):
+    lines = [('w%d %d.5 %d' % (i % 40, i, -i)).encode('utf-8')
+             for i in range(50)]
+    f = io.BytesIO(b'\n'.join(lines))
+    with warnings.catch_warnings(record=True):
+        warnings.simplefilter("always")
+        offsets, vocab, size = glove.scan_offsets(f)
+        f.seek(0)
+        expected, expected_vocab = glove.load(f)
+    assert vocab == expected_vocab
+    assert size == 2
+    assert_array_equal(glove.read_rows_at(f, offsets[[7, 2]], size),
+                       expected[[7, 2]])
+
+    f = io.BytesIO(b'\n'.join([b'50 2'] + lines))
+    offsets, vocab, size = word2vec_text.scan_offsets(f, max_vocab=30)
+    assert len(offsets) == len(vocab) == 30
+    assert_array_equal(
+        word2vec_text.read_rows_at(f, offsets, size, dtype=np.float64),
+        expected[:30])
@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, division, print_function, \
+    unicode_literals
+
+import io
+
+import numpy as np
+import pytest
+from numpy.testing import assert_allclose, assert_array_equal
+
+import word_embedding_loader.loader.wel as wel
+from word_embedding_loader import ParseError, saver
+from word_embedding_loader.arrays import QuantizedVectors
+
+
+EXPECTED = np.array([[0.080054, 0.088388],
+                     [-1.420859, 1.156857],
+                     [-0.16799, 0.10951]], dtype=np.float32)
+
+
+def test_load(wel_file):
+    arr, vocab = wel.load(wel_file)
+    assert vocab == {b'</s>': 0, b'the': 1, '日本語'.encode('utf-8'): 2}
+    assert arr.dtype == np.float32
+    assert_array_equal(arr, EXPECTED)
+
+
+def test_load_dtype(wel_file):
+    arr, vocab = wel.load(wel_file, dtype=np.float64)
+    assert arr.dtype == np.float64
+    assert_array_equal(arr, EXPECTED)
+
+
+@pytest.mark.parametrize('dtype', [np.float32, np.float64])
+def test_load_mmap(wel_file, dtype):
+    arr, vocab = wel.load_mmap(wel_file, dtype=dtype, max_vocab=2)
+    assert len(vocab) == 2
+    assert arr[0].dtype == dtype
+    assert_array_equal(arr[:], EXPECTED[:2])
+
+
+@pytest.mark.parametrize('max_vocab', [None, 2])
+def test_load_mmap_vocab(wel_file, max_vocab):
+    _, vocab = wel.load_mmap(wel_file, max_vocab=max_vocab)
+    if max_vocab is None:
+        # The hash table is mapped from the file
+        assert isinstance(vocab._table, np.memmap)
+    assert vocab[b'the'] == 1
+    assert vocab.word(0) == b'</s>'
+    assert ('日本語'.encode('utf-8') in vocab) == (max_vocab is None)
+
+
+def test_load_without_table(wel_file):
+    # Files without the hash table are still readable
+    data = wel_file.read()
+    key = b'"hash": "crc32", '
+    assert key in data
+    f = io.BytesIO(data.replace(key, b' ' * len(key), 1))
+    assert 'hash' not in wel.read_header(f)
+    f.seek(0)
+    arr, vocab = wel.load(f)
+    assert vocab == {b'</s>': 0, b'the': 1, '日本語'.encode('utf-8'): 2}
+    assert_array_equal(arr, EXPECTED)
+
+
+def test_check_valid(wel_file):
+    assert wel.check_valid(wel_file.readline(), wel_file.readline())
+    assert not wel.check_valid(b"2 4\n", b"the 0.418 0.24968 -0.41242 0.1217")
+
+
+def test_load_with_vocab(wel_file):
+    vocab = dict((
+        (b'</s>', 1),
+        ('日本語'.encode('utf-8'), 0)
+    ))
+    arr = wel.load_with_vocab(wel_file, vocab)
+    assert_array_equal(arr, EXPECTED[[2, 0]])
+    wel_file.seek(0)
+    arr = wel.load_with_vocab_mmap(wel_file, vocab)
+    assert_array_equal(arr[:], EXPECTED[[2, 0]])
+
+    wel_file.seek(0)
+    with pytest.raises(ParseError):
+        wel.load_with_vocab(wel_file, {b'missing': 0})
+
+
+def test_save_order():
+    f = io.BytesIO()
+    saver.wel.save(f, EXPECTED, [(b'b', 2), (b'a', 0)])
+    f.seek(0)
+    header = wel.read_header(f)
+    assert header['vectors_offset'] % wel.ALIGN == 0
+    f.seek(0)
+    arr, vocab = wel.load(f)
+    assert vocab == {b'b': 0, b'a': 1}
+    assert_array_equal(arr, EXPECTED[[2, 0]])
+
+
+@pytest.fixture
+def quantized_file(tmpdir):
+    rs = np.random.RandomState(0)
+    arr = QuantizedVectors.quantize(rs.normal(size=(5, 3)).astype(np.float32))
+    vocab = [(('w%d' % i).encode('utf-8'), i) for i in range(5)]
+    with open(tmpdir.join('quantized.wel').strpath, 'w+b') as f:
+        saver.wel.save(f, arr, vocab)
+        f.flush()
+        f.seek(0)
+        yield f, arr
+
+
+def test_load_quantized(quantized_file):
+    f, expected = quantized_file
+    header = wel.read_header(f)
+    assert header['version'] == wel.QUANTIZED_VERSION
+    assert header['dtype'] == '|u1'
+    f.seek(0)
+    arr, vocab = wel.load(f, max_vocab=4)
+    assert isinstance(arr, QuantizedVectors)
+    assert_array_equal(arr.codes, expected.codes[:4])
+    assert_array_equal(arr[:], expected[:4])
+    assert list(vocab) == [b'w0', b'w1', b'w2', b'w3']
+
+    f.seek(0)
+    arr = wel.load_with_vocab(f, {b'w4': 0, b'w1': 1}, dtype=np.float64)
+    assert arr.dtype == np.float64
+    assert_allclose(arr, expected[[4, 1]], rtol=1e-6)
+
+    f.seek(0)
+    batches = list(wel.iter_rows(f, batch_size=2))
+    assert [len(t) for t, _ in batches] == [2, 2, 1]
+    assert_allclose(np.concatenate([a for _, a in batches]), expected[:])
+
+
+def test_load_quantized_mmap(quantized_file):
+    f, expected = quantized_file
+    arr, vocab = wel.load_mmap(f, max_vocab=3)
+    assert isinstance(arr, QuantizedVectors)
+    assert isinstance(arr.codes.base, np.memmap)
+    assert_array_equal(arr[:], expected[:3])
+    f.seek(0)
+    arr = wel.load_with_vocab_mmap(f, {b'w4': 0, b'w0': 1})
+    assert_array_equal(arr[:], expected[[4, 0]])
@@ -2,9 +2,16 @@
 from __future__ import absolute_import, division, print_function, \
     unicode_literals
 
+import gzip
+import io
+
 import numpy as np
+import pytest
 import word_embedding_loader.loader.word2vec_bin as word2vec
-from numpy.testing import assert_allclose
+from numpy.testing import assert_allclose, assert_array_equal
+
+from word_embedding_loader import ParseError, ParseWarning, saver
+from word_embedding_loader.arrays import MappedVectors
 
 
 def test_load(word2vec_bin_file):
@@ -61,3 +68,260 @@ def test_load_with_vocab(word2vec_bin_file):
                     np.array([-1.67798984, -0.02645044, -0.18966547,
                               1.16504729, -1.39292037], dtype=np.float32),
                     atol=1e-8)
+
+
+def test_load_with_vocab_missing(word2vec_bin_file):
+    with pytest.raises(ParseError):
+        word2vec.load_with_vocab(word2vec_bin_file,
+                                 {b'</s>': 0, b'missing': 1})
+
+
+def test_load_with_vocab_duplicates(tmpdir):
+    expected = np.arange(12, dtype=np.float32).reshape(4, 3)
+    path = tmpdir.join('duplicates.bin').strpath
+    with open(path, 'wb') as f:
+        saver.word2vec_bin.save(
+            f, expected, [(b'a', 0), (b'b', 1), (b'a', 2), (b'c', 3)])
+    with open(path, 'rb') as f:
+        arr = word2vec.load_with_vocab(f, {b'c': 0, b'a': 1})
+    # The first occurrence is used, as in load
+    assert_array_equal(arr, expected[[3, 0]])
+    with open(path, 'rb') as f:
+        with pytest.warns(ParseWarning):
+            loaded, vocab = word2vec.load(f)
+    assert_array_equal(loaded[[vocab[b'c'], vocab[b'a']]], arr)
+    with open(path, 'rb') as f:
+        with pytest.warns(ParseWarning):
+            arr = word2vec.load_with_vocab_mmap(f, {b'c': 0, b'a': 1})
+    assert_array_equal(np.asarray(arr), expected[[3, 0]])
+
+
+@pytest.mark.parametrize('dtype', [np.float32, np.float64])
+def test_load_duplicates(tmpdir, monkeypatch, dtype):
+    # Rows of duplicated words are skipped, as in the text loaders, so that
+    # indices stay consecutive
+    monkeypatch.setattr(word2vec, '_CHUNK_BYTES', 24)
+    expected = np.arange(15, dtype=np.float32).reshape(5, 3)
+    path = tmpdir.join('duplicates.bin').strpath
+    with open(path, 'wb') as f:
+        saver.word2vec_bin.save(
+            f, expected, [(b'a', 0), (b'b', 1), (b'a', 2), (b'c', 3),
+                          (b'b', 4)])
+    with open(path, 'rb') as f:
+        with pytest.warns(ParseWarning):
+            arr, vocab = word2vec.load(f, dtype=dtype)
+    assert vocab == {b'a': 0, b'b': 1, b'c': 2}
+    assert_array_equal(arr, expected[[0, 1, 3]])
+    with open(path, 'rb') as f:
+        with pytest.warns(ParseWarning):
+            arr, vocab = word2vec.load(f, max_vocab=3)
+    assert vocab == {b'a': 0, b'b': 1, b'c': 2}
+
+    with open(path, 'rb') as f:
+        with pytest.warns(ParseWarning):
+            arr, vocab = word2vec.load_mmap(f, dtype=dtype)
+    assert vocab == {b'a': 0, b'b': 1, b'c': 2}
+    assert_array_equal(np.asarray(arr), expected[[0, 1, 3]])
+    with open(path, 'rb') as f:
+        with pytest.warns(ParseWarning):
+            offsets, vocab, size = word2vec.scan_offsets(f)
+    assert len(offsets) == 3 and size == 3
+
+
+@pytest.mark.parametrize('dtype', [np.float16, np.float32, np.float64])
+def test_load_dtype(tmpdir, monkeypatch, dtype):
+    # Convert a few rows at a time
+    monkeypatch.setattr(word2vec, '_CHUNK_BYTES', 24)
+    expected = np.arange(30, dtype=np.float32).reshape(10, 3) / 7
+    path = tmpdir.join('dtype.bin').strpath
+    with open(path, 'wb') as f:
+        saver.word2vec_bin.save(
+            f, expected, [(b'w%d' % i, i) for i in range(10)])
+    with open(path, 'rb') as f:
+        arr, vocab = word2vec.load(f, dtype=dtype)
+    assert arr.dtype == dtype
+    assert len(vocab) == 10
+    assert_array_equal(arr, expected.astype(dtype))
+
+    with open(path, 'rb') as f:
+        arr = word2vec.load_with_vocab(f, {b'w7': 0, b'w2': 1}, dtype=dtype)
+    assert arr.dtype == dtype
+    assert_array_equal(arr, expected[[7, 2]].astype(dtype))
+
+
+def test_load_mmap(word2vec_bin_file):
+    expected, expected_vocab = word2vec.load(word2vec_bin_file)
+    word2vec_bin_file.seek(0)
+    arr, vocab = word2vec.load_mmap(word2vec_bin_file)
+    # Words have different lengths, thus rows are not evenly spaced
+    assert isinstance(arr, MappedVectors)
+    assert arr.shape == (3, 5)
+    assert vocab == expected_vocab
+    assert_array_equal(np.asarray(arr), expected)
+
+
+def test_load_mmap_strided(tmpdir):
+    expected = np.arange(12, dtype=np.float32).reshape(4, 3)
+    path = tmpdir.join('strided.bin').strpath
+    with open(path, 'wb') as f:
+        saver.word2vec_bin.save(
+            f, expected, [(b'w%d' % i, i) for i in range(4)])
+    with open(path, 'rb') as f:
+        arr, vocab = word2vec.load_mmap(f)
+    assert isinstance(arr, np.ndarray)
+    assert not arr.flags.writeable
+    assert_array_equal(arr, expected)
+    assert vocab[b'w2'] == 2
+
+
+def test_load_with_vocab_mmap(word2vec_bin_file):
+    vocab = dict((
+        (b'</s>', 1),
+        ('日本語'.encode('utf-8'), 0)
+    ))
+    expected = word2vec.load_with_vocab(word2vec_bin_file, vocab)
+    word2vec_bin_file.seek(0)
+    arr = word2vec.load_with_vocab_mmap(word2vec_bin_file, vocab)
+    assert_array_equal(arr[:], expected)
+
+
+def test_scan_offsets(word2vec_bin_file):
+    expected, expected_vocab = word2vec.load(word2vec_bin_file)
+    word2vec_bin_file.seek(0)
+    offsets, vocab, size = word2vec.scan_offsets(word2vec_bin_file)
+    assert vocab == expected_vocab
+    assert size == 5
+    arr = word2vec.read_rows_at(word2vec_bin_file, offsets[[2, 0]], size)
+    assert_array_equal(arr, expected[[2, 0]])
+
+
+@pytest.mark.parametrize('block_size', [1 << 20, 7])
+def test_load_words(tmpdir, monkeypatch, block_size):
+    # Words of any length, and with any byte but a space, are read across
+    # blocks
+    monkeypatch.setattr(word2vec, '_BLOCK_SIZE', block_size)
+    expected = np.arange(12, dtype=np.float32).reshape(4, 3)
+    words = [b'a' * 300, b'tab\there', b'\xe6\x97\xa5\x0b', b'b']
+    path = tmpdir.join('words.bin').strpath
+    with open(path, 'wb') as f:
+        saver.word2vec_bin.save(f, expected, [(w, i) for i, w in
+                                               enumerate(words)])
+    with open(path, 'rb') as f:
+        arr, vocab = word2vec.load(f)
+    assert_array_equal(arr, expected)
+    assert list(vocab) == words
+    with open(path, 'rb') as f:
+        arr = word2vec.load_with_vocab(f, {words[2]: 0, words[0]: 1})
+    assert_array_equal(arr, expected[[2, 0]])
+    with open(path, 'rb') as f:
+        batches = list(word2vec.iter_rows(f, batch_size=3))
+    assert [t for tokens, _ in batches for t in tokens] == words
+    with open(path, 'rb') as f:
+        offsets, vocab, size = word2vec.scan_offsets(f)
+    assert list(vocab) == words
+
+
+def test_load_truncated(tmpdir):
+    expected = np.arange(12, dtype=np.float32).reshape(4, 3)
+    path = tmpdir.join('truncated.bin').strpath
+    with open(path, 'wb') as f:
+        saver.word2vec_bin.save(f, expected,
+                                [(b'w%d' % i, i) for i in range(4)])
+    with open(path, 'rb') as f:
+        data = f.read()
+    with open(path, 'wb') as f:
+        # Cut in the middle of the last vector
+        f.write(data[:-5])
+    with open(path, 'rb') as f:
+        with pytest.warns(ParseWarning):
+            arr, vocab = word2vec.load(f)
+    assert_array_equal(arr, expected[:3])
+    assert len(vocab) == 3
+    with open(path, 'rb') as f:
+        with pytest.warns(ParseWarning):
+            batches = list(word2vec.iter_rows(f, batch_size=2))
+    assert sum(len(tokens) for tokens, _ in batches) == 3
+    with open(path, 'rb') as f:
+        with pytest.raises(ParseError):
+            word2vec.load_with_vocab(f, {b'w3': 0})
+
+
+class CountingBytesIO(io.BytesIO):
+    def __init__(self, data):
+        super(CountingBytesIO, self).__init__(data)
+        self.nread = 0
+
+    def readinto(self, b):
+        n = super(CountingBytesIO, self).readinto(b)
+        self.nread += n
+        return n
+
+
+def test_load_with_vocab_seek(monkeypatch):
+    # Rows of other words that do not fit in the buffer are sought past
+    monkeypatch.setattr(word2vec, '_BLOCK_SIZE', 64)
+    expected = np.arange(400, dtype=np.float32).reshape(4, 100)
+    f = io.BytesIO()
+    saver.word2vec_bin.save(f, expected, [(b'w%d' % i, i) for i in range(4)])
+    data = f.getvalue()
+    f = CountingBytesIO(data)
+    arr = word2vec.load_with_vocab(f, {b'w3': 0, b'w1': 1})
+    assert_array_equal(arr, expected[[3, 1]])
+    assert f.nread < len(data) * 3 // 4
+    # Truncated files are still detected
+    with pytest.raises(ParseError):
+        word2vec.load_with_vocab(CountingBytesIO(data[:-500]), {b'w3': 0})
+
+
+def test_load_invalid_header(tmpdir):
+    path = tmpdir.join('header.bin')
+    path.write_binary(b'3\n')
+    with open(path.strpath, 'rb') as f:
+        with pytest.raises(ParseError):
+            word2vec.load(f)
+
+
+class NonSeekable(io.RawIOBase):
+    def __init__(self, data):
+        self._f = io.BytesIO(data)
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        # Return a few bytes at a time like a pipe
+        data = self._f.read(min(len(b), 16))
+        b[:len(data)] = data
+        return len(data)
+
+
+def test_load_stream(word2vec_bin_file, tmpdir):
+    expected, expected_vocab = word2vec.load(word2vec_bin_file)
+    word2vec_bin_file.seek(0)
+    data = word2vec_bin_file.read()
+    path = tmpdir.join('word2vec.bin.gz').strpath
+    with gzip.open(path, 'wb') as f:
+        f.write(data)
+
+    sources = [io.BytesIO(data), data, memoryview(data),
+               io.BufferedReader(NonSeekable(data))]
+    with gzip.open(path, 'rb') as f:
+        sources.append(f)
+        for fin in sources:
+            arr, vocab = word2vec.load(fin)
+            assert_array_equal(arr, expected)
+            assert vocab == expected_vocab
+    arr = word2vec.load_with_vocab(io.BytesIO(data), {b'the': 0})
+    assert_array_equal(arr, expected[[1]])
+    batches = list(word2vec.iter_rows(data, batch_size=2))
+    assert_array_equal(np.concatenate([b for _, b in batches]), expected)
+
+
+def test_load_position(word2vec_bin_file):
+    # The file object is left right after the last vector read, even though
+    # the file is read in blocks
+    arr, vocab = word2vec.load(word2vec_bin_file, max_vocab=2)
+    pos = word2vec_bin_file.tell()
+    word2vec_bin_file.seek(0)
+    data = word2vec_bin_file.read()
+    assert pos == data.index(b'\xe6\x97\xa5') - 1
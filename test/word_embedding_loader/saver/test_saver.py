@@ -2,6 +2,9 @@
 from __future__ import absolute_import, division, print_function, \
     unicode_literals
 
+import gzip
+import io
+
 import numpy as np
 import pytest
 from numpy.testing import assert_array_equal
@@ -28,7 +31,8 @@ def word_embedding_data():
 @pytest.mark.parametrize("mod", [
     (saver.glove, 'glove', False),
     (saver.word2vec_bin, 'word2vec', True),
-    (saver.word2vec_text, 'word2vec', False)
+    (saver.word2vec_text, 'word2vec', False),
+    (saver.wel, 'wel', False)
 ])
 def test_save(word_embedding_data, mod, tmpdir):
     _saver, wtype, binary = mod
@@ -44,3 +48,104 @@ def test_save(word_embedding_data, mod, tmpdir):
 
     assert_array_equal(arr, arr_input)
     assert vocab_expected == vocab
+
+
+@pytest.mark.parametrize("mod", [
+    (saver.glove, 'glove', False),
+    (saver.word2vec_bin, 'word2vec', True),
+    (saver.word2vec_text, 'word2vec', False),
+    (saver.wel, 'wel', False)
+])
+def test_save_rows(word_embedding_data, mod, tmpdir):
+    _saver, wtype, binary = mod
+    arr_input, vocab_input, vocab_expected = word_embedding_data
+    batches = [([b'</s>', b'the'], arr_input[:2]),
+               (['日本語'.encode('utf-8')], arr_input[2:])]
+
+    with open(tmpdir.join('output.txt').strpath, 'a+b') as f:
+        _saver.save_rows(f, iter(batches), 3, 4)
+        f.seek(0)
+        obj = word_embedding.WordEmbedding.load(
+            f.name, dtype=np.float32, format=wtype, binary=binary)
+
+    assert_array_equal(obj.vectors, arr_input)
+    assert vocab_expected == obj.vocab
+
+
+@pytest.mark.parametrize("_saver", [
+    saver.word2vec_bin, saver.word2vec_text, saver.wel])
+def test_save_rows_fail(word_embedding_data, _saver, tmpdir):
+    arr_input, vocab_input, vocab_expected = word_embedding_data
+    with open(tmpdir.join('output.txt').strpath, 'wb') as f:
+        with pytest.raises(ValueError):
+            _saver.save_rows(f, [([b'</s>'], arr_input[:1])], 3, 4)
+
+
+@pytest.mark.parametrize("mod", [
+    (saver.glove, 'glove'),
+    (saver.word2vec_text, 'word2vec'),
+])
+def test_save_precision(word_embedding_data, mod, tmpdir):
+    _saver, wtype = mod
+    arr_input, vocab_input, vocab_expected = word_embedding_data
+
+    with open(tmpdir.join('output.txt').strpath, 'a+b') as f:
+        _saver.save(f, arr_input, vocab_input, precision=3)
+        f.seek(0)
+        assert b'0.418 0.250 -0.412 0.122' in f.read()
+        obj = word_embedding.WordEmbedding.load(f.name, format=wtype)
+
+    assert_array_equal(obj.vectors, np.round(arr_input, 3))
+    assert vocab_expected == obj.vocab
+
+
+def test_vocab_pairs():
+    from word_embedding_loader.saver._rows import vocab_pairs
+    vocab = {b'a': 0, b'b': 1, b'c': 2}
+    assert list(vocab_pairs(vocab)) == [(b'a', 0), (b'b', 1), (b'c', 2)]
+
+    vocab = dict([(b'c', 2), (b'a', 0), (b'b', 1)])
+    assert list(vocab_pairs(vocab)) == [(b'a', 0), (b'b', 1), (b'c', 2)]
+
+    freqs = {b'a': 5, b'b': 10, b'c': 5}
+    assert list(vocab_pairs(vocab, freqs)) == [(b'b', 1), (b'c', 2), (b'a', 0)]
+
+
+def test_iter_batches_vocabulary():
+    from word_embedding_loader.saver._rows import iter_batches, vocab_pairs
+    words = [('w%d' % i).encode('utf-8') for i in range(10)]
+    vocab = word_embedding.Vocabulary.from_words(words)
+    arr = np.arange(20, dtype=np.float32).reshape(10, 2)
+    # Words and rows of a Vocabulary are sliced in the order of indices
+    batches = list(iter_batches(arr, vocab_pairs(vocab), 4))
+    assert [b for b, _ in batches] == [words[:4], words[4:8], words[8:]]
+    assert_array_equal(np.concatenate([r for _, r in batches]), arr)
+    assert vocab.words(8) == words[8:]
+    assert vocab.words(-3, -1) == words[7:9]
+    assert vocab.words(5, 2) == []
+
+
+@pytest.mark.parametrize("mod", [
+    (saver.glove, 'glove', False),
+    (saver.word2vec_bin, 'word2vec', True),
+    (saver.word2vec_text, 'word2vec', False),
+    (saver.wel, 'wel', False)
+])
+def test_save_stream(word_embedding_data, mod, tmpdir):
+    # Savers only write to the file object
+    _saver, wtype, binary = mod
+    arr_input, vocab_input, vocab_expected = word_embedding_data
+    path = tmpdir.join('output.gz').strpath
+    with gzip.open(path, 'wb') as f:
+        _saver.save(f, arr_input, vocab_input)
+    with gzip.open(path, 'rb') as f:
+        data = f.read()
+
+    f = io.BytesIO()
+    _saver.save(f, arr_input, vocab_input)
+    assert f.getvalue() == data
+
+    obj = word_embedding.WordEmbedding.load(
+        io.BytesIO(data), format=wtype, binary=binary)
+    assert_array_equal(obj.vectors, arr_input)
+    assert vocab_expected == obj.vocab
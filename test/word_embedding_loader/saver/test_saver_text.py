@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, division, print_function, \
+    unicode_literals
+
+import numpy as np
+import pytest
+import six
+
+import word_embedding_loader.saver._text as _text
+
+
+@pytest.fixture
+def values():
+    rng = np.random.RandomState(0)
+    arr = rng.randn(20, 7) * np.exp(rng.randn(20, 7) * 4)
+    arr[0, :5] = [0., -0., -1e-9, 123456.789, 0.5]
+    return arr
+
+
+@pytest.mark.parametrize('dtype', [np.float32, np.float64])
+@pytest.mark.parametrize('precision', [0, 1, 4, 9])
+def test_format_rows(values, dtype, precision):
+    arr = values.astype(dtype)
+    fmt = ' '.join(['%.{}f'.format(precision)] * arr.shape[1])
+    expected = [(fmt % tuple(v)).encode('ascii') for v in arr.tolist()]
+    assert _text.format_rows(arr, precision) == expected
+
+
+@pytest.mark.parametrize('precision', [1, 3, 4, 6])
+def test_format_rows_ties(precision):
+    # Decimal ties such as 0.12345 are not exact in float64; their side of
+    # the tie must not change when they are scaled
+    rng = np.random.RandomState(0)
+    digits = rng.randint(0, 10 ** (precision + 2), size=(50, 8)) * 10 + 5
+    arr = np.concatenate([[[0.12345, 0.9235, 2.675, 1.005, 0.125, 0.375,
+                            -0.5, 2.5]],
+                          digits / 10.0 ** (precision + 1)])
+    fmt = ' '.join(['%.{}f'.format(precision)] * arr.shape[1])
+    expected = [(fmt % tuple(v)).encode('ascii') for v in arr.tolist()]
+    assert _text.format_rows(arr, precision) == expected
+    assert _text.format_rows(np.array([[0.12345]]), 4) == [b'0.1235']
+    assert _text.format_rows(np.array([[0.9235]]), 3) == [b'0.923']
+
+
+def test_format_rows_fallback(values):
+    # Values that are not finite or too large are formatted by Python
+    values[3, 2] = np.nan
+    values[4, 1] = 1e30
+    fmt = ' '.join(['%.2f'] * values.shape[1])
+    expected = [(fmt % tuple(v)).encode('ascii') for v in values.tolist()]
+    assert _text.format_rows(values, 2) == expected
+
+
+def test_format_rows_shortest(values):
+    arr = values.astype(np.float32)
+    expected = [b' '.join(six.text_type(v).encode('utf-8') for v in vec)
+                for vec in arr]
+    assert _text.format_rows(arr) == expected
+
+
+def test_format_lines():
+    arr = np.array([[1.5, -2.], [0.25, 3.]], dtype=np.float32)
+    assert _text.format_lines([b'a', b'b'], arr, 2) == \
+        b'a 1.50 -2.00\nb 0.25 3.00'
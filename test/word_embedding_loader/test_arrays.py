@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, division, print_function, \
+    unicode_literals
+
+import numpy as np
+import pytest
+from numpy.testing import assert_allclose, assert_array_equal
+
+from word_embedding_loader import arrays
+
+
+@pytest.fixture
+def mapped():
+    expected = np.arange(15, dtype=np.float32).reshape(5, 3)
+    # Rows are separated by a varying amount of padding
+    buf = b''
+    offsets = []
+    for i, row in enumerate(expected):
+        buf += b'x' * (i + 1)
+        offsets.append(len(buf))
+        buf += row.tobytes()
+    buf = np.frombuffer(buf, dtype=np.uint8)
+    return arrays.map_rows(buf, offsets, 3), expected
+
+
+def test_mapped_vectors(mapped):
+    arr, expected = mapped
+    assert isinstance(arr, arrays.MappedVectors)
+    assert arr.shape == (5, 3)
+    assert len(arr) == 5
+    assert_array_equal(arr[1], expected[1])
+    assert_array_equal(arr[-1], expected[-1])
+    assert_array_equal(arr[1:4], expected[1:4])
+    assert_array_equal(arr[[4, 0]], expected[[4, 0]])
+    assert_array_equal(arr[np.array([[1], [2]])], expected[np.array([[1], [2]])])
+    assert_array_equal(arr[2, 1:], expected[2, 1:])
+    assert_array_equal(np.asarray(arr), expected)
+    with pytest.raises(IndexError):
+        arr[5]
+
+
+def test_mapped_vectors_dtype(mapped):
+    arr, expected = mapped
+    arr = arrays.MappedVectors(arr._buf, arr.offsets, 3, dtype=np.float64)
+    assert arr[0].dtype == np.float64
+    assert_array_equal(arr[:], expected)
+
+
+def test_map_rows_strided():
+    expected = np.arange(15, dtype=np.float32).reshape(5, 3)
+    buf = np.frombuffer(b'abc' + expected.tobytes(), dtype=np.uint8)
+    arr = arrays.map_rows(buf, 3 + 12 * np.arange(5), 3)
+    assert isinstance(arr, np.ndarray)
+    assert_array_equal(arr, expected)
+
+
+def test_quantize_rows():
+    arr = np.array([[-1, 0, 1.5], [2, 2, 2]], dtype=np.float32)
+    codes, scale, offset = arrays.quantize_rows(arr)
+    assert codes.dtype == np.uint8
+    assert codes.tolist() == [[0, 102, 255], [0, 0, 0]]
+    assert_allclose(scale, [2.5 / 255, 1])
+    assert_array_equal(offset, [-1, 2])
+
+
+@pytest.mark.parametrize('per_row', [True, False])
+def test_quantized_vectors(per_row):
+    rs = np.random.RandomState(0)
+    expected = (rs.normal(size=(50, 8)) * np.arange(1, 51)[:, None]).astype(
+        np.float32)
+    arr = arrays.QuantizedVectors.quantize(expected, per_row=per_row)
+    assert arr.shape == (50, 8)
+    assert arr.dtype == np.float32
+    assert arr.nbytes == 50 * 8 + 2 * 50 * 4
+    # Errors are at most half a step of each row
+    step = arr.scale[:, None]
+    assert (np.abs(arr[:] - expected) <= step / 2 + 1e-5).all()
+    assert_array_equal(arr[[3, 1]], arr[:][[3, 1]])
+    selected = arr.select(slice(10, 20))
+    assert isinstance(selected, arrays.QuantizedVectors)
+    assert np.shares_memory(selected.codes, arr.codes)
+    assert_array_equal(selected[:], arr[10:20])
+
+
+def test_lazy_vectors(tmpdir):
+    expected = np.arange(20, dtype=np.float32).reshape(10, 2)
+    path = tmpdir.join('rows.bin').strpath
+    expected.tofile(path)
+    reads = []
+
+    def read_rows(fin, offsets, size, dtype):
+        reads.append(offsets.tolist())
+        return np.stack([expected[o // 8] for o in offsets.tolist()]).astype(
+            dtype)
+
+    arr = arrays.LazyVectors(path, 8 * np.arange(10), 2, read_rows,
+                             dtype=np.float64, cache_rows=3)
+    assert arr.shape == (10, 2)
+    assert_array_equal(arr[[5, 1, 5]], expected[[5, 1, 5]])
+    # Duplicates are read once, in the order of the file
+    assert reads == [[8, 40]]
+    assert arr[1].dtype == np.float64
+    assert len(reads) == 1
+    assert_array_equal(arr[[2, 3]], expected[[2, 3]])
+    # 5 was the least recently used row
+    assert_array_equal(arr[5], expected[5])
+    assert reads[-1] == [40]
+    assert_array_equal(np.asarray(arr), expected)
+    assert len(arr._cache) == 3
+    arr.close()
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, division, print_function, \
+    unicode_literals
+
+import json
+
+import numpy as np
+import pytest
+from numpy.testing import assert_array_equal
+
+from word_embedding_loader import bench
+from word_embedding_loader.word_embedding import WordEmbedding
+
+
+@pytest.mark.parametrize('fmt', list(bench.FORMATS))
+def test_generate(fmt, tmpdir):
+    path = tmpdir.join('generated').strpath
+    bench.generate(path, fmt, 25, 3)
+    obj = WordEmbedding.load(path)
+    assert obj._load_cond.format == bench.FORMATS[fmt][0]
+    assert obj._load_cond.binary == bench.FORMATS[fmt][1]
+    assert obj.vectors.shape == (25, 3)
+    assert list(obj.vocab)[:2] == [b'w0', b'w1']
+
+
+def test_run_case(tmpdir):
+    cases = bench.make_cases([30], [4])
+    assert len(cases) == len(bench.FORMATS) * len(bench.OPERATIONS)
+    workdir = tmpdir.strpath
+    bench._prepare(cases, workdir)
+    for case in cases:
+        result = bench.run_case(case, workdir)
+        assert result['seconds'] >= 0
+        assert result['bytes'] > 0
+    # Output files are removed
+    assert not tmpdir.join('out').exists()
+
+
+def test_run(tmpdir):
+    cases = bench.make_cases([30], [4], formats=['wel'],
+                             operations=['load', 'convert'])
+    logged = []
+    results = bench.run(cases, workdir=tmpdir.strpath, repeat=2,
+                        log=logged.append)
+    assert [r['operation'] for r in results['results']] == ['load', 'convert']
+    assert results['results'][1]['to_format'] == 'word2vec-binary'
+    assert logged == results['results']
+    for r in results['results']:
+        assert len(r['times']) == 2
+        assert r['seconds'] == min(r['times'])
+        assert r['rows_per_second'] > 0
+    # Results are serializable and can be compared
+    baseline = json.loads(json.dumps(results))
+    rows = bench.compare(results, baseline)
+    assert [row[0] for row in rows] == ['load wel 30x4',
+                                        'convert wel->word2vec-binary 30x4']
+    assert_array_equal([row[3] for row in rows], np.ones(2))
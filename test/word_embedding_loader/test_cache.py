@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, division, print_function, \
+    unicode_literals
+
+import os
+
+import numpy as np
+import pytest
+from numpy.testing import assert_array_equal
+
+from word_embedding_loader import cache, word_embedding
+
+
+def _load(path, cache_dir, **kwargs):
+    return word_embedding.WordEmbedding.load(path, cache_dir=cache_dir,
+                                             **kwargs)
+
+
+@pytest.mark.parametrize('mmap', [False, True])
+def test_load_cached(glove_file, tmpdir, mmap):
+    cache_dir = tmpdir.join('cache').strpath
+    expected = word_embedding.WordEmbedding.load(glove_file.name)
+
+    obj = _load(glove_file.name, cache_dir, mmap=mmap)
+    assert len(cache.LoadCache(cache_dir).entries()) == 1
+    obj2 = _load(glove_file.name, cache_dir, mmap=mmap)
+    for o in (obj, obj2):
+        assert o._load_cond == word_embedding._glove
+        assert o.vocab == expected.vocab
+        assert_array_equal(o.vectors[:], expected.vectors)
+
+    # Different arguments are cached separately
+    obj3 = _load(glove_file.name, cache_dir, max_vocab=2, dtype=np.float64)
+    assert obj3.vectors.dtype == np.float64
+    assert len(obj3) == 2
+    assert len(cache.LoadCache(cache_dir).entries()) == 2
+
+
+def test_load_cached_bytes_path(glove_file, tmpdir):
+    cache_dir = tmpdir.join('cache').strpath
+    obj = _load(glove_file.name.encode('utf-8'), cache_dir)
+    assert len(obj) == 3
+    # Same entry as the path given as str
+    _load(glove_file.name, cache_dir)
+    assert len(cache.LoadCache(cache_dir).entries()) == 1
+
+
+def test_load_cached_hit(glove_file, tmpdir, monkeypatch):
+    cache_dir = tmpdir.join('cache').strpath
+    _load(glove_file.name, cache_dir)
+
+    def fail(*args, **kwargs):
+        raise AssertionError('Should not parse')
+    monkeypatch.setattr(word_embedding.loader.glove, 'load', fail)
+    obj = _load(glove_file.name, cache_dir)
+    assert len(obj) == 3
+
+
+def test_load_cached_vocab(word2vec_text_file, vocab_file, tmpdir):
+    cache_dir = tmpdir.join('cache').strpath
+    expected = word_embedding.WordEmbedding.load(
+        word2vec_text_file.name, vocab=vocab_file.name)
+    _load(word2vec_text_file.name, cache_dir, vocab=vocab_file.name)
+    obj = _load(word2vec_text_file.name, cache_dir, vocab=vocab_file.name)
+    assert obj.vocab == expected.vocab
+    assert obj.freqs == expected.freqs
+    assert_array_equal(obj.vectors, expected.vectors)
+
+
+def test_load_cached_invalidate(glove_file, tmpdir):
+    cache_dir = tmpdir.join('cache').strpath
+    _load(glove_file.name, cache_dir)
+    glove_file.seek(0, 2)
+    glove_file.write('\nnew 0.1 0.2 0.3 0.4'.encode('utf-8'))
+    glove_file.flush()
+    obj = _load(glove_file.name, cache_dir)
+    assert len(obj) == 4
+
+
+def test_evict(tmpdir):
+    c = cache.LoadCache(tmpdir.strpath)
+    arr = np.zeros((10, 10), dtype=np.float32)
+    vocab = dict((str(i).encode('utf-8'), i) for i in range(10))
+    paths = [c.put(k, arr, vocab) for k in ('a', 'b', 'c')]
+    # Make 'a' the most recently used
+    for t, path in zip((3, 1, 2), paths):
+        os.utime(path, (t, t))
+    c.max_bytes = os.path.getsize(paths[0]) * 2
+    c.evict()
+    assert c.get('a') == paths[0]
+    assert c.get('b') is None
+    assert c.get('c') == paths[2]
+
+
+@pytest.mark.skipif(cache.fcntl is None, reason='requires fcntl')
+def test_evict_locked(tmpdir):
+    c = cache.LoadCache(tmpdir.strpath)
+    arr = np.zeros((10, 10), dtype=np.float32)
+    vocab = dict((str(i).encode('utf-8'), i) for i in range(10))
+    paths = []
+    for t, k in enumerate(('a', 'b', 'c')):
+        with c.lock(k):
+            paths.append(c.put(k, arr, vocab))
+        os.utime(paths[-1], (t, t))
+    c.max_bytes = os.path.getsize(paths[0]) * 2
+    # 'a' is being read, so the next least recently used entry is removed
+    with c.lock('a', shared=True):
+        c.evict()
+        assert c.get('a') == paths[0]
+    assert c.get('b') is None
+    # The lock file is removed with its entry
+    assert sorted(os.listdir(tmpdir.strpath)) == \
+        ['a.lock', 'a.wel', 'c.lock', 'c.wel']
+    c.max_bytes //= 2
+    c.evict(keep=paths[0])
+    assert sorted(os.listdir(tmpdir.strpath)) == ['a.lock', 'a.wel']
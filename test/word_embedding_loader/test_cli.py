@@ -4,8 +4,10 @@ from __future__ import absolute_import, division, print_function
 
 import pytest
 from click.testing import CliRunner
+from numpy.testing import assert_allclose
 
 from word_embedding_loader import cli
+from word_embedding_loader.word_embedding import WordEmbedding
 
 
 def test_cli_list():
@@ -22,25 +24,112 @@ def test_cli_check_format(word2vec_bin_file_path):
     assert 'word2vec' in result.output
 
 
-@pytest.fixture(params=[
+def test_cli_check_format_sniff(word2vec_bin_file_path):
+    runner = CliRunner()
+    result = runner.invoke(cli.cli, ['check_format', '--sniff',
+                                     word2vec_bin_file_path])
+    assert result.exit_code == 0
+    assert 'word2vec-binary' in result.output
+    assert 'words: 3\nsize: 5\ndtype: float32\n' in result.output
+
+    with open(word2vec_bin_file_path, 'rb') as f:
+        data = f.read()
+    # Read from stdin
+    result = runner.invoke(cli.cli, ['check_format', '--sniff', '-'],
+                           input=data)
+    assert result.exit_code == 0
+    assert 'words: 3' in result.output
+
+
+@pytest.mark.parametrize('params', [
     ['--to-format', 'glove'],
-    ['--from-format', 'word2vec-binary'],
+    ['--to-format', 'word2vec', '--from-format', 'word2vec-binary'],
+    ['--to-format', 'word2vec-binary', '--max-vocab', '2'],
+    ['--to-format', 'wel', '--dtype', 'float64'],
+    ['--to-format', 'word2vec-text', '--precision', '8'],
     ])
 def test_cli_check_convert(params, word2vec_bin_file_path, tmpdir):
     p = tmpdir.mkdir("test_cli_check_convert").join("out.txt")
-    params = ['convert'] + params + [word2vec_bin_file_path, p.basename]
+    params = ['convert'] + params + [word2vec_bin_file_path, p.strpath]
     runner = CliRunner()
     result = runner.invoke(cli.cli, params)
     assert result.exit_code == 0
+    expected = WordEmbedding.load(word2vec_bin_file_path)
+    obj = WordEmbedding.load(p.strpath)
+    n = 2 if '--max-vocab' in params else 3
+    assert len(obj) == n
+    for word, idx in obj.vocab.items():
+        assert_allclose(obj.vectors[idx],
+                        expected.vectors[expected.vocab[word]], rtol=1e-6)
 
 
-@pytest.fixture(params=[
+@pytest.mark.parametrize('params', [
     ['--to-format', 'glove-bin'],
-    ['--from-format', 'glove-bin'],
+    ['--to-format', 'glove', '--from-format', 'glove-bin'],
     ])
 def test_cli_check_convert_fail(params, word2vec_bin_file_path, tmpdir):
     p = tmpdir.mkdir("test_cli_check_convert").join("out.txt")
-    params = ['convert'] + params + [word2vec_bin_file_path, p.basename]
+    params = ['convert'] + params + [word2vec_bin_file_path, p.strpath]
     runner = CliRunner()
     result = runner.invoke(cli.cli, params)
     assert result.exit_code != 0
+
+
+def test_cli_analogy(tmpdir):
+    emb = tmpdir.join('emb.txt')
+    emb.write_binary(b'man 1 0 0\nwoman 1 1 0\nking 1 0 1\nqueen 1 1 1\n')
+    questions = tmpdir.join('questions.txt')
+    questions.write_binary(b': royalty\nman king woman queen\n'
+                           b'man king woman apple\n')
+    runner = CliRunner()
+    result = runner.invoke(cli.cli, ['analogy', '--method', '3cosmul',
+                                     emb.strpath, questions.strpath])
+    assert result.exit_code == 0, result.output
+    assert 'royalty: 100.00% (1/1)' in result.output
+    assert '1 skipped' in result.output
+    assert 'queries/s' in result.output
+
+
+def test_cli_convert_quantize(word2vec_bin_file_path, tmpdir):
+    p = tmpdir.join("out.wel")
+    runner = CliRunner()
+    result = runner.invoke(cli.cli, ['convert', '-t', 'wel', '--quantize',
+                                     word2vec_bin_file_path, p.strpath])
+    assert result.exit_code == 0
+    obj = WordEmbedding.load(p.strpath)
+    assert obj.vectors.codes.shape == (3, 5)
+
+
+def test_cli_convert_progress_stats(word2vec_bin_file_path, tmpdir):
+    p = tmpdir.join("out.txt")
+    runner = CliRunner()
+    result = runner.invoke(cli.cli, ['convert', '-t', 'glove', '--progress',
+                                     '--stats', word2vec_bin_file_path,
+                                     p.strpath])
+    assert result.exit_code == 0, result.output
+    assert 'convert' in result.output
+    assert 'word2vec_bin' in result.output
+    assert len(WordEmbedding.load(p.strpath)) == 3
+
+
+def test_cli_convert_compressed(word2vec_bin_file_path, tmpdir):
+    gz = tmpdir.join("out.bin.gz")
+    runner = CliRunner()
+    result = runner.invoke(cli.cli, ['convert', '-t', 'word2vec-binary',
+                                     word2vec_bin_file_path, gz.strpath])
+    assert result.exit_code == 0, result.output
+    result = runner.invoke(cli.cli, ['check_format', '--sniff', gz.strpath])
+    assert result.exit_code == 0, result.output
+    assert 'word2vec-binary' in result.output
+    assert 'compression: gzip' in result.output
+
+    p = tmpdir.join("out.txt")
+    result = runner.invoke(cli.cli, ['convert', '-t', 'glove', '--progress',
+                                     '--decompress-thread',
+                                     '--compression', 'bz2',
+                                     gz.strpath, p.strpath])
+    assert result.exit_code == 0, result.output
+    assert '3 rows' in result.output
+    with open(p.strpath, 'rb') as f:
+        assert f.read(3) == b'BZh'
+    assert len(WordEmbedding.load(p.strpath)) == 3
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, division, print_function, \
+    unicode_literals
+
+import bz2
+import gzip
+import io
+import zipfile
+
+import pytest
+
+from word_embedding_loader import compression
+
+
+NAMES = [n for n in compression.MAGIC if compression.available(n)]
+
+DATA = b''.join(b'word%d 0.%d 1.%d\n' % (i, i, i) for i in range(20000))
+
+
+class NonSeekable(io.RawIOBase):
+    def __init__(self, data):
+        self._f = io.BytesIO(data)
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        return self._f.readinto(b)
+
+
+def compress(data, name):
+    f = io.BytesIO()
+    with compression.open_compressed(f, name, member='a.txt') as out:
+        out.write(data)
+    return f.getvalue()
+
+
+def decompress(data, name, **kwargs):
+    with compression.open_decompressed(io.BytesIO(data), name,
+                                       **kwargs) as f:
+        return f.read()
+
+
+def test_detect():
+    for name in NAMES:
+        assert compression.detect(compress(b'abc', name)) == name
+    assert compression.detect(b'abc 0.1 0.2\n') is None
+    assert compression.detect(b'') is None
+    # Text files whose first word begins with the magic number of bzip2
+    assert compression.detect(b'BZh 0.1 0.2\n') is None
+    assert compression.detect(b'BZh9 0.1 0.2\n') is None
+    assert compression.detect(b'BZh91AY&SY') == 'bz2'
+    assert compression.detect(bz2.compress(b'')) == 'bz2'
+
+
+@pytest.mark.parametrize('name', [n for n in NAMES if n != 'zip'])
+def test_bounded_chunks(name):
+    # Highly compressed blocks are decompressed a block at a time
+    data = compress(b'\x00' * (8 << 20), name)
+    chunks = compression._iter_decompressed(io.BytesIO(data), name, 1 << 16)
+    n = 0
+    for chunk in chunks:
+        assert len(chunk) <= 1 << 16
+        n += len(chunk)
+    assert n == 8 << 20
+
+
+def test_infer():
+    assert compression.infer('a/b.txt.gz') == 'gzip'
+    assert compression.infer('b.BZ2') == 'bz2'
+    assert compression.infer('b.bin.zst') == 'zstd'
+    assert compression.infer('b.txt') is None
+    assert compression.member_name('a/vectors.txt.zip') == 'vectors.txt'
+    assert compression.member_name('a/vectors.gz') == 'vectors.gz'
+
+
+@pytest.mark.parametrize('name', NAMES)
+@pytest.mark.parametrize('thread', [False, True])
+def test_roundtrip(name, thread):
+    data = compress(DATA, name)
+    assert len(data) < len(DATA)
+    assert decompress(data, name, thread=thread) == DATA
+    # Small blocks
+    assert decompress(data, name, thread=thread, block_size=1000) == DATA
+
+
+def test_stdlib():
+    assert decompress(gzip.compress(DATA), 'gzip') == DATA
+    assert decompress(bz2.compress(DATA), 'bz2') == DATA
+    assert gzip.decompress(compress(DATA, 'gzip')) == DATA
+    assert bz2.decompress(compress(DATA, 'bz2')) == DATA
+
+
+@pytest.mark.parametrize('name', ['gzip', 'bz2'])
+def test_multistream(name):
+    # e.g. pigz and pbzip2, or concatenated files
+    data = compress(DATA[:1000], name) + compress(DATA[1000:], name)
+    assert decompress(data, name, block_size=100) == DATA
+    if name == 'gzip':
+        assert decompress(data + b'\x00' * 10, name) == DATA
+
+
+@pytest.mark.parametrize('name', [n for n in NAMES if n != 'zip'])
+def test_truncated(name):
+    data = compress(DATA, name)
+    with pytest.raises(EOFError):
+        decompress(data[:len(data) // 2], name)
+    with pytest.raises(EOFError):
+        decompress(data[:len(data) // 2], name, thread=True)
+
+
+def test_zip():
+    data = compress(DATA, 'zip')
+    with zipfile.ZipFile(io.BytesIO(data)) as z:
+        assert z.namelist() == ['a.txt']
+    # The archive is spooled
+    with compression.open_decompressed(
+            io.BufferedReader(NonSeekable(data)), 'zip') as f:
+        assert f.read() == DATA
+
+    f = io.BytesIO()
+    with zipfile.ZipFile(f, 'w') as z:
+        z.writestr('a.txt', b'a')
+        z.writestr('b.txt', b'b')
+    with pytest.raises(ValueError):
+        decompress(f.getvalue(), 'zip')
+
+
+def test_unavailable(monkeypatch):
+    monkeypatch.setattr(compression, 'zstandard', None)
+    assert not compression.available('zstd')
+    with pytest.raises(ValueError):
+        decompress(b'\x28\xb5\x2f\xfd', 'zstd')
+    with pytest.raises(ValueError):
+        compress(b'', 'zstd')
+    with pytest.raises(ValueError):
+        compress(b'', 'rar')
+
+
+def test_thread_close():
+    # The thread stops when the file is closed before its end
+    data = compress(DATA * 10, 'gzip')
+    with compression.open_decompressed(io.BytesIO(data), 'gzip', thread=True,
+                                       block_size=100) as f:
+        assert f.read(10) == DATA[:10]
+        prefetcher = f.raw._chunks
+    assert not prefetcher._thread.is_alive()
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, division, print_function, \
+    unicode_literals
+
+import io
+
+import numpy as np
+import pytest
+
+from word_embedding_loader import ParseWarning, evaluation
+from word_embedding_loader.word_embedding import WordEmbedding
+
+
+QUESTIONS = b""": royalty
+man king woman queen
+Man King Woman Queen
+woman queen man king
+: misc
+man king woman apple
+man king woman unknown
+broken line
+"""
+
+
+@pytest.fixture
+def embedding():
+    vecs = {b'man': [1, 0, 0], b'woman': [1, 1, 0], b'king': [1, 0, 1],
+            b'queen': [1, 1, 1], b'apple': [0, 0, -1]}
+    return WordEmbedding(np.array(list(vecs.values()), dtype=np.float32),
+                         {w: i for i, w in enumerate(vecs)})
+
+
+def test_read_analogies():
+    with pytest.warns(ParseWarning):
+        questions = evaluation.read_analogies(io.BytesIO(QUESTIONS))
+    assert len(questions) == 5
+    assert questions[0] == (b'royalty', b'man', b'king', b'woman', b'queen')
+    assert questions[1][1] == b'Man'
+    assert questions[-1][0] == b'misc'
+    with pytest.warns(ParseWarning):
+        questions = evaluation.read_analogies(io.BytesIO(QUESTIONS),
+                                              lower=True)
+    assert questions[1] == questions[0]
+
+
+def test_evaluate_analogy(embedding, tmpdir):
+    path = tmpdir.join('questions.txt')
+    path.write_binary(QUESTIONS)
+    with pytest.warns(ParseWarning):
+        result = evaluation.evaluate_analogy(embedding, path.strpath,
+                                             lower=True)
+    assert result['total'] == 4
+    assert result['skipped'] == 1
+    assert result['correct'] == 3
+    assert result['accuracy'] == 0.75
+    assert result['queries_per_second'] > 0
+    assert list(result['sections']) == [b'royalty', b'misc']
+    assert result['sections'][b'royalty'] == {
+        'correct': 3, 'total': 3, 'accuracy': 1.0}
+
+    # Questions with words outside the first 4 words are skipped
+    with pytest.warns(ParseWarning):
+        questions = evaluation.read_analogies(io.BytesIO(QUESTIONS))
+    result = evaluation.evaluate_analogy(embedding, questions,
+                                         restrict_vocab=4, method='3cosmul')
+    assert (result['correct'], result['total']) == (2, 2)
+
+    result = evaluation.evaluate_analogy(embedding, [])
+    assert result['total'] == 0
+    assert result['accuracy'] == 0.0
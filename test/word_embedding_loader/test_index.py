@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, division, print_function, \
+    unicode_literals
+
+import numpy as np
+import pytest
+from numpy.testing import assert_allclose, assert_array_equal
+
+from word_embedding_loader import ParseError, similarity
+from word_embedding_loader.index import IVFIndex, kmeans
+
+
+@pytest.fixture(scope='module')
+def data():
+    # Clustered vectors
+    rs = np.random.RandomState(0)
+    centers = rs.normal(size=(8, 16)) * 4
+    vectors = centers[rs.randint(0, 8, 400)] + rs.normal(size=(400, 16))
+    return vectors.astype(np.float32), rs.normal(size=(20, 16))
+
+
+def test_kmeans():
+    data = np.array([[0, 0], [0, 1], [10, 10], [10, 11]], dtype=np.float32)
+    centroids = kmeans(data, 2, random_state=0)
+    assert_allclose(sorted(centroids.tolist()), [[0, 0.5], [10, 10.5]])
+
+
+@pytest.mark.parametrize('metric', ['cosine', 'dot', 'l2'])
+def test_search_all_lists(data, metric):
+    # Probing every list is exact search
+    vectors, queries = data
+    index = IVFIndex.build(vectors, nlist=8, metric=metric, random_state=0)
+    assert len(index) == len(vectors)
+    assert index.recall(vectors, queries, k=5, nprobe=8) == 1.0
+    indices, scores = index.search(queries, 5, nprobe=8)
+    if metric == 'l2':
+        exact = np.sqrt(((queries[:, None] - vectors[None]) ** 2).sum(-1))
+        assert_allclose(scores, np.sort(exact, axis=1)[:, :5], rtol=1e-4)
+    assert indices.shape == (20, 5)
+
+
+@pytest.mark.parametrize('metric', ['cosine', 'l2'])
+def test_search_pq(data, metric):
+    vectors, queries = data
+    index = IVFIndex.build(vectors, nlist=4, pq=4, metric=metric,
+                           random_state=0)
+    assert index.pq == 4
+    assert 'vectors' not in index.arrays
+    assert index.arrays['codes'].shape == (400, 4)
+    assert index.recall(vectors, queries, k=10, nprobe=4) > 0.5
+    # Approximate scores are close to the exact ones
+    indices, scores = index.search(queries[:1], 1, nprobe=4)
+    if metric == 'l2':
+        exact = np.sqrt(((queries[0] - vectors[indices[0, 0]]) ** 2).sum())
+        assert abs(scores[0, 0] - exact) < 0.5 * exact
+
+
+def test_search_exclude_and_few(data):
+    vectors, _ = data
+    index = IVFIndex.build(vectors[:10], nlist=2, random_state=0)
+    indices, _ = index.search(vectors[:3], 20, nprobe=2,
+                              exclude=np.arange(3))
+    assert (indices[:, 9:] == -1).all()
+    for i, row in enumerate(indices):
+        assert i not in row
+        assert sorted(row[:9].tolist()) == [j for j in range(10) if j != i]
+
+
+def test_build_invalid(data):
+    vectors, _ = data
+    with pytest.raises(ValueError):
+        IVFIndex.build(vectors, pq=5)
+    with pytest.raises(ValueError):
+        IVFIndex.build(vectors, metric='unknown')
+
+
+@pytest.mark.parametrize('mmap', [False, True])
+@pytest.mark.parametrize('pq', [None, 2])
+def test_save_load(data, tmpdir, mmap, pq):
+    vectors, queries = data
+    index = IVFIndex.build(vectors, nlist=6, nprobe=3, pq=pq, metric='dot',
+                           random_state=0)
+    path = tmpdir.join('index.wei').strpath
+    index.save(path)
+    loaded = IVFIndex.load(path, mmap=mmap)
+    assert loaded.metric == 'dot'
+    assert loaded.nprobe == 3
+    assert loaded.pq == pq
+    assert sorted(loaded.arrays) == sorted(index.arrays)
+    for name, arr in index.arrays.items():
+        assert_array_equal(loaded.arrays[name], arr)
+        if mmap and arr.size > 0:
+            # Read-only view of the file
+            assert not loaded.arrays[name].flags.writeable
+    for a, b in zip(loaded.search(queries, 4), index.search(queries, 4)):
+        assert_array_equal(a, b)
+
+
+def test_load_invalid(tmpdir):
+    path = tmpdir.join('index.wei').strpath
+    with open(path, 'wb') as f:
+        f.write(b'invalid\n')
+    with pytest.raises(ParseError):
+        IVFIndex.load(path)
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, division, print_function, \
+    unicode_literals
+
+import io
+
+import pytest
+
+from word_embedding_loader import progress as progress_mod
+from word_embedding_loader.progress import NULL, Progress, as_progress, \
+    file_position
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    c = FakeClock()
+    monkeypatch.setattr(progress_mod.time, 'time', c)
+    return c
+
+
+def test_Progress_callback(clock):
+    infos = []
+    p = Progress(infos.append, total_bytes=100, interval=1.0)
+    p.start_phase('parse', module='glove')
+    assert len(infos) == 1
+    assert infos[0] == ('parse', 0, 100, 0, 0.0)
+
+    clock.now += 0.5
+    p.update(rows=2, nbytes=10)
+    # Within the interval
+    assert len(infos) == 1
+    clock.now += 0.5
+    p.update(rows=3, position=40)
+    assert infos[-1] == ('parse', 40, 100, 5, 1.0)
+
+    clock.now += 0.25
+    p.start_phase('build-vocab')
+    p.finish()
+    assert [i.phase for i in infos] == ['parse', 'parse', 'build-vocab',
+                                        'build-vocab']
+    assert p.module == 'glove'
+    assert p.phases == {'parse': 1.25, 'build-vocab': 0.0}
+
+
+def test_Progress_timer(clock):
+    p = Progress()
+    p.start_phase('parse', module='glove')
+    with p.timer('parse'):
+        clock.now += 1.0
+        with p.timer('io'):
+            clock.now += 2.0
+        with p.timer('format', module='wel'):
+            clock.now += 4.0
+        clock.now += 8.0
+    # Inner timers are not counted in the outer one
+    assert p.timings == {('glove', 'parse'): 9.0, ('glove', 'io'): 2.0,
+                         ('wel', 'format'): 4.0}
+    p.finish()
+    report = p.report()
+    assert 'Total: 15.000 s' in report
+    assert 'glove' in report and 'wel' in report
+
+
+def test_as_progress():
+    assert as_progress(None) is NULL
+    p = Progress()
+    assert as_progress(p) is p
+    p = as_progress(print)
+    assert isinstance(p, Progress) and p.callback is print
+    assert not NULL.active
+    with NULL.timer('io'):
+        NULL.update(rows=1)
+    assert NULL.rows == 0 and not NULL.timings
+
+
+def test_file_position(tmpdir):
+    path = tmpdir.join('a.txt')
+    path.write_binary(b'abcdef')
+    with open(path.strpath, 'rb') as f:
+        f.read(2)
+        # Buffered data does not count; C streams share the descriptor
+        assert file_position(f) == 6
+    f = io.BytesIO(b'abcdef')
+    f.read(3)
+    assert file_position(f) == 3
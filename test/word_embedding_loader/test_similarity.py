@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, division, print_function, \
+    unicode_literals
+
+import numpy as np
+import pytest
+from numpy.testing import assert_allclose, assert_array_equal
+
+from word_embedding_loader import arrays, similarity
+
+
+@pytest.fixture(autouse=True)
+def small_blocks(monkeypatch):
+    # Score a few rows at a time
+    monkeypatch.setattr(similarity, 'SCRATCH_BYTES', 64)
+    monkeypatch.setattr(similarity, '_QUERY_BLOCK', 3)
+
+
+def _brute_force(vectors, queries, k, metric):
+    if metric == 'dot':
+        scores = np.dot(queries, vectors.T)
+        order = np.argsort(-scores, axis=1, kind='mergesort')[:, :k]
+    else:
+        scores = np.sqrt(((queries[:, None] - vectors[None]) ** 2).sum(-1))
+        order = np.argsort(scores, axis=1, kind='mergesort')[:, :k]
+    return order, np.take_along_axis(scores, order, axis=1)
+
+
+@pytest.mark.parametrize('metric', ['dot', 'l2'])
+@pytest.mark.parametrize('k', [1, 4, 50])
+def test_search(metric, k):
+    rs = np.random.RandomState(0)
+    vectors = rs.normal(size=(37, 5)).astype(np.float32)
+    queries = rs.normal(size=(7, 5)).astype(np.float32)
+    indices, scores = similarity.search(vectors, queries, k, metric)
+    expected_indices, expected_scores = _brute_force(
+        vectors, queries, k, metric)
+    assert_array_equal(indices, expected_indices)
+    assert_allclose(scores, expected_scores, rtol=1e-4, atol=1e-4)
+
+
+def test_search_restrict_exclude():
+    rs = np.random.RandomState(1)
+    vectors = rs.normal(size=(20, 4))
+    indices, _ = similarity.search(vectors, vectors[:5], 3, 'dot',
+                                   exclude=np.arange(5), restrict=10)
+    for i, row in enumerate(indices):
+        assert i not in row
+        assert (row < 10).all()
+    assert similarity.search(vectors, vectors[:1], 30, restrict=6)[0].shape \
+        == (1, 6)
+    # Excluded rows are not returned when k exceeds the other rows
+    exclude = [[0, 0], [1, -1], [2, 15]]
+    indices, scores = similarity.search(vectors, vectors[:3], 10,
+                                        exclude=exclude, restrict=6)
+    assert indices.shape == (3, 5)
+    assert np.isfinite(scores).all()
+    for row, excluded in zip(indices, exclude):
+        assert not set(row) & set(excluded)
+    indices, scores = similarity.analogy(
+        vectors, vectors[:1], vectors[1:2], vectors[2:3], 30,
+        exclude=[[0, 1, 2]])
+    assert indices.shape == (1, 17)
+    assert np.isfinite(scores).all()
+
+
+def test_search_row_vectors():
+    vectors = np.arange(12, dtype=np.float16).reshape(4, 3)
+    mapped = arrays.MappedVectors(
+        np.frombuffer(vectors.tobytes(), dtype=np.uint8), np.arange(4) * 6, 3,
+        dtype=np.float16, file_dtype=np.float16)
+    indices, scores = similarity.search(mapped, [[1, 1, 1]], 2)
+    assert scores.dtype == np.float32
+    assert indices.tolist() == [[3, 2]]
+
+
+def test_normalize():
+    vectors = np.array([[3, 4], [0, 0], [1, 0]], dtype=np.float16)
+    normed = similarity.normalize(vectors)
+    assert normed.dtype == np.float32
+    assert_allclose(normed, [[0.6, 0.8], [0, 0], [1, 0]])
+
+
+@pytest.mark.parametrize('method', ['3cosadd', '3cosmul'])
+def test_analogy(method):
+    rs = np.random.RandomState(2)
+    vectors = similarity.normalize(rs.normal(size=(30, 6)))
+    ids = rs.randint(0, 30, size=(3, 7))
+    a, b, c = (vectors[i] for i in ids)
+    indices, scores = similarity.analogy(vectors, a, b, c, 3, method,
+                                         exclude=ids.T)
+    cos = [np.dot(x, vectors.T) for x in (a, b, c)]
+    if method == '3cosadd':
+        expected = cos[1] - cos[0] + cos[2]
+    else:
+        cos = [(x + 1) / 2 for x in cos]
+        expected = cos[1] * cos[2] / (cos[0] + 1e-3)
+    expected[np.arange(7)[:, None], ids.T] = -np.inf
+    assert_array_equal(indices,
+                       np.argsort(-expected, axis=1, kind='mergesort')[:, :3])
+    assert_allclose(scores, -np.sort(-expected, axis=1)[:, :3], rtol=1e-6)
+    with pytest.raises(ValueError):
+        similarity.analogy(vectors, a, b, c, method='unknown')
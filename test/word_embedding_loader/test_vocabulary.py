@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, division, print_function, \
+    unicode_literals
+
+import pickle
+import zlib
+
+import numpy as np
+import pytest
+
+from word_embedding_loader import ParseWarning
+from word_embedding_loader.vocabulary import Vocabulary, VocabularyBuilder, \
+    build_table, hash_words
+
+
+WORDS = [b'</s>', b'the', '日本語'.encode('utf-8'), b'', b'a' * 300] + \
+    [('w%d' % i).encode('utf-8') for i in range(100)]
+
+
+def test_hash_words():
+    vocab = Vocabulary.from_words(WORDS)
+    h = hash_words(vocab._tokens, vocab._offsets)
+    assert h.tolist() == [zlib.crc32(w) & 0xFFFFFFFF for w in WORDS]
+
+
+def test_mapping():
+    vocab = Vocabulary.from_words(WORDS)
+    expected = dict((w, i) for i, w in enumerate(WORDS))
+    assert len(vocab) == len(WORDS)
+    assert list(vocab) == WORDS
+    assert vocab == expected
+    assert expected == vocab
+    assert dict(vocab.items()) == expected
+    assert list(vocab.values()) == list(range(len(WORDS)))
+    for w, i in expected.items():
+        assert w in vocab
+        assert vocab[w] == i
+        assert vocab.word(i) == w
+    assert b'missing' not in vocab
+    assert 'the' not in vocab
+    assert vocab.get(b'missing') is None
+    with pytest.raises(KeyError):
+        vocab[b'missing']
+    assert vocab.word(-1) == WORDS[-1]
+    with pytest.raises(IndexError):
+        vocab.word(len(WORDS))
+    # Read-only; a dict is modified instead
+    with pytest.raises(TypeError):
+        vocab[b'new'] = len(WORDS)
+    with pytest.raises(TypeError):
+        del vocab[WORDS[0]]
+    d = dict(vocab)
+    d[b'new'] = len(WORDS)
+    assert len(d) == len(WORDS) + 1
+
+
+def test_from_dict():
+    vocab = Vocabulary.from_dict({b'b': 1, b'a': 0})
+    assert list(vocab) == [b'a', b'b']
+    with pytest.raises(ValueError):
+        Vocabulary.from_dict({b'b': 2, b'a': 0})
+
+
+def test_empty():
+    vocab = Vocabulary.from_words([])
+    assert len(vocab) == 0
+    assert b'a' not in vocab
+
+
+def test_buffer(tmpdir):
+    # Words can be held in a (memory-mapped) array
+    vocab = Vocabulary.from_words(WORDS)
+    path = tmpdir.join('tokens').strpath
+    with open(path, 'wb') as f:
+        f.write(vocab._tokens)
+    tokens = np.memmap(path, dtype=np.uint8, mode='r')
+    mapped = Vocabulary(tokens, vocab._offsets, vocab._table)
+    assert mapped == vocab
+    assert mapped[b'w42'] == vocab[b'w42']
+
+    loaded = pickle.loads(pickle.dumps(mapped))
+    assert loaded == vocab
+
+
+def test_lookup_ids():
+    vocab = Vocabulary.from_words(WORDS)
+    ids = vocab.lookup_ids([b'the', b'missing', b'w7', 'the'])
+    assert ids.dtype == np.int64
+    assert ids.tolist() == [1, -1, 12, -1]
+    assert vocab.lookup_ids(iter([b'w7', b'x']), default=0).tolist() == [12, 0]
+
+
+def test_builder():
+    builder = VocabularyBuilder()
+    tokens = WORDS[:3] + [WORDS[1]] + WORDS[3:]
+    with pytest.warns(ParseWarning):
+        keep, n = builder.add_tokens(tokens)
+    assert keep.tolist() == [0, 1, 2] + list(range(4, len(tokens)))
+    assert n == len(tokens)
+    assert builder.add(b'the') == -1
+    assert builder.find(WORDS[2]) == 2
+    assert builder.find(b'missing') == -1
+    keep, n = builder.add_tokens([b'x', b'y'], max_vocab=len(WORDS) + 1)
+    assert (keep.tolist(), n) == ([0], 1)
+
+    vocab = builder.build()
+    assert list(vocab) == WORDS + [b'x']
+    for i, w in enumerate(WORDS + [b'x']):
+        assert vocab[w] == i
+    # Same table size as build_table
+    assert len(vocab._table) == len(build_table(vocab._tokens,
+                                                vocab._offsets))
+    assert len(VocabularyBuilder().build()) == 0
+
+
+def test_lookup_ids_batch():
+    # Enough words that probes run for several rounds
+    words = [('w%d' % i).encode('utf-8') * (1 + i % 3) for i in range(5000)]
+    vocab = Vocabulary.from_words(words)
+    query = words[::-7] + [b'', b'missing', b'w1w1w1'] + words[:3]
+    expected = dict((w, i) for i, w in enumerate(words))
+    assert vocab.lookup_ids(query).tolist() == \
+        [expected.get(w, -1) for w in query]
+    assert vocab.lookup_ids([]).tolist() == []
+    assert vocab.lookup_ids([None, b'w0', 1]).tolist() == [-1, 0, -1]
@@ -3,12 +3,16 @@ from __future__ import absolute_import, division, print_function, \
     unicode_literals
 
 import io
+import os
+import shutil
 
 import numpy as np
+import pytest
 from numpy.testing import assert_array_equal, assert_allclose
 from six.moves import range
 
-from word_embedding_loader import loader
+from word_embedding_loader import ParseWarning, arrays, compression, lazy, \
+    loader, progress, saver
 from word_embedding_loader import word_embedding
 
 
@@ -32,6 +36,83 @@ class TestClassifyFormat:
     def test__classify_format_word2vec_text(self, word2vec_text_file):
         assert word_embedding.classify_format(word2vec_text_file) == word_embedding._word2vec_text
 
+    def test__classify_format_wel(self, wel_file):
+        assert word_embedding.classify_format(wel_file) == word_embedding._wel
+
+
+class NonSeekable(io.RawIOBase):
+    # Stream that can only be read forward, like a pipe
+    def __init__(self, data):
+        self._f = io.BytesIO(data)
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        return self._f.readinto(b)
+
+
+def test__get_two_lines_bounded():
+    # Binary files may have no new line for a long time
+    f = io.BytesIO(b'2 3\n' + b'\x01' * (2 * word_embedding.PEEK_BYTES))
+    l0, l1 = word_embedding._get_two_lines(f)
+    assert l0 == b'2 3\n'
+    assert len(l1) == word_embedding.PEEK_BYTES - len(l0)
+    assert f.tell() == word_embedding.PEEK_BYTES
+
+
+@pytest.mark.parametrize('name', ['glove', 'word2vec_text', 'word2vec_bin',
+                                  'wel'])
+def test_WordEmbedding___load__file_object(name, glove_file,
+                                           word2vec_text_file,
+                                           word2vec_bin_file, wel_file):
+    f = {'glove': glove_file, 'word2vec_text': word2vec_text_file,
+         'word2vec_bin': word2vec_bin_file, 'wel': wel_file}[name]
+    expected = word_embedding.WordEmbedding.load(f.name)
+    data = f.read()
+
+    f.seek(0)
+    obj = word_embedding.WordEmbedding.load(f)
+    assert obj._load_cond == expected._load_cond
+    assert obj._source is None
+    assert obj.vocab == expected.vocab
+    assert_array_equal(obj.vectors, expected.vectors)
+
+    # Binary formats are copied to a temporary file, which can be mapped
+    for mmap in ((False, True) if name in ('word2vec_bin', 'wel')
+                 else (False, )):
+        obj = word_embedding.WordEmbedding.load(
+            io.BufferedReader(NonSeekable(data)), mmap=mmap)
+        assert obj._load_cond == expected._load_cond
+        assert obj.vocab == expected.vocab
+        assert_array_equal(obj.vectors[:], expected.vectors)
+
+    batches = list(word_embedding.WordEmbedding.iter_rows(
+        io.BufferedReader(NonSeekable(data))))
+    assert_array_equal(batches[0][1], expected.vectors)
+
+    with pytest.raises(ValueError):
+        word_embedding.WordEmbedding.load(f, lazy=True)
+
+
+@pytest.mark.parametrize('name,info', [
+    ('glove', (3, 4, None)),
+    ('word2vec_text', (3, 2, None)),
+    ('word2vec_bin', (3, 5, 'float32')),
+    ('wel', (3, 2, 'float32')),
+])
+def test_sniff(name, info, glove_file, word2vec_text_file, word2vec_bin_file,
+               wel_file):
+    f = {'glove': glove_file, 'word2vec_text': word2vec_text_file,
+         'word2vec_bin': word2vec_bin_file, 'wel': wel_file}[name]
+    mod = getattr(word_embedding, '_' + name)
+    expected = {'format': mod.format, 'binary': mod.binary, 'words': info[0],
+                'size': info[1], 'dtype': info[2], 'quantized': False,
+                'compression': None}
+    assert word_embedding.sniff(f.name) == expected
+    stream = io.BufferedReader(NonSeekable(f.read()))
+    assert word_embedding.sniff(stream) == expected
+
 
 def test_WordEmbedding___init__():
     obj = word_embedding.WordEmbedding(
@@ -156,3 +237,491 @@ def test_WordEmbedding___save__(tmpdir):
         arr, vocab = loader.word2vec_bin.load(f, dtype=np.float32)
     assert_array_equal(arr, arr_input)
     assert vocab == vocab
+
+
+@pytest.mark.parametrize('mmap', [False, True])
+def test_WordEmbedding___load__duplicates(tmpdir, mmap):
+    # Duplicated words used to leave gaps in the indices of the vocabulary
+    arr = np.arange(12, dtype=np.float32).reshape(4, 3)
+    path = tmpdir.join('duplicates.bin').strpath
+    with open(path, 'wb') as f:
+        saver.word2vec_bin.save(f, arr, [(b'a', 0), (b'b', 1), (b'a', 2),
+                                         (b'c', 3)])
+    with pytest.warns(ParseWarning):
+        obj = word_embedding.WordEmbedding.load(path, mmap=mmap)
+    assert len(obj) == 3
+    assert obj.vocab[b'c'] == 2
+    assert_array_equal(obj.vectors[:], arr[[0, 1, 3]])
+
+
+def test_WordEmbedding___load__mmap(word2vec_bin_file_path, vocab_file):
+    expected = word_embedding.WordEmbedding.load(word2vec_bin_file_path)
+    obj = word_embedding.WordEmbedding.load(word2vec_bin_file_path, mmap=True)
+    assert obj.vocab == expected.vocab
+    assert obj.size == 5
+    assert_array_equal(obj.vectors[:], expected.vectors)
+
+    obj = word_embedding.WordEmbedding.load(
+        word2vec_bin_file_path, vocab=vocab_file.name, mmap=True)
+    assert len(obj) == 2
+    assert_array_equal(obj.vectors[obj.vocab[b'</s>']],
+                       expected.vectors[expected.vocab[b'</s>']])
+
+
+def test_WordEmbedding___load__workers(word2vec_text_file, vocab_file,
+                                       word2vec_bin_file_path):
+    expected = word_embedding.WordEmbedding.load(word2vec_text_file.name)
+    obj = word_embedding.WordEmbedding.load(word2vec_text_file.name, workers=2)
+    assert obj.vocab == expected.vocab
+    assert_array_equal(obj.vectors, expected.vectors)
+
+    obj = word_embedding.WordEmbedding.load(
+        word2vec_text_file.name, vocab=vocab_file.name, workers=2)
+    assert len(obj) == 2
+
+    with pytest.warns(UserWarning):
+        obj = word_embedding.WordEmbedding.load(word2vec_bin_file_path,
+                                                workers=2)
+    assert len(obj) == 3
+
+
+@pytest.mark.parametrize('name', ['glove', 'word2vec_text', 'word2vec_bin'])
+def test_WordEmbedding___load__lazy(name, glove_file, word2vec_text_file,
+                                    word2vec_bin_file_path, tmpdir,
+                                    monkeypatch):
+    path = {
+        'glove': glove_file.name,
+        'word2vec_text': word2vec_text_file.name,
+        'word2vec_bin': tmpdir.join('word2vec.bin').strpath,
+    }[name]
+    if name == 'word2vec_bin':
+        shutil.copy(word2vec_bin_file_path, path)
+    expected = word_embedding.WordEmbedding.load(path)
+    obj = word_embedding.WordEmbedding.load(path, lazy=True, cache_rows=1)
+    assert isinstance(obj.vectors, arrays.LazyVectors)
+    assert obj.vocab == expected.vocab
+    assert obj._load_cond == expected._load_cond
+    assert_array_equal(obj.vectors[[2, 0]], expected.vectors[[2, 0]])
+    assert_array_equal(obj.vectors[:], expected.vectors)
+    assert os.path.exists(lazy.index_path(path))
+
+    # The index is reused without scanning the file
+    mod = obj._load_cond.loader
+    monkeypatch.setattr(mod, 'scan_offsets', None)
+    obj = word_embedding.WordEmbedding.load(path, lazy=True, max_vocab=2,
+                                            dtype=np.float64)
+    assert len(obj) == 2
+    assert obj.vocab == dict((w, i) for w, i in expected.vocab.items() if i < 2)
+    assert obj.vectors.dtype == np.float64
+    assert_allclose(obj.vectors[:], expected.vectors[:2], rtol=1e-6)
+    monkeypatch.undo()
+
+    with pytest.raises(ValueError):
+        word_embedding.WordEmbedding.load(path, lazy=True, cache_dir=tmpdir)
+
+
+def test_WordEmbedding___load__lazy_rebuild(glove_file, tmpdir):
+    path = glove_file.name
+    word_embedding.WordEmbedding.load(path, lazy=True)
+    with open(path, 'ab') as f:
+        f.write(b'\nof 1 2 3 4')
+    obj = word_embedding.WordEmbedding.load(path, lazy=True)
+    assert len(obj) == 4
+    assert_array_equal(obj.vectors[obj.vocab[b'of']], [1, 2, 3, 4])
+
+    # The index is kept in memory if it cannot be written
+    os.remove(lazy.index_path(path))
+    os.mkdir(lazy.index_path(path))
+    obj = word_embedding.WordEmbedding.load(path, lazy=True, max_vocab=1)
+    assert list(obj.vocab) == [b'the']
+    assert_array_equal(obj.vectors[0], np.array(
+        [0.418, 0.24968, -0.41242, 0.1217], dtype=np.float32))
+
+
+def test_WordEmbedding___save__wel(word2vec_bin_file_path, tmpdir):
+    obj = word_embedding.WordEmbedding.load(word2vec_bin_file_path)
+    tmp_path = tmpdir.join('WordEmbedding__save.wel').strpath
+    obj.save(tmp_path, format='wel')
+    with open(tmp_path, 'rb') as f:
+        header = loader.wel.read_header(f)
+    assert header['shape'] == [3, 5]
+    assert header['source'] == obj._source
+    obj.save(tmp_path, format='wel', content_hash=True)
+    with open(tmp_path, 'rb') as f:
+        header = loader.wel.read_header(f)
+    assert header['source']['checksum'].startswith('sha1:')
+
+    # Paths given as bytes are recorded as str
+    obj = word_embedding.WordEmbedding.load(
+        word2vec_bin_file_path.encode('utf-8'))
+    obj.save(tmp_path, format='wel')
+    with open(tmp_path, 'rb') as f:
+        header = loader.wel.read_header(f)
+    assert header['source']['path'] == os.path.abspath(word2vec_bin_file_path)
+
+    for mmap in (False, True):
+        loaded = word_embedding.WordEmbedding.load(tmp_path, mmap=mmap)
+        assert loaded._load_cond == word_embedding._wel
+        assert loaded.vocab == obj.vocab
+        assert_array_equal(loaded.vectors[:], obj.vectors)
+
+
+def test_WordEmbedding_iter_rows(word2vec_bin_file_path):
+    expected = word_embedding.WordEmbedding.load(word2vec_bin_file_path)
+    batches = list(word_embedding.WordEmbedding.iter_rows(
+        word2vec_bin_file_path, batch_size=2))
+    assert [len(t) for t, _ in batches] == [2, 1]
+    for tokens, arr in batches:
+        for token, v in zip(tokens, arr):
+            assert_array_equal(v, expected.vectors[expected.vocab[token]])
+
+
+@pytest.mark.parametrize('use_dict', [False, True])
+def test_WordEmbedding_lookup(use_dict):
+    arr = np.arange(12, dtype=np.float32).reshape(4, 3)
+    words = [b'a', b'b', b'c', b'<unk>']
+    vocab = {w: i for i, w in enumerate(words)}
+    if not use_dict:
+        vocab = word_embedding.Vocabulary.from_dict(vocab)
+    obj = word_embedding.WordEmbedding(arr, vocab)
+    tokens = [b'c', b'x', b'a', b'y']
+
+    assert obj.lookup_ids(tokens).tolist() == [2, -1, 0, -1]
+    assert obj.lookup_ids(iter(tokens)).tolist() == [2, -1, 0, -1]
+    assert_array_equal(obj.lookup(tokens),
+                       [arr[2], [0, 0, 0], arr[0], [0, 0, 0]])
+    assert_array_equal(obj.lookup(tokens, oov=3),
+                       [arr[2], arr[3], arr[0], arr[3]])
+    assert_allclose(obj.lookup(tokens, oov='mean')[1], arr.mean(axis=0))
+    r1 = obj.lookup(tokens, oov='random', random_state=0)
+    r2 = obj.lookup(tokens, oov='random', random_state=0)
+    assert_array_equal(r1, r2)
+    assert_array_equal(r1[[0, 2]], arr[[2, 0]])
+    assert not np.array_equal(r1[1], r1[3])
+    assert obj.lookup([]).shape == (0, 3)
+    with pytest.raises(KeyError):
+        obj.lookup(tokens, oov='error')
+    assert_array_equal(obj.lookup(tokens[:1], oov='error'), arr[[2]])
+    with pytest.raises(ValueError):
+        obj.lookup(tokens, oov='unknown')
+
+
+def test_WordEmbedding_lookup_padded():
+    arr = np.arange(1, 10, dtype=np.float32).reshape(3, 3)
+    obj = word_embedding.WordEmbedding(arr, {b'a': 0, b'b': 1, b'c': 2})
+    sentences = [[b'a', b'b', b'c'], [], [b'x', b'c']]
+
+    ids, lengths = obj.lookup_ids_padded(sentences)
+    assert ids.tolist() == [[0, 1, 2], [-1, -1, -1], [-1, 2, -1]]
+    assert lengths.tolist() == [3, 0, 2]
+    ids, lengths = obj.lookup_ids_padded(sentences, max_len=2, pad=-2)
+    assert ids.tolist() == [[0, 1], [-2, -2], [-1, 2]]
+    assert lengths.tolist() == [2, 0, 2]
+
+    vecs, lengths = obj.lookup_padded(sentences, oov=0)
+    assert vecs.shape == (3, 3, 3)
+    assert lengths.tolist() == [3, 0, 2]
+    assert_array_equal(vecs[0], arr)
+    assert_array_equal(vecs[1], np.zeros((3, 3)))
+    assert_array_equal(vecs[2], [arr[0], arr[2], [0, 0, 0]])
+
+
+def test_WordEmbedding_most_similar():
+    arr = np.array([[1, 0], [0, 1], [2, 0.5], [-1, 0], [10, 1]],
+                   dtype=np.float32)
+    words = [b'a', b'b', b'c', b'd', b'e']
+    obj = word_embedding.WordEmbedding(
+        arr, word_embedding.Vocabulary.from_words(words))
+
+    indices, scores = obj.most_similar(b'a', k=2)
+    assert indices.tolist() == [4, 2]
+    assert_allclose(scores, [10 / np.sqrt(101), 2 / np.sqrt(4.25)], rtol=1e-5)
+    indices, _ = obj.most_similar([b'a', b'b'], k=1, restrict_vocab=4)
+    assert indices.tolist() == [[2], [2]]
+    indices, _ = obj.most_similar(np.array([1, 0]), k=1, metric='dot')
+    assert indices.tolist() == [4]
+    indices, scores = obj.most_similar([[1, 0], [0, 1]], k=2, metric='l2')
+    assert indices.tolist() == [[0, 2], [1, 0]]
+    assert_allclose(scores[0], [0, np.sqrt(1.25)], rtol=1e-5)
+    # The normalized copy is reused
+    assert obj.most_similar(b'e', k=1)[0].tolist() == [0]
+    assert len(obj._derived_cache) == 2
+
+    with pytest.raises(KeyError):
+        obj.most_similar(b'missing')
+    with pytest.raises(ValueError):
+        obj.most_similar(b'a', metric='unknown')
+
+
+def test_WordEmbedding_build_index():
+    rs = np.random.RandomState(0)
+    arr = rs.normal(size=(50, 4)).astype(np.float32)
+    obj = word_embedding.WordEmbedding(
+        arr, {('w%d' % i).encode('utf-8'): i for i in range(50)})
+    index = obj.build_index(nlist=4, nprobe=4, random_state=0)
+    words = [b'w1', b'w7']
+    expected = obj.most_similar(words, k=3)
+    found = obj.most_similar(words, k=3, index=index)
+    assert_array_equal(found[0], expected[0])
+    assert_allclose(found[1], expected[1], rtol=1e-5)
+    with pytest.raises(ValueError):
+        obj.most_similar(words, metric='l2', index=index)
+    with pytest.raises(ValueError):
+        obj.build_index(kind='hnsw')
+
+
+def test_WordEmbedding_analogy():
+    # queen = king - man + woman
+    vecs = {b'man': [1, 0, 0], b'woman': [1, 1, 0], b'king': [1, 0, 1],
+            b'queen': [1, 1, 1], b'apple': [0, 0, -1]}
+    obj = word_embedding.WordEmbedding(
+        np.array(list(vecs.values()), dtype=np.float32),
+        {w: i for i, w in enumerate(vecs)})
+    for method in ('3cosadd', '3cosmul'):
+        indices, _ = obj.analogy(b'man', b'king', b'woman', k=2,
+                                 method=method)
+        assert indices[0] == 3
+        assert obj.analogy([b'man', b'woman'], [b'king', b'queen'],
+                           [b'woman', b'man'], method=method)[0].tolist() \
+            == [[3], [2]]
+    with pytest.raises(KeyError):
+        obj.analogy(b'man', b'king', b'missing')
+    with pytest.raises(ValueError):
+        obj.analogy([b'man'], [b'king'], [])
+
+
+def test_WordEmbedding_quantize(tmpdir):
+    rs = np.random.RandomState(0)
+    arr = rs.normal(size=(40, 6)).astype(np.float32)
+    obj = word_embedding.WordEmbedding(
+        arr, {('w%d' % i).encode('utf-8'): i for i in range(40)})
+    quantized = obj.quantize()
+    assert isinstance(quantized.vectors, word_embedding.QuantizedVectors)
+    assert quantized.vocab is obj.vocab
+    assert quantized.vectors.nbytes == 40 * 6 + 2 * 40 * 4
+    assert_allclose(quantized.lookup([b'w3', b'w9']), arr[[3, 9]], atol=0.02)
+    # Similarity is computed without a normalized copy
+    indices, scores = quantized.most_similar([b'w1', b'w2'], k=3)
+    assert_array_equal(indices, obj.most_similar([b'w1', b'w2'], k=3)[0])
+    assert 'normalized' not in quantized._derived_cache
+    assert quantized.analogy(b'w1', b'w2', b'w3')[0].tolist() == \
+        obj.analogy(b'w1', b'w2', b'w3')[0].tolist()
+
+    # Saved as codes in 'wel' format and as values in others
+    path = tmpdir.join('quantized.wel').strpath
+    quantized.save(path, 'wel')
+    loaded = word_embedding.WordEmbedding.load(path)
+    assert_array_equal(loaded.vectors.codes, quantized.vectors.codes)
+    for fmt, binary in (('glove', False), ('word2vec', True)):
+        path = tmpdir.join('quantized.%s' % fmt).strpath
+        quantized.save(path, fmt, binary=binary)
+        loaded = word_embedding.WordEmbedding.load(path, format=fmt,
+                                                   binary=binary)
+        assert_allclose(loaded.vectors, quantized.vectors[:], rtol=1e-6)
+
+    half = obj.quantize(bits=16)
+    assert half.vectors.dtype == np.float16
+    with pytest.raises(ValueError):
+        obj.quantize(bits=4)
+
+
+def test_convert_quantize(word2vec_bin_file_path, tmpdir):
+    path = tmpdir.join('quantized.wel').strpath
+    word_embedding.convert(word2vec_bin_file_path, path, 'wel', quantize=True)
+    expected = word_embedding.WordEmbedding.load(word2vec_bin_file_path)
+    obj = word_embedding.WordEmbedding.load(path, mmap=True)
+    assert isinstance(obj.vectors, word_embedding.QuantizedVectors)
+    assert_allclose(obj.vectors[:], expected.vectors, atol=0.01)
+    with pytest.raises(ValueError):
+        word_embedding.convert(word2vec_bin_file_path, path, 'glove',
+                               quantize=True)
+
+
+@pytest.mark.parametrize('name', ['glove', 'word2vec_text', 'word2vec_bin',
+                                  'wel'])
+def test_WordEmbedding___load__progress(name, glove_file, word2vec_text_file,
+                                        word2vec_bin_file_path, wel_file):
+    path = {'glove': glove_file.name, 'word2vec_text': word2vec_text_file.name,
+            'word2vec_bin': word2vec_bin_file_path, 'wel': wel_file.name}[name]
+    infos = []
+    p = progress.Progress(infos.append)
+    obj = word_embedding.WordEmbedding.load(path, progress=p)
+    assert [i.phase for i in infos] == ['detect', 'parse', 'build-vocab',
+                                        'build-vocab']
+    assert infos[-1].rows == len(obj) == 3
+    assert infos[-1].total_bytes == os.path.getsize(path)
+    if name in ('wel', 'word2vec_bin'):
+        # The hash table of the words, or the new line at the end, is not
+        # read
+        assert 0 < infos[-1].bytes <= infos[-1].total_bytes
+    else:
+        assert infos[-1].bytes == infos[-1].total_bytes
+    assert p.module == name
+    assert set(p.phases) == {'detect', 'parse', 'build-vocab'}
+    assert p.timings
+
+    # A callable is wrapped
+    infos = []
+    word_embedding.WordEmbedding.load(path, progress=infos.append)
+    assert infos[-1].rows == 3
+
+
+def test_WordEmbedding___load__progress_vocab(word2vec_text_file,
+                                              vocab_file):
+    infos = []
+    obj = word_embedding.WordEmbedding.load(
+        word2vec_text_file.name, vocab=vocab_file.name,
+        progress=infos.append)
+    # Rows are counted whether they are in vocab or not
+    assert infos[-1].rows == 3
+    assert len(obj) == 2
+
+
+@pytest.mark.parametrize('format,binary', [
+    ('glove', False), ('word2vec', False), ('word2vec', True), ('wel', False)])
+def test_WordEmbedding___save__progress(format, binary,
+                                        word2vec_bin_file_path, tmpdir):
+    obj = word_embedding.WordEmbedding.load(word2vec_bin_file_path)
+    path = tmpdir.join('out').strpath
+    infos = []
+    obj.save(path, format, binary=binary, progress=infos.append)
+    assert infos[0].phase == 'write'
+    assert infos[-1].rows == 3
+    assert infos[-1].bytes == os.path.getsize(path)
+    loaded = word_embedding.WordEmbedding.load(path)
+    assert_allclose(loaded.vectors, obj.vectors, rtol=1e-6)
+
+
+def test_convert_progress(word2vec_bin_file_path, tmpdir):
+    path = tmpdir.join('out.txt').strpath
+    p = progress.Progress()
+    word_embedding.convert(word2vec_bin_file_path, path, 'glove', progress=p)
+    assert p.rows == 3
+    assert p.total_bytes == os.path.getsize(word2vec_bin_file_path)
+    # The new line at the end of the file is not read
+    assert 0 < p.bytes <= p.total_bytes
+    assert list(p.phases) == ['detect', 'convert']
+    assert {module for module, _ in p.timings} == {'word2vec_bin', 'glove'}
+    assert len(word_embedding.WordEmbedding.load(path)) == 3
+
+
+COMPRESSIONS = [(name, ext) for ext, name in compression.EXTENSIONS.items()
+                if compression.available(name)]
+
+
+@pytest.mark.parametrize('name', ['glove', 'word2vec_text', 'word2vec_bin',
+                                  'wel'])
+@pytest.mark.parametrize('comp,ext', COMPRESSIONS)
+def test_WordEmbedding___load__compressed(name, comp, ext, glove_file,
+                                          word2vec_text_file,
+                                          word2vec_bin_file, wel_file,
+                                          tmpdir):
+    f = {'glove': glove_file, 'word2vec_text': word2vec_text_file,
+         'word2vec_bin': word2vec_bin_file, 'wel': wel_file}[name]
+    expected = word_embedding.WordEmbedding.load(f.name)
+    path = tmpdir.join('compressed' + ext).strpath
+    with open(path, 'wb') as fout, \
+            compression.open_compressed(fout, comp) as out:
+        shutil.copyfileobj(f, out)
+
+    for thread in (False, True):
+        obj = word_embedding.WordEmbedding.load(path, decompress_thread=thread)
+        assert obj._load_cond == expected._load_cond
+        assert obj.vocab == expected.vocab
+        assert_array_equal(obj.vectors, expected.vectors)
+    with open(path, 'rb') as fin:
+        obj = word_embedding.WordEmbedding.load(
+            io.BufferedReader(NonSeekable(fin.read())),
+            mmap=name in ('word2vec_bin', 'wel'))
+    assert_array_equal(obj.vectors[:], expected.vectors)
+
+    batches = list(word_embedding.WordEmbedding.iter_rows(path))
+    assert_array_equal(batches[0][1], expected.vectors)
+    assert word_embedding.sniff(path)['compression'] == comp
+    with open(path, 'rb') as fin:
+        assert word_embedding.classify_format(fin) == expected._load_cond
+    if name != 'wel':
+        with pytest.raises(ValueError):
+            word_embedding.WordEmbedding.load(path, lazy=True)
+
+
+def test_WordEmbedding___load__bz2_magic(tmpdir):
+    # Uncompressed files may begin with the magic number of bzip2
+    path = tmpdir.join('BZh.txt')
+    path.write_binary(b'BZh 0.1 0.2\nBZh9 0.3 0.4\n')
+    obj = word_embedding.WordEmbedding.load(path.strpath)
+    assert obj._load_cond == word_embedding._glove
+    assert obj.vocab[b'BZh9'] == 1
+    assert word_embedding.sniff(path.strpath)['compression'] is None
+
+
+@pytest.mark.parametrize('comp,ext', COMPRESSIONS)
+def test_WordEmbedding___save__compressed(comp, ext, word2vec_bin_file_path,
+                                          tmpdir):
+    obj = word_embedding.WordEmbedding.load(word2vec_bin_file_path)
+    path = tmpdir.join('out.txt' + ext).strpath
+    obj.save(path, 'glove')
+    with open(path, 'rb') as f:
+        assert compression.detect(f.read(8)) == comp
+    loaded = word_embedding.WordEmbedding.load(path)
+    assert loaded.vocab == obj.vocab
+    assert_allclose(loaded.vectors, obj.vectors, rtol=1e-6)
+
+    # Explicit compression, whatever the extension
+    path = tmpdir.join('out.wel').strpath
+    p = progress.Progress()
+    obj.save(path, 'wel', compression=comp, progress=p)
+    assert p.bytes == os.path.getsize(path)
+    assert word_embedding.sniff(path)['compression'] == comp
+    assert_array_equal(word_embedding.WordEmbedding.load(path).vectors,
+                       obj.vectors)
+    obj.save(path, 'wel', compression=None)
+    assert word_embedding.sniff(path)['compression'] is None
+
+
+@pytest.mark.parametrize('to_format,to_binary', [
+    ('glove', False), ('word2vec', False), ('word2vec', True), ('wel', False)])
+@pytest.mark.parametrize('ext,mod', [('.bin', saver.word2vec_bin),
+                                     ('.bin.gz', saver.word2vec_bin),
+                                     ('.txt', saver.glove)])
+def test_convert_duplicates(tmpdir, to_format, to_binary, ext, mod):
+    # Same as loading and saving, so that the output can be loaded again
+    arr = np.arange(15, dtype=np.float32).reshape(5, 3)
+    src = tmpdir.join('duplicates' + ext).strpath
+    dst = tmpdir.join('out').strpath
+    with open(src, 'wb') as fout, \
+            compression.open_compressed(fout, compression.infer(src)) as f:
+        mod.save(f, arr, [(b'a', 0), (b'b', 1), (b'a', 2), (b'c', 3),
+                          (b'b', 4)])
+    with pytest.warns(ParseWarning):
+        word_embedding.convert(src, dst, to_format, to_binary=to_binary,
+                               batch_size=2)
+    obj = word_embedding.WordEmbedding.load(dst, format=to_format,
+                                            binary=to_binary)
+    assert obj.vocab == {b'a': 0, b'b': 1, b'c': 2}
+    assert_array_equal(obj.vectors[:], arr[[0, 1, 3]])
+
+    word_embedding.convert(src, dst, to_format, to_binary=to_binary,
+                           max_vocab=2)
+    obj = word_embedding.WordEmbedding.load(dst, format=to_format,
+                                            binary=to_binary)
+    assert_array_equal(obj.vectors[:], arr[:2])
+
+
+def test_convert_compressed(word2vec_bin_file_path, tmpdir):
+    src = tmpdir.join('in.bin.gz').strpath
+    dst = tmpdir.join('out.txt.bz2').strpath
+    word_embedding.convert(word2vec_bin_file_path, src, 'word2vec',
+                           to_binary=True)
+    for thread in (False, True):
+        p = progress.Progress()
+        word_embedding.convert(src, dst, 'word2vec', progress=p,
+                               decompress_thread=thread)
+        assert p.rows == 3
+        assert p.total_bytes is None
+        info = word_embedding.sniff(dst)
+        assert (info['compression'], info['format'], info['binary'],
+                info['words']) == ('bz2', 'word2vec', False, 3)
+    expected = word_embedding.WordEmbedding.load(word2vec_bin_file_path)
+    assert_allclose(word_embedding.WordEmbedding.load(dst).vectors,
+                    expected.vectors, rtol=1e-5)
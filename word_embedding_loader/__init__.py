@@ -5,3 +5,4 @@ from __future__ import absolute_import, division, print_function, \
 from word_embedding_loader._version import __version__
 from word_embedding_loader.exceptions import ParseError, ParseWarning, parse_warn
 from word_embedding_loader.word_embedding import WordEmbedding
+from word_embedding_loader.vocabulary import Vocabulary
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""
+Helpers to identify the contents of a file without parsing it.
+"""
+
+from __future__ import absolute_import, division, print_function, \
+    unicode_literals
+
+import hashlib
+import os
+import sys
+
+
+# Number of bytes read at once when hashing a file
+_CHUNK_SIZE = 1 << 20
+
+
+def stat_file(path):
+    """
+    Describe a file by its location, size and modification time.
+
+    Args:
+        path (str): Path of the file.
+
+    Returns:
+        dict: ``path`` (absolute path as ``str``, even if ``path`` is
+        ``bytes``, so that it can be serialized as JSON), ``size`` (bytes)
+        and ``mtime`` (in nanoseconds) of the file.
+    """
+    st = os.stat(path)
+    mtime = getattr(st, 'st_mtime_ns', None)
+    if mtime is None:
+        mtime = int(st.st_mtime * 1e9)
+    return {'path': _decode_path(os.path.abspath(path)), 'size': st.st_size,
+            'mtime': mtime}
+
+
+def _decode_path(path):
+    if not isinstance(path, bytes):
+        return path
+    if hasattr(os, 'fsdecode'):
+        return os.fsdecode(path)
+    # Python 2
+    return path.decode(sys.getfilesystemencoding())
+
+
+def checksum_file(path):
+    """
+    Compute a digest of the contents of a file.
+
+    Args:
+        path (str): Path of the file.
+
+    Returns:
+        str: SHA-1 digest in the form of ``'sha1:<hex>'``.
+    """
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(_CHUNK_SIZE)
+            if not chunk:
+                break
+            h.update(chunk)
+    return 'sha1:' + h.hexdigest()
@@ -0,0 +1,346 @@
+# -*- coding: utf-8 -*-
+"""
+Hash table of :class:`word_embedding_loader.vocabulary.Vocabulary` in C.
+
+:class:`HashTable` finds single words in the table of a vocabulary, and
+:class:`Builder` builds the words, offsets and table of a vocabulary while a
+loader reads words, without a ``dict`` in between.
+"""
+from __future__ import absolute_import, division, print_function, \
+    unicode_literals
+
+cimport cython
+from libc.stdint cimport int32_t, int64_t, uint32_t
+from libc.stdlib cimport malloc, realloc, free
+from libc.string cimport memcmp, memcpy
+from cpython.bytes cimport PyBytes_AS_STRING, PyBytes_GET_SIZE, \
+    PyBytes_FromStringAndSize
+import numpy as np
+cimport numpy as np
+
+from word_embedding_loader import parse_warn
+
+
+cdef uint32_t _CRC32_TABLE[256]
+
+
+cdef _init_crc32_table():
+    # Same polynomial as zlib and word_embedding_loader.vocabulary
+    cdef uint32_t c
+    cdef int i, k
+    for i in range(256):
+        c = i
+        for k in range(8):
+            c = (c >> 1) ^ 0xEDB88320 if c & 1 else c >> 1
+        _CRC32_TABLE[i] = c
+
+
+_init_crc32_table()
+
+
+cdef inline uint32_t _crc32(const unsigned char *p, Py_ssize_t n) nogil:
+    cdef uint32_t c = ~(<uint32_t>0)
+    cdef Py_ssize_t i
+    for i in range(n):
+        c = _CRC32_TABLE[(c ^ p[i]) & 0xFF] ^ (c >> 8)
+    return ~c
+
+
+def crc32_words(const unsigned char[::1] tokens, const int64_t[::1] offsets):
+    """
+    CRC-32 of each word; see
+    :func:`word_embedding_loader.vocabulary.hash_words`.
+    """
+    cdef Py_ssize_t i, n = offsets.shape[0] - 1
+    cdef np.ndarray[np.uint32_t, ndim=1] ret = np.empty(max(n, 0),
+                                                         dtype=np.uint32)
+    cdef const unsigned char *p = &tokens[0] if tokens.shape[0] > 0 else NULL
+    for i in range(n):
+        if offsets[i] < 0 or offsets[i] > offsets[i + 1] or \
+                offsets[i + 1] > tokens.shape[0]:
+            raise IndexError(b'offsets out of bounds')
+        ret[i] = _crc32(p + offsets[i], offsets[i + 1] - offsets[i])
+    return ret
+
+
+@cython.auto_pickle(False)
+cdef class HashTable:
+    """
+    Base class of :class:`~word_embedding_loader.vocabulary.Vocabulary` that
+    finds words in the hash table built by
+    :func:`~word_embedding_loader.vocabulary.build_table`, so that
+    ``vocab[word]`` and ``word in vocab`` do not run Python code.
+    """
+    # Keep the buffers alive while the pointers are in use
+    cdef const unsigned char[::1] _token_buf
+    cdef const int64_t[::1] _offset_buf
+    cdef object _table_buf
+    cdef const unsigned char *tokens
+    cdef const int64_t *offsets
+    cdef const int32_t *table32
+    cdef const int64_t *table64
+    cdef int64_t mask
+
+    def _set_table(self, tokens, offsets, table):
+        """
+        Args:
+            tokens (bytes or numpy.ndarray): Concatenated words.
+            offsets (numpy.ndarray): Native ``int64`` offsets of words.
+            table (numpy.ndarray): Native ``int32`` or ``int64`` hash table.
+        """
+        cdef const int32_t[::1] table32
+        cdef const int64_t[::1] table64
+        self._token_buf = tokens
+        self._offset_buf = offsets
+        self._table_buf = table
+        self.tokens = (&self._token_buf[0] if self._token_buf.shape[0] > 0
+                       else NULL)
+        self.offsets = &self._offset_buf[0]
+        self.table32 = NULL
+        self.table64 = NULL
+        if table.dtype.itemsize == 4:
+            table32 = table
+            self.table32 = &table32[0]
+        else:
+            table64 = table
+            self.table64 = &table64[0]
+        self.mask = len(table) - 1
+
+    cdef int64_t _lookup(self, word):
+        cdef const unsigned char *p
+        cdef Py_ssize_t n
+        cdef int64_t slot, idx, start
+        if not isinstance(word, bytes) or (self.table32 == NULL and
+                                           self.table64 == NULL):
+            return -1
+        p = <const unsigned char*>PyBytes_AS_STRING(word)
+        n = PyBytes_GET_SIZE(word)
+        slot = _crc32(p, n) & self.mask
+        while True:
+            if self.table32 != NULL:
+                idx = self.table32[slot]
+            else:
+                idx = self.table64[slot]
+            if idx < 0:
+                return -1
+            start = self.offsets[idx]
+            if self.offsets[idx + 1] - start == n and (
+                    n == 0 or memcmp(self.tokens + start, p, n) == 0):
+                return idx
+            slot = (slot + 1) & self.mask
+
+    def _words(self, Py_ssize_t start, Py_ssize_t stop):
+        # Words of indices start, ..., stop - 1, which must be valid
+        cdef Py_ssize_t i
+        ret = []
+        for i in range(start, stop):
+            ret.append(PyBytes_FromStringAndSize(
+                <const char*>self.tokens + self.offsets[i],
+                self.offsets[i + 1] - self.offsets[i]))
+        return ret
+
+    def __getitem__(self, word):
+        cdef int64_t idx = self._lookup(word)
+        if idx < 0:
+            raise KeyError(word)
+        return idx
+
+    def __contains__(self, word):
+        return self._lookup(word) >= 0
+
+
+cdef class Builder:
+    """
+    Vocabulary that grows as words are added. Words are kept in the layout of
+    :class:`~word_embedding_loader.vocabulary.Vocabulary`, and the hash table
+    always has :func:`~word_embedding_loader.vocabulary.table_size` slots.
+    """
+    cdef unsigned char *tokens
+    cdef int64_t *offsets
+    cdef int64_t *table
+    # Hash of the word in each slot, compared before the words themselves
+    cdef uint32_t *hashes
+    cdef Py_ssize_t n_tokens
+    cdef Py_ssize_t cap_tokens
+    cdef int64_t n
+    cdef int64_t cap_words
+    cdef int64_t mask
+
+    def __cinit__(self):
+        self.cap_tokens = 1 << 12
+        self.cap_words = 1 << 10
+        self.tokens = <unsigned char*>malloc(self.cap_tokens)
+        self.offsets = <int64_t*>malloc((self.cap_words + 1) * sizeof(int64_t))
+        self.table = <int64_t*>malloc(8 * sizeof(int64_t))
+        self.hashes = <uint32_t*>malloc(8 * sizeof(uint32_t))
+        if (self.tokens == NULL or self.offsets == NULL or
+                self.table == NULL or self.hashes == NULL):
+            raise MemoryError()
+        self.n_tokens = 0
+        self.n = 0
+        self.offsets[0] = 0
+        self.mask = 7
+        for i in range(8):
+            self.table[i] = -1
+
+    def __dealloc__(self):
+        free(self.tokens)
+        free(self.offsets)
+        free(self.table)
+        free(self.hashes)
+
+    def __len__(self):
+        return self.n
+
+    cdef int64_t _probe(self, const unsigned char *p, Py_ssize_t n,
+                        uint32_t h):
+        # Slot holding the word, or the empty slot where it belongs
+        cdef int64_t slot = h & self.mask
+        cdef int64_t idx, start
+        while True:
+            idx = self.table[slot]
+            if idx < 0:
+                return slot
+            if self.hashes[slot] == h:
+                start = self.offsets[idx]
+                if self.offsets[idx + 1] - start == n and (
+                        n == 0 or memcmp(self.tokens + start, p, n) == 0):
+                    return slot
+            slot = (slot + 1) & self.mask
+
+    cdef _grow_table(self):
+        cdef int64_t size = (self.mask + 1) * 2
+        cdef int64_t old, slot
+        cdef int64_t *table = <int64_t*>malloc(size * sizeof(int64_t))
+        cdef uint32_t *hashes = <uint32_t*>malloc(size * sizeof(uint32_t))
+        if table == NULL or hashes == NULL:
+            free(table)
+            free(hashes)
+            raise MemoryError()
+        for slot in range(size):
+            table[slot] = -1
+        for old in range(self.mask + 1):
+            if self.table[old] < 0:
+                continue
+            slot = self.hashes[old] & (size - 1)
+            while table[slot] >= 0:
+                slot = (slot + 1) & (size - 1)
+            table[slot] = self.table[old]
+            hashes[slot] = self.hashes[old]
+        free(self.table)
+        free(self.hashes)
+        self.table = table
+        self.hashes = hashes
+        self.mask = size - 1
+
+    cdef _reserve(self, Py_ssize_t n_bytes):
+        cdef Py_ssize_t cap
+        cdef void *p
+        if self.n_tokens + n_bytes > self.cap_tokens:
+            cap = max(self.cap_tokens * 2, self.n_tokens + n_bytes)
+            p = realloc(self.tokens, cap)
+            if p == NULL:
+                raise MemoryError()
+            self.tokens = <unsigned char*>p
+            self.cap_tokens = cap
+        if self.n == self.cap_words:
+            p = realloc(self.offsets, (self.cap_words * 2 + 1) * sizeof(int64_t))
+            if p == NULL:
+                raise MemoryError()
+            self.offsets = <int64_t*>p
+            self.cap_words *= 2
+
+    def add(self, bytes word not None):
+        """
+        Add ``word`` unless it is already known.
+
+        Returns:
+            int: Index of the new word, or ``-1`` if it is a duplicate.
+        """
+        return self._add(word)
+
+    cdef int64_t _add(self, bytes word) except -2:
+        cdef const unsigned char *p = \
+            <const unsigned char*>PyBytes_AS_STRING(word)
+        cdef Py_ssize_t n = PyBytes_GET_SIZE(word)
+        cdef uint32_t h = _crc32(p, n)
+        cdef int64_t slot = self._probe(p, n, h)
+        cdef int64_t idx = self.n
+        if self.table[slot] >= 0:
+            return -1
+        self._reserve(n)
+        memcpy(self.tokens + self.n_tokens, p, n)
+        self.n_tokens += n
+        self.offsets[idx + 1] = self.n_tokens
+        self.table[slot] = idx
+        self.hashes[slot] = h
+        self.n += 1
+        if 2 * self.n > self.mask + 1:
+            self._grow_table()
+        return idx
+
+    def add_tokens(self, tokens, max_vocab=None):
+        """
+        Add tokens in order of appearance, skipping (and warning about)
+        duplicates, until the vocabulary holds ``max_vocab`` words.
+
+        Args:
+            tokens (list): Tokens (``bytes``) of a chunk.
+            max_vocab (int): Maximum number of words.
+
+        Returns:
+            numpy.ndarray: ``int64`` positions in ``tokens`` of the newly
+            added words.
+            int: Number of tokens consumed. It is less than ``len(tokens)``
+            only when ``max_vocab`` has been reached.
+        """
+        cdef int64_t limit = -1 if max_vocab is None else max_vocab
+        cdef Py_ssize_t i = 0
+        cdef Py_ssize_t k = 0
+        cdef bytes token
+        cdef np.ndarray[np.int64_t, ndim=1] keep = np.empty(len(tokens),
+                                                            dtype=np.int64)
+        for token in tokens:
+            if limit >= 0 and self.n >= limit:
+                break
+            if token is None:
+                raise TypeError(b'Tokens must be bytes')
+            if self._add(token) < 0:
+                parse_warn(b'Duplicated vocabulary ' + token)
+            else:
+                keep[k] = i
+                k += 1
+            i += 1
+        return keep[:k], i
+
+    def find(self, bytes word not None):
+        """
+        Index of ``word``, or ``-1`` if it is not found.
+        """
+        cdef const unsigned char *p = \
+            <const unsigned char*>PyBytes_AS_STRING(word)
+        cdef Py_ssize_t n = PyBytes_GET_SIZE(word)
+        cdef int64_t slot = self._probe(p, n, _crc32(p, n))
+        return self.table[slot]
+
+    def arrays(self, table_dtype):
+        """
+        Copy the words, offsets and hash table.
+
+        Args:
+            table_dtype (numpy.dtype): Element data type of the table.
+
+        Returns:
+            bytes: Concatenated words.
+            numpy.ndarray: ``int64`` offsets of words.
+            numpy.ndarray: Hash table.
+        """
+        cdef np.ndarray offsets = np.empty(self.n + 1, dtype=np.int64)
+        cdef np.ndarray table = np.empty(self.mask + 1, dtype=np.int64)
+        memcpy(np.PyArray_DATA(offsets), self.offsets,
+               (self.n + 1) * sizeof(int64_t))
+        memcpy(np.PyArray_DATA(table), self.table,
+               (self.mask + 1) * sizeof(int64_t))
+        tokens = PyBytes_FromStringAndSize(<const char*>self.tokens,
+                                           self.n_tokens)
+        return tokens, offsets, table.astype(table_dtype)
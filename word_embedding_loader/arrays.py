@@ -0,0 +1,392 @@
+# -*- coding: utf-8 -*-
+"""
+Array-like containers for word embedding vectors that are not held in memory
+as a single :class:`numpy.ndarray`. They implement the part of the ndarray
+interface that is used throughout this package (``shape``, ``dtype``,
+``len()`` and row indexing) and can be converted with :func:`numpy.asarray`.
+"""
+
+from __future__ import absolute_import, division, print_function, \
+    unicode_literals
+
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import six
+
+
+__all__ = ["RowVectors", "MappedVectors", "QuantizedVectors", "LazyVectors",
+           "map_rows", "quantize_rows"]
+
+
+# Approximate number of bytes of temporary index arrays used when gathering
+_GATHER_BYTES = 1 << 22
+
+# Largest code of 8 bit quantization
+_MAX_CODE = 255
+
+
+class RowVectors(object):
+    """
+    Base class of array-like word embedding vectors. Subclasses only need to
+    implement :meth:`_take`.
+
+    Args:
+        shape (tuple): ``(vocabulary size, feature dimension)``.
+        dtype (numpy.dtype): Element data type of the returned rows.
+
+    Attributes:
+        shape (tuple): ``(vocabulary size, feature dimension)``.
+        dtype (numpy.dtype): Element data type of the returned rows.
+    """
+    ndim = 2
+
+    def __init__(self, shape, dtype):
+        self.shape = tuple(int(s) for s in shape)
+        self.dtype = np.dtype(dtype)
+
+    def __len__(self):
+        return self.shape[0]
+
+    def _take(self, rows):
+        """
+        Gather rows.
+
+        Args:
+            rows (numpy.ndarray): 1-D array of non-negative row indices.
+
+        Returns:
+            numpy.ndarray: Array of shape ``(len(rows), feature dimension)``.
+        """
+        raise NotImplementedError()
+
+    def _normalize_rows(self, key):
+        n = len(self)
+        if isinstance(key, slice):
+            return np.arange(*key.indices(n))
+        rows = np.asarray(key)
+        if rows.dtype == np.bool_:
+            if rows.shape != (n, ):
+                raise IndexError(b'boolean index did not match')
+            return np.flatnonzero(rows)
+        if rows.size == 0:
+            return rows.astype(np.int64)
+        if not np.issubdtype(rows.dtype, np.integer):
+            raise IndexError(
+                b'only integers, slices and integer or boolean arrays are '
+                b'valid indices')
+        rows = np.where(rows < 0, rows + n, rows)
+        if rows.min() < 0 or rows.max() >= n:
+            raise IndexError(b'index out of bounds')
+        return rows
+
+    def __getitem__(self, key):
+        cols = None
+        if isinstance(key, tuple):
+            if len(key) > 2:
+                raise IndexError(b'too many indices')
+            if len(key) == 2:
+                cols = key[1]
+            key = key[0]
+        if isinstance(key, six.integer_types + (np.integer, )):
+            ret = self._take(self._normalize_rows(np.array([key])))[0]
+        else:
+            rows = self._normalize_rows(key)
+            ret = self._take(rows.ravel()).reshape(
+                rows.shape + (self.shape[1], ))
+        if cols is not None:
+            ret = ret[..., cols]
+        return ret
+
+    def __iter__(self):
+        for i in six.moves.range(len(self)):
+            yield self[i]
+
+    def __array__(self, dtype=None, copy=None):
+        arr = self[:]
+        if dtype is not None:
+            arr = arr.astype(dtype, copy=False)
+        return arr
+
+
+class MappedVectors(RowVectors):
+    """
+    Vectors that are stored at arbitrary byte offsets of a buffer (typically
+    a :class:`numpy.memmap` of an embedding file). Rows are gathered (and
+    converted to ``dtype``) when they are accessed.
+
+    Args:
+        buf (numpy.ndarray): 1-D ``uint8`` array holding the vectors.
+        offsets (numpy.ndarray): Byte offset of each row in ``buf``.
+        size (int): Feature dimension.
+        dtype (numpy.dtype): Element data type of the returned rows.
+        file_dtype (numpy.dtype): Element data type of the rows in ``buf``.
+    """
+    def __init__(self, buf, offsets, size, dtype=np.float32,
+                 file_dtype=np.float32):
+        super(MappedVectors, self).__init__((len(offsets), size), dtype)
+        self.file_dtype = np.dtype(file_dtype)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self._buf = buf
+        self._cols = np.arange(size * self.file_dtype.itemsize, dtype=np.int64)
+
+    def _take(self, rows):
+        offsets = self.offsets[rows]
+        out = np.empty((len(rows), self.shape[1]), dtype=self.dtype)
+        step = max(1, _GATHER_BYTES // max(1, 8 * len(self._cols)))
+        for start in six.moves.range(0, len(rows), step):
+            idx = offsets[start:start + step, None] + self._cols
+            out[start:start + step] = self._buf[idx].view(self.file_dtype)
+        return out
+
+
+def quantize_rows(arr, scale=None, offset=None):
+    """
+    Quantize values to 8 bit codes by ``value = code * scale + offset``.
+
+    Args:
+        arr (numpy.ndarray): Vectors in shape of
+            ``(number of rows, feature dimension)``.
+        scale (numpy.ndarray or None): ``float32`` scale of each row. If
+            ``None``, the scale and the offset of each row are chosen so that
+            the codes span its minimum to its maximum.
+        offset (numpy.ndarray or None): ``float32`` offset of each row. It
+            must be given with ``scale``.
+
+    Returns:
+        numpy.ndarray: ``uint8`` codes in the shape of ``arr``.
+        numpy.ndarray: Scale of each row.
+        numpy.ndarray: Offset of each row.
+    """
+    arr = np.asarray(arr, dtype=np.float32)
+    if scale is None:
+        if arr.shape[1] == 0:
+            offset = np.zeros(len(arr), dtype=np.float32)
+            scale = np.ones(len(arr), dtype=np.float32)
+        else:
+            offset = arr.min(axis=1)
+            scale = (arr.max(axis=1) - offset) / _MAX_CODE
+            # Constant rows are all code 0
+            scale[scale == 0] = 1
+    codes = np.rint((arr - offset[:, None]) / scale[:, None])
+    np.clip(codes, 0, _MAX_CODE, out=codes)
+    return codes.astype(np.uint8), scale, offset
+
+
+class QuantizedVectors(RowVectors):
+    """
+    Vectors quantized to 8 bit codes with a scale and an offset for each
+    row, which take a quarter of the memory of ``float32`` vectors. Rows are
+    dequantized to ``dtype`` when they are accessed. Create one with
+    :meth:`quantize` or
+    :func:`~word_embedding_loader.word_embedding.WordEmbedding.quantize`.
+
+    Args:
+        codes (numpy.ndarray): ``uint8`` codes in shape of
+            ``(vocabulary size, feature dimension)``.
+        scale (numpy.ndarray): ``float32`` scale of each row.
+        offset (numpy.ndarray): ``float32`` offset of each row. Value ``j`` of
+            row ``i`` is ``codes[i, j] * scale[i] + offset[i]``.
+        dtype (numpy.dtype): Element data type of the returned rows.
+    """
+    def __init__(self, codes, scale, offset, dtype=np.float32):
+        super(QuantizedVectors, self).__init__(codes.shape, dtype)
+        self.codes = codes
+        self.scale = scale
+        self.offset = offset
+
+    @classmethod
+    def quantize(cls, arr, per_row=True, dtype=None):
+        """
+        Quantize vectors. Rows are quantized in blocks, so that ``arr`` can be
+        a memory-mapped file or a :class:`RowVectors`.
+
+        Args:
+            arr (numpy.ndarray or RowVectors): Vectors to quantize.
+            per_row (bool): Choose the scale and the offset of each row from
+                its own range. Otherwise, all the rows share those of the
+                range of the whole array.
+            dtype (numpy.dtype): Element data type of the returned rows. It
+                is ``arr.dtype`` if ``None``.
+
+        Returns:
+            QuantizedVectors
+        """
+        n, size = arr.shape
+        codes = np.empty((n, size), dtype=np.uint8)
+        scale = offset = None
+        step = max(1, _GATHER_BYTES // max(1, 4 * size))
+        if not per_row:
+            low, high = np.inf, -np.inf
+            for start in six.moves.range(0, n, step):
+                block = np.asarray(arr[start:start + step])
+                if block.size > 0:
+                    low = min(low, float(block.min()))
+                    high = max(high, float(block.max()))
+            if low > high:
+                low = high = 0
+            scale = np.full(n, (high - low) / _MAX_CODE or 1, dtype=np.float32)
+            offset = np.full(n, low, dtype=np.float32)
+        else:
+            scale = np.empty(n, dtype=np.float32)
+            offset = np.empty(n, dtype=np.float32)
+        for start in six.moves.range(0, n, step):
+            end = min(n, start + step)
+            if per_row:
+                codes[start:end], scale[start:end], offset[start:end] = \
+                    quantize_rows(arr[start:end])
+            else:
+                codes[start:end] = quantize_rows(
+                    arr[start:end], scale[start:end], offset[start:end])[0]
+        return cls(codes, scale, offset,
+                   arr.dtype if dtype is None else dtype)
+
+    @property
+    def nbytes(self):
+        """
+        Number of bytes of the codes, scales and offsets.
+
+        Returns:
+            int
+        """
+        return self.codes.nbytes + self.scale.nbytes + self.offset.nbytes
+
+    def select(self, rows):
+        """
+        Select rows without dequantizing them.
+
+        Args:
+            rows (slice or numpy.ndarray): Rows to select.
+
+        Returns:
+            QuantizedVectors: Selected rows. A slice shares memory with this
+            object.
+        """
+        return QuantizedVectors(self.codes[rows], self.scale[rows],
+                                self.offset[rows], self.dtype)
+
+    def _take(self, rows):
+        out = self.codes[rows].astype(self.dtype)
+        out *= self.scale[rows, None]
+        out += self.offset[rows, None]
+        return out
+
+
+class LazyVectors(RowVectors):
+    """
+    Vectors that are parsed from a file when they are first accessed. Only
+    the position of each row is held in memory, together with a cache of the
+    most recently used rows, so memory use follows the rows that are
+    actually accessed. Get one from
+    :func:`~word_embedding_loader.word_embedding.WordEmbedding.load` with
+    ``lazy=True``.
+
+    Args:
+        path (str): Path of the file.
+        offsets (numpy.ndarray): Position of each row in the file, as returned
+            by ``scan_offsets`` of the loader of the file.
+        size (int): Feature dimension.
+        read_rows (callable): ``read_rows(fin, offsets, size, dtype)`` that
+            parses rows at given positions (``read_rows_at`` of the loader).
+        dtype (numpy.dtype): Element data type of the returned rows.
+        cache_rows (int): Maximum number of rows in the cache. Least recently
+            used rows are dropped first. Nothing is cached if ``0``.
+    """
+    def __init__(self, path, offsets, size, read_rows, dtype=np.float32,
+                 cache_rows=0):
+        super(LazyVectors, self).__init__((len(offsets), size), dtype)
+        self.path = path
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.cache_rows = cache_rows
+        self._read_rows = read_rows
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._file = None
+
+    def _read(self, rows):
+        # Read rows (without duplicates) in the order of the file
+        order = np.argsort(self.offsets[rows], kind='mergesort')
+        if self._file is None:
+            self._file = open(self.path, 'rb')
+        arr = np.empty((len(rows), self.shape[1]), dtype=self.dtype)
+        arr[order] = self._read_rows(self._file, self.offsets[rows[order]],
+                                     self.shape[1], self.dtype)
+        return arr
+
+    def _take(self, rows):
+        out = np.empty((len(rows), self.shape[1]), dtype=self.dtype)
+        with self._lock:
+            cache = self._cache
+            missing = []
+            for i, row in enumerate(rows.tolist()):
+                vec = cache.pop(row, None)
+                if vec is None:
+                    missing.append(i)
+                else:
+                    # Move to the most recently used end
+                    cache[row] = vec
+                    out[i] = vec
+            if not missing:
+                return out
+            missing = np.array(missing, dtype=np.int64)
+            new, inverse = np.unique(rows[missing], return_inverse=True)
+            arr = self._read(new)
+            out[missing] = arr[inverse]
+            start = max(0, len(new) - self.cache_rows)
+            for row, vec in six.moves.zip(new[start:].tolist(), arr[start:]):
+                cache[row] = vec.copy()
+            while len(cache) > self.cache_rows:
+                cache.popitem(last=False)
+        return out
+
+    def close(self):
+        """
+        Close the file. It is opened again when rows are accessed.
+        """
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def __getstate__(self):
+        # Neither the file nor the lock can be pickled
+        state = self.__dict__.copy()
+        state.update(_cache=OrderedDict(), _lock=None, _file=None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+
+def map_rows(buf, offsets, size, dtype=np.float32, file_dtype=np.float32):
+    """
+    Expose rows stored in ``buf`` without copying them.
+
+    Args:
+        buf (numpy.ndarray): 1-D ``uint8`` array holding the vectors.
+        offsets (numpy.ndarray): Byte offset of each row in ``buf``.
+        size (int): Feature dimension.
+        dtype (numpy.dtype): Element data type of the returned rows.
+        file_dtype (numpy.dtype): Element data type of the rows in ``buf``.
+
+    Returns:
+        numpy.ndarray or MappedVectors: A (strided) view of ``buf`` if the
+        rows are evenly spaced and no conversion is needed. Otherwise a
+        :class:`MappedVectors` that gathers rows lazily.
+    """
+    file_dtype = np.dtype(file_dtype)
+    offsets = np.asarray(offsets, dtype=np.int64)
+    if np.dtype(dtype) == file_dtype:
+        if len(offsets) == 0:
+            return np.empty((0, size), dtype=file_dtype)
+        stride = file_dtype.itemsize * size
+        if len(offsets) > 1:
+            steps = np.diff(offsets)
+            stride = int(steps[0])
+        if stride > 0 and (len(offsets) == 1 or np.all(steps == stride)):
+            return np.ndarray((len(offsets), size), dtype=file_dtype,
+                              buffer=buf, offset=int(offsets[0]),
+                              strides=(stride, file_dtype.itemsize))
+    return MappedVectors(buf, offsets, size, dtype, file_dtype)
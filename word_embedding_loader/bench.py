@@ -0,0 +1,444 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmarks of loading, saving and conversion of word embedding files.
+
+Synthetic files of every format are generated for each combination of
+vocabulary size and feature dimension, then each operation is timed in a
+fresh process, so that its peak resident memory is measured on its own:
+
+* ``load``: :func:`~word_embedding_loader.word_embedding.WordEmbedding.load`.
+* ``load_vocab``: ``load`` with a vocabulary file holding a tenth of the
+  words.
+* ``save``: :func:`~word_embedding_loader.word_embedding.WordEmbedding.save`
+  of vectors held in memory.
+* ``convert``: ``word-embedding-loader convert`` of each file to ``wel``, and
+  of the ``wel`` file to binary word2vec.
+
+Results are written as JSON with the time, throughput (rows/s and MB/s of
+the file read or written) and peak resident memory of each case. Pass the
+JSON of a previous run to ``--compare`` to see the change of each case, e.g.
+between two commits:
+
+.. code:: bash
+
+   python -m word_embedding_loader.bench -o before.json
+   git checkout other-branch
+   python -m word_embedding_loader.bench --compare before.json
+
+The default sizes are small enough to run in a minute or so; use e.g.
+``--sizes 10000,100000,1000000,2000000 --dims 100,300`` for a full run, and
+``--workdir`` to reuse the generated files between runs. Files are read
+right after they are generated or reused, so loads are timed with a warm page
+cache.
+"""
+
+from __future__ import absolute_import, division, print_function, \
+    unicode_literals
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from collections import OrderedDict
+
+import numpy as np
+import six
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+from word_embedding_loader import _version
+from word_embedding_loader import word_embedding
+from word_embedding_loader.vocabulary import Vocabulary
+
+
+__all__ = ["FORMATS", "OPERATIONS", "generate", "make_cases", "run_case",
+           "run", "compare"]
+
+
+# Name of each format (as in the command line interface) mapped to the
+# ``format``, ``binary`` arguments and the file extension
+FORMATS = OrderedDict((
+    ('glove', ('glove', False, '.txt')),
+    ('word2vec-text', ('word2vec', False, '.txt')),
+    ('word2vec-binary', ('word2vec', True, '.bin')),
+    ('wel', ('wel', False, '.wel')),
+))
+
+OPERATIONS = ('load', 'load_vocab', 'save', 'convert')
+
+# Number of rows generated at once
+_BATCH_ROWS = 10000
+
+# Digits after the decimal point of generated text files, as in GloVe files
+_PRECISION = 6
+
+# One word in _VOCAB_STEP is in the vocabulary file of load_vocab
+_VOCAB_STEP = 10
+
+
+def _word(i):
+    return ('w%d' % i).encode('ascii')
+
+
+def _batches(words, size, seed=0):
+    rs = np.random.RandomState(seed)
+    for start in six.moves.range(0, words, _BATCH_ROWS):
+        n = min(_BATCH_ROWS, words - start)
+        yield ([_word(i) for i in six.moves.range(start, start + n)],
+               rs.standard_normal((n, size)).astype(np.float32))
+
+
+def _file_name(fmt, words, size):
+    return '%s-%dx%d%s' % (fmt, words, size, FORMATS[fmt][2])
+
+
+def generate(path, fmt, words, size, seed=0):
+    """
+    Write a file of random vectors.
+
+    Args:
+        path (str): Path of the file.
+        fmt (str): Key of :data:`FORMATS`.
+        words (int): Vocabulary size. Word ``i`` is ``b'w<i>'``.
+        size (int): Feature dimension.
+        seed (int): Seed of the random values.
+    """
+    mod = word_embedding._select_module(*FORMATS[fmt][:2])
+    options = {}
+    if mod in (word_embedding._glove, word_embedding._word2vec_text):
+        options['precision'] = _PRECISION
+    with open(path, mode='wb') as f:
+        mod.saver.save_rows(f, _batches(words, size, seed), words, size,
+                            **options)
+
+
+def _write_vocab(path, words):
+    # Vocabulary file as created by word2vec -save-vocab, in descending order
+    # of frequency
+    with open(path, mode='wb') as f:
+        for i in six.moves.range(0, words, _VOCAB_STEP):
+            f.write(_word(i) + b' ' + str(words - i).encode('ascii') + b'\n')
+
+
+def make_cases(sizes, dims, formats=None, operations=None):
+    """
+    List the cases to run.
+
+    Args:
+        sizes (list): Vocabulary sizes.
+        dims (list): Feature dimensions.
+        formats (list or None): Keys of :data:`FORMATS`. All if ``None``.
+        operations (list or None): Items of :data:`OPERATIONS`. All if
+            ``None``.
+
+    Returns:
+        list: Each case is a ``dict`` with ``operation``, ``format`` (the
+        input format, or the output format for ``save``), ``to_format`` (for
+        ``convert``), ``words`` and ``size``.
+    """
+    formats = list(FORMATS) if formats is None else formats
+    operations = OPERATIONS if operations is None else operations
+    cases = []
+    for words in sizes:
+        for size in dims:
+            for op in operations:
+                for fmt in formats:
+                    case = OrderedDict((
+                        ('operation', op), ('format', fmt),
+                        ('words', words), ('size', size)))
+                    if op == 'convert':
+                        case['to_format'] = \
+                            'word2vec-binary' if fmt == 'wel' else 'wel'
+                    cases.append(case)
+    return cases
+
+
+def case_name(case):
+    """
+    Short description of a case, which identifies it in a run.
+    """
+    fmt = case['format']
+    if 'to_format' in case:
+        fmt += '->' + case['to_format']
+    return '%s %s %dx%d' % (case['operation'], fmt, case['words'],
+                            case['size'])
+
+
+def _peak_rss():
+    # ru_maxrss is carried over from the parent process across exec on
+    # Linux, thus prefer the high water mark of the current address space
+    try:
+        with open('/proc/self/status', 'rb') as f:
+            for line in f:
+                if line.startswith(b'VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except (IOError, OSError, ValueError):
+        pass
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+
+def run_case(case, workdir):
+    """
+    Run a case in the current process. The input files must exist in
+    ``workdir`` (see :func:`run`).
+
+    Args:
+        case (dict): Case created by :func:`make_cases`.
+        workdir (str): Directory of the input files, where output files are
+            written too.
+
+    Returns:
+        dict: ``seconds``, ``bytes`` (size of the file read or written),
+        ``peak_rss`` (peak resident memory of the process in bytes, or
+        ``None`` if it is not available) and ``base_rss`` (peak resident
+        memory before the timed operation, i.e. of the imports and of the
+        vectors to save).
+    """
+    op = case['operation']
+    words, size = case['words'], case['size']
+    fmt = case['format']
+    src = os.path.join(workdir, _file_name(fmt, words, size))
+    out = os.path.join(workdir, 'out')
+    if op == 'save':
+        arr = np.empty((words, size), dtype=np.float32)
+        tokens = []
+        for batch_tokens, batch in _batches(words, size):
+            arr[len(tokens):len(tokens) + len(batch)] = batch
+            tokens.extend(batch_tokens)
+        obj = word_embedding.WordEmbedding(arr, Vocabulary.from_words(tokens))
+        del tokens
+        base = _peak_rss()
+        start = time.time()
+        obj.save(out, *FORMATS[fmt][:2])
+        seconds = time.time() - start
+        nbytes = os.path.getsize(out)
+    elif op == 'convert':
+        from word_embedding_loader import cli
+        args = ['convert', '-t', case['to_format'], '-f', fmt, src, out]
+        base = _peak_rss()
+        start = time.time()
+        cli.cli.main(args, standalone_mode=False)
+        seconds = time.time() - start
+        nbytes = os.path.getsize(src)
+    else:
+        vocab = None
+        if op == 'load_vocab':
+            vocab = os.path.join(workdir, 'vocab-%d.txt' % words)
+        base = _peak_rss()
+        start = time.time()
+        word_embedding.WordEmbedding.load(
+            src, vocab=vocab, format=FORMATS[fmt][0], binary=FORMATS[fmt][1])
+        seconds = time.time() - start
+        nbytes = os.path.getsize(src)
+    if os.path.exists(out):
+        os.remove(out)
+    return {'seconds': seconds, 'bytes': nbytes, 'peak_rss': _peak_rss(),
+            'base_rss': base}
+
+
+def _run_child(case, workdir):
+    # Run a case in a fresh process, so that the peak memory is its own
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(
+        [root] + [p for p in [env.get('PYTHONPATH')] if p])
+    out = subprocess.check_output(
+        [sys.executable, '-m', 'word_embedding_loader.bench',
+         '--workdir', workdir, '--case', json.dumps(case)], env=env)
+    return json.loads(out.decode('utf-8').strip().splitlines()[-1])
+
+
+def _prepare(cases, workdir):
+    for case in cases:
+        words, size = case['words'], case['size']
+        names = [case['format']] if case['operation'] != 'save' else []
+        for fmt in names:
+            path = os.path.join(workdir, _file_name(fmt, words, size))
+            if not os.path.exists(path):
+                generate(path, fmt, words, size)
+        path = os.path.join(workdir, 'vocab-%d.txt' % words)
+        if case['operation'] == 'load_vocab' and not os.path.exists(path):
+            _write_vocab(path, words)
+
+
+def _metadata():
+    meta = OrderedDict((
+        ('version', _version.__version__),
+        ('commit', None),
+        ('python', platform.python_version()),
+        ('numpy', np.__version__),
+        ('platform', platform.platform()),
+        ('time', time.strftime('%Y-%m-%dT%H:%M:%S')),
+    ))
+    try:
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        with open(os.devnull, 'w') as devnull:
+            meta['commit'] = subprocess.check_output(
+                ['git', 'rev-parse', 'HEAD'], cwd=root,
+                stderr=devnull).decode('ascii').strip()
+    except (OSError, subprocess.CalledProcessError):
+        pass
+    return meta
+
+
+def run(cases, workdir=None, repeat=1, log=None):
+    """
+    Run cases, each in a fresh process.
+
+    Args:
+        cases (list): Cases created by :func:`make_cases`.
+        workdir (str or None): Directory of the generated files. Existing
+            files are reused. A temporary directory is used (and removed) if
+            ``None``.
+        repeat (int): Number of times each case is run. The shortest time
+            and the largest peak memory are reported.
+        log (callable or None): Called with the result of each case as it
+            finishes.
+
+    Returns:
+        dict: ``meta`` (versions, commit and platform) and ``results``, a
+        list of cases updated with ``seconds``, ``times``,
+        ``rows_per_second``, ``mb_per_second``, ``peak_rss`` and
+        ``base_rss`` (see :func:`run_case`).
+    """
+    tmp = None
+    if workdir is None:
+        workdir = tmp = tempfile.mkdtemp(prefix='wel-bench-')
+    elif not os.path.isdir(workdir):
+        os.makedirs(workdir)
+    try:
+        _prepare(cases, workdir)
+        results = []
+        for case in cases:
+            runs = [_run_child(case, workdir) for _ in six.moves.range(repeat)]
+            seconds = min(r['seconds'] for r in runs)
+            rss = [r['peak_rss'] for r in runs if r['peak_rss'] is not None]
+            base = [r['base_rss'] for r in runs if r['base_rss'] is not None]
+            result = OrderedDict(case)
+            result.update((
+                ('seconds', seconds),
+                ('times', [r['seconds'] for r in runs]),
+                ('rows_per_second', case['words'] / max(seconds, 1e-9)),
+                ('mb_per_second',
+                 runs[0]['bytes'] / 1e6 / max(seconds, 1e-9)),
+                ('peak_rss', max(rss) if rss else None),
+                ('base_rss', min(base) if base else None),
+            ))
+            results.append(result)
+            if log is not None:
+                log(result)
+    finally:
+        if tmp is not None:
+            shutil.rmtree(tmp, ignore_errors=True)
+    return OrderedDict((('meta', _metadata()), ('results', results)))
+
+
+def compare(results, baseline):
+    """
+    Compare times with those of a previous run.
+
+    Args:
+        results (dict): Result of :func:`run`.
+        baseline (dict): Result of a previous :func:`run`.
+
+    Returns:
+        list: ``(name, seconds, baseline seconds, ratio)`` for each case that
+        is in both runs. ``ratio`` is ``seconds / baseline seconds``, thus
+        larger than 1 for regressions.
+    """
+    before = dict((case_name(r), r['seconds']) for r in baseline['results'])
+    rows = []
+    for r in results['results']:
+        name = case_name(r)
+        if name in before:
+            rows.append((name, r['seconds'], before[name],
+                         r['seconds'] / max(before[name], 1e-9)))
+    return rows
+
+
+def _format_result(r):
+    rss = '-' if r['peak_rss'] is None else '%.1f MB (+%.1f MB)' % (
+        r['peak_rss'] / 1e6, (r['peak_rss'] - r['base_rss']) / 1e6)
+    return '%-44s %8.3f s %12.0f rows/s %8.1f MB/s  peak %s' % (
+        case_name(r), r['seconds'], r['rows_per_second'], r['mb_per_second'],
+        rss)
+
+
+def _int_list(s):
+    return [int(v) for v in s.split(',') if v]
+
+
+def _name_list(choices):
+    def parse(s):
+        names = [v for v in s.split(',') if v]
+        for v in names:
+            if v not in choices:
+                raise argparse.ArgumentTypeError(
+                    'invalid choice: %s (choose from %s)' %
+                    (v, ', '.join(choices)))
+        return names
+    return parse
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m word_embedding_loader.bench',
+        description='Benchmark loading, saving and conversion of word '
+                    'embedding files.')
+    parser.add_argument('--sizes', type=_int_list, default=[10000, 100000],
+                        help='Comma separated vocabulary sizes.')
+    parser.add_argument('--dims', type=_int_list, default=[100],
+                        help='Comma separated feature dimensions.')
+    parser.add_argument('--formats', type=_name_list(list(FORMATS)),
+                        default=None, help='Comma separated formats.')
+    parser.add_argument('--operations', type=_name_list(OPERATIONS),
+                        default=None, help='Comma separated operations.')
+    parser.add_argument('--repeat', type=int, default=1,
+                        help='Number of times each case is run.')
+    parser.add_argument('--workdir', default=None,
+                        help='Directory to keep the generated files in.')
+    parser.add_argument('-o', '--output', default=None,
+                        help='File to write the results to as JSON.')
+    parser.add_argument('--compare', default=None,
+                        help='JSON of a previous run to compare with.')
+    parser.add_argument('--case', default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.case is not None:
+        # Child process of _run_child
+        print(json.dumps(run_case(json.loads(args.case), args.workdir)))
+        return
+
+    def log(result):
+        print(_format_result(result), file=sys.stderr)
+
+    cases = make_cases(args.sizes, args.dims, args.formats, args.operations)
+    results = run(cases, workdir=args.workdir, repeat=args.repeat, log=log)
+    text = json.dumps(results, indent=2)
+    if args.output is None:
+        print(text)
+    else:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    if args.compare is not None:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        for name, seconds, before, ratio in compare(results, baseline):
+            print('%-44s %8.3f s -> %8.3f s  x%.2f' % (
+                name, before, seconds, ratio), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
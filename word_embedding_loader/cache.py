@@ -0,0 +1,278 @@
+# -*- coding: utf-8 -*-
+"""
+On-disk cache of loaded word embedding. Parsed files are stored in the
+native ``'wel'`` format (see :mod:`word_embedding_loader.loader.wel`), keyed
+by a fingerprint of the source file and of the loading options, so that they
+can be reloaded without parsing.
+
+Use it through
+:func:`~word_embedding_loader.word_embedding.WordEmbedding.load`:
+
+.. code:: python
+
+   wv = WordEmbedding.load('path/to/embedding.txt', cache_dir='path/to/cache')
+
+Writes are atomic and, on platforms that support ``fcntl.flock``, processes
+that miss the cache for the same entry at the same time wait for each other
+instead of parsing the file twice. Entries are read under a shared lock, and
+eviction skips entries that are locked, so an entry is not removed while
+another process is loading it.
+"""
+
+from __future__ import absolute_import, division, print_function, \
+    unicode_literals
+
+import contextlib
+import hashlib
+import json
+import os
+import tempfile
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from word_embedding_loader import saver
+from word_embedding_loader._fileinfo import checksum_file, stat_file
+from word_embedding_loader.saver._rows import vocab_pairs
+
+
+__all__ = ["LoadCache"]
+
+
+_SUFFIX = '.wel'
+
+_LOCK_SUFFIX = '.lock'
+
+
+class LoadCache(object):
+    """
+    Directory of cached word embedding files.
+
+    Args:
+        cache_dir (str): Directory to store the cache in. It is created if
+            it does not exist.
+        max_bytes (int or None): Upper bound of the total size of cached
+            files. Least recently used entries are removed when it is
+            exceeded. Unbounded if ``None``.
+        content_hash (bool): Include the checksum of the contents of the
+            source file in the fingerprint. It is more robust than relying
+            on the path, size and modification time alone, but requires
+            reading the whole source file on every load.
+    """
+    def __init__(self, cache_dir, max_bytes=None, content_hash=False):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.content_hash = content_hash
+        if not os.path.isdir(cache_dir):
+            try:
+                os.makedirs(cache_dir)
+            except OSError:
+                # Created by another process in the meantime
+                if not os.path.isdir(cache_dir):
+                    raise
+
+    def fingerprint(self, path):
+        """
+        Describe the source file.
+
+        Args:
+            path (str): Path to the source file.
+
+        Returns:
+            dict: See :func:`word_embedding_loader._fileinfo.stat_file`. It
+            also contains ``checksum`` if ``content_hash`` is set.
+        """
+        info = stat_file(path)
+        if self.content_hash:
+            info['checksum'] = checksum_file(path)
+        return info
+
+    def key(self, source, **options):
+        """
+        Compute key of a cache entry.
+
+        Args:
+            source (dict): Fingerprint of the source file as returned by
+                :meth:`fingerprint`.
+            options: Arguments of
+                :func:`~word_embedding_loader.word_embedding.WordEmbedding.load`
+                that affect the loaded result. Values must be serializable
+                as JSON.
+
+        Returns:
+            str
+        """
+        text = json.dumps({'source': source, 'options': options},
+                          sort_keys=True)
+        return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+    def _path(self, key, suffix=_SUFFIX):
+        return os.path.join(self.cache_dir, key + suffix)
+
+    def get(self, key):
+        """
+        Look up an entry. Hold :meth:`lock` of the entry while the returned
+        file is used, so that it is not evicted in the meantime.
+
+        Args:
+            key (str): Key of the entry.
+
+        Returns:
+            str or None: Path to the cached file, or ``None`` if the entry is
+            not found.
+        """
+        path = self._path(key)
+        try:
+            # Record the access for LRU
+            os.utime(path, None)
+        except OSError:
+            return None
+        return path
+
+    def put(self, key, vectors, vocab, source=None):
+        """
+        Store an entry. The file is written to a temporary file and renamed,
+        so readers never see a partially written entry.
+
+        Args:
+            key (str): Key of the entry.
+            vectors (numpy.ndarray): Word embedding vectors.
+            vocab (dict): Mapping from words to vector indices.
+            source (dict): Description of the source file, which is recorded
+                in the header of the cached file.
+
+        Returns:
+            str: Path to the cached file.
+        """
+        path = self._path(key)
+        items = vocab_pairs(vocab)
+        fd, tmp_path = tempfile.mkstemp(suffix='.tmp', dir=self.cache_dir)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                saver.wel.save(f, vectors, items, source=source)
+            _replace(tmp_path, path)
+        except BaseException:
+            _remove(tmp_path)
+            raise
+        self.evict(keep=path)
+        return path
+
+    @contextlib.contextmanager
+    def lock(self, key, shared=False):
+        """
+        Context manager that holds a lock of an entry. It does nothing on
+        platforms without ``fcntl``.
+
+        Args:
+            key (str): Key of the entry.
+            shared (bool): Take a shared lock, which is enough to read the
+                entry, instead of an exclusive lock, which is needed to
+                create it.
+        """
+        if fcntl is None:
+            yield
+            return
+        path = self._path(key, _LOCK_SUFFIX)
+        while True:
+            f = open(path, 'a')
+            try:
+                fcntl.flock(f.fileno(),
+                            fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+            except BaseException:
+                f.close()
+                raise
+            if _same_file(f, path):
+                break
+            # The lock file was removed with its entry while waiting
+            f.close()
+        with f:
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+    def entries(self):
+        """
+        List cached files from the least recently used.
+
+        Returns:
+            list: ``(path, size in bytes, last access time)`` tuples.
+        """
+        ret = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(_SUFFIX):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            ret.append((path, st.st_size, st.st_mtime))
+        return sorted(ret, key=lambda e: e[2])
+
+    def evict(self, keep=None):
+        """
+        Remove least recently used entries until the total size is no more
+        than ``max_bytes``. Entries that are locked by another process are
+        kept.
+
+        Args:
+            keep (str or None): Path to an entry that is never removed.
+        """
+        if self.max_bytes is None:
+            return
+        entries = self.entries()
+        total = sum(e[1] for e in entries)
+        for path, size, _ in entries:
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            if self._remove_entry(path):
+                total -= size
+
+    def _remove_entry(self, path):
+        # Remove an entry and its lock file unless the entry is locked
+        if fcntl is None:
+            return _remove(path)
+        lock_path = path[:-len(_SUFFIX)] + _LOCK_SUFFIX
+        with open(lock_path, 'a') as f:
+            try:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except (IOError, OSError):
+                return False
+            try:
+                if not _same_file(f, lock_path):
+                    return False
+                removed = _remove(path)
+                _remove(lock_path)
+                return removed
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def _replace(src, dst):
+    if hasattr(os, 'replace'):
+        os.replace(src, dst)
+    else:
+        os.rename(src, dst)
+
+
+def _same_file(f, path):
+    # Whether path still names the file opened as f
+    try:
+        st = os.stat(path)
+    except OSError:
+        return False
+    fst = os.fstat(f.fileno())
+    return (fst.st_dev, fst.st_ino) == (st.st_dev, st.st_ino)
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+        return True
+    except OSError:
+        return False
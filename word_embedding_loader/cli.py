@@ -3,10 +3,13 @@ from __future__ import absolute_import, division, print_function
 # Do NOT use unicode_literals; let click handle unicode decoding
 
 from collections import OrderedDict
+import contextlib
+import os
 
 import click
 
-from word_embedding_loader import word_embedding
+from word_embedding_loader import compression, evaluation, word_embedding
+from word_embedding_loader.progress import Progress
 import six
 
 
@@ -19,16 +22,40 @@ _output_choices = OrderedDict((
     ('glove', ("GloVe by Stanford NLP group.", 'glove', False)),
     ('word2vec', ("alias of word2vec-text", 'word2vec', False)),
     ('word2vec-text', ("word2vec (by Mikolov et al.) with -binary 0 option.", 'word2vec', False)),
-    ('word2vec-binary', ("word2vec (by Mikolov et al.) with -binary 1 option.", 'word2vec', True))
+    ('word2vec-binary', ("word2vec (by Mikolov et al.) with -binary 1 option.", 'word2vec', True)),
+    ('wel', ("Native binary format of word_embedding_loader (fastest to load).", 'wel', False))
 ))
 _input_choices.update(_output_choices)
 
+_compression_choices = ['auto', 'none'] + [k for k in compression.MAGIC]
+
 
 @click.group()
 def cli():
     pass
 
 
+@contextlib.contextmanager
+def _progress_bar(progress, label):
+    # Show a progress bar on stderr that follows the bytes read
+    if progress is None:
+        yield
+        return
+    if progress.total_bytes is None:
+        # The size of decompressed inputs is unknown; count the rows
+        def show(info):
+            click.echo('\r{}: {} rows'.format(label, info.rows), nl=False,
+                       err=True)
+        progress.callback = show
+        yield
+        click.echo(err=True)
+        return
+    with click.progressbar(length=progress.total_bytes, label=label,
+                           file=click.get_text_stream('stderr')) as bar:
+        progress.callback = lambda info: bar.update(info.bytes - bar.pos)
+        yield
+
+
 @cli.command()
 @click.argument('inputfile', type=click.Path(exists=True))
 @click.argument('outputfile', type=click.Path())
@@ -36,15 +63,92 @@ def cli():
               help='Target format')
 @click.option('-f', '--from-format', type=click.Choice(list(_input_choices.keys())),
               default='auto', help='Source format. It will guess format from content if not given.')
-def convert(outputfile, inputfile, to_format, from_format):
+@click.option('--max-vocab', type=int, default=None,
+              help='Number of words to convert. All words are converted if not given.')
+@click.option('--dtype', type=click.Choice(['float16', 'float32', 'float64']),
+              default='float32', help='Data type of the vectors.')
+@click.option('--precision', type=int, default=None,
+              help='Number of digits after the decimal point for text formats, '
+                   'which makes writing much faster. Values are written exactly '
+                   'if not given.')
+@click.option('--quantize', is_flag=True,
+              help='Store vectors as 8 bit codes with a scale and an offset '
+                   'for each row (wel only), a quarter of the size of float32.')
+@click.option('--progress', 'show_progress', is_flag=True,
+              help='Show a progress bar on stderr.')
+@click.option('--stats', is_flag=True,
+              help='Report the time spent in each phase, and in I/O, parsing, '
+                   'formatting and array assembly for each format.')
+@click.option('--compression', 'output_compression',
+              type=click.Choice(_compression_choices), default='auto',
+              help='Compression of outputfile. It is determined from the '
+                   'extension of outputfile (.gz, .bz2, .xz, .zst or .zip) '
+                   'if not given.')
+@click.option('--decompress-thread', is_flag=True,
+              help='Decompress a compressed inputfile in a background thread, '
+                   'so that decompression and parsing overlap.')
+def convert(outputfile, inputfile, to_format, from_format, max_vocab, dtype,
+            precision, quantize, show_progress, stats, output_compression,
+            decompress_thread):
     """
     Convert pretrained word embedding file in one format to another.
+    Rows are converted in batches without loading the whole file.
+    Compressed inputfile (gzip, bzip2, xz, zstd or zip) is decompressed
+    as it is read.
+    """
+    progress = None
+    if show_progress or stats:
+        with open(inputfile, 'rb') as f:
+            compressed = compression.detect(f.read(16)) is not None
+        progress = Progress(
+            total_bytes=None if compressed else os.path.getsize(inputfile),
+            interval=0.1)
+    with _progress_bar(progress if show_progress else None, 'Converting'):
+        word_embedding.convert(
+            inputfile, outputfile,
+            to_format=_output_choices[to_format][1],
+            to_binary=_output_choices[to_format][2],
+            from_format=_input_choices[from_format][1],
+            from_binary=_input_choices[from_format][2],
+            dtype=dtype, max_vocab=max_vocab, precision=precision,
+            quantize=quantize, progress=progress,
+            compression={'auto': 'infer', 'none': None}.get(
+                output_compression, output_compression),
+            decompress_thread=decompress_thread)
+    if stats:
+        click.echo(progress.report())
+
+
+@cli.command()
+@click.argument('inputfile', type=click.Path(exists=True))
+@click.argument('questions', type=click.Path(exists=True))
+@click.option('-f', '--from-format', type=click.Choice(list(_input_choices.keys())),
+              default='auto', help='Format of inputfile. It will guess format from content if not given.')
+@click.option('--method', type=click.Choice(['3cosadd', '3cosmul']),
+              default='3cosadd', help='Method to solve analogies.')
+@click.option('--restrict-vocab', type=int, default=None,
+              help='Only use this many words from the beginning of the vocabulary.')
+@click.option('--lower', is_flag=True, help='Convert questions to lower case.')
+def analogy(inputfile, questions, from_format, method, restrict_vocab, lower):
+    """
+    Evaluate pretrained word embedding with word analogy questions
+    (e.g. questions-words.txt of word2vec) and report accuracy and throughput.
     """
     emb = word_embedding.WordEmbedding.load(
         inputfile, format=_input_choices[from_format][1],
         binary=_input_choices[from_format][2])
-    emb.save(outputfile, format=_output_choices[to_format][1],
-             binary=_output_choices[to_format][2])
+    result = evaluation.evaluate_analogy(
+        emb, questions, method=method, restrict_vocab=restrict_vocab,
+        lower=lower)
+    for name, r in six.iteritems(result['sections']):
+        click.echo("{}: {:.2%} ({}/{})".format(
+            name.decode('utf-8', 'replace'), r['accuracy'], r['correct'],
+            r['total']))
+    click.echo("Total: {:.2%} ({}/{}), {} skipped".format(
+        result['accuracy'], result['correct'], result['total'],
+        result['skipped']))
+    click.echo("Throughput: {:.1f} queries/s".format(
+        result['queries_per_second']))
 
 
 def _echo_format_result(name):
@@ -53,19 +157,38 @@ def _echo_format_result(name):
 
 @cli.command()
 @click.argument('inputfile', type=click.File('rb'))
-def check_format(inputfile):
+@click.option('--sniff', is_flag=True,
+              help='Also report the number of words, the feature dimension '
+                   'and the data type from the header, without parsing '
+                   'the vectors.')
+def check_format(inputfile, sniff):
     """
     Check format of inputfile.
     """
-    t = word_embedding.classify_format(inputfile)
+    if sniff:
+        info = word_embedding.sniff(inputfile)
+        t = word_embedding._select_module(info['format'], info['binary'])
+    else:
+        t = word_embedding.classify_format(inputfile)
     if t == word_embedding._glove:
         _echo_format_result('glove')
     elif t == word_embedding._word2vec_bin:
         _echo_format_result('word2vec-binary')
     elif t == word_embedding._word2vec_text:
         _echo_format_result('word2vec-text')
+    elif t == word_embedding._wel:
+        _echo_format_result('wel')
     else:
         assert not "Should not get here!"
+    if sniff:
+        click.echo("words: {}".format(info['words']))
+        click.echo("size: {}".format(info['size']))
+        dtype = info['dtype'] or 'text'
+        if info['quantized']:
+            dtype += ' (quantized)'
+        click.echo("dtype: {}".format(dtype))
+        if info['compression'] is not None:
+            click.echo("compression: {}".format(info['compression']))
 
 
 @cli.command()
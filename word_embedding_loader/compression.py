@@ -0,0 +1,506 @@
+# -*- coding: utf-8 -*-
+"""
+Transparent compression of word embedding files.
+
+:func:`~word_embedding_loader.word_embedding.WordEmbedding.load`,
+:func:`~word_embedding_loader.word_embedding.WordEmbedding.iter_rows`,
+:func:`~word_embedding_loader.word_embedding.convert` and
+:func:`~word_embedding_loader.word_embedding.sniff` detect compressed files
+from their first bytes (see :data:`MAGIC`) and decompress them as they are
+read, so that they are never decompressed to disk. The compressed file is
+read in blocks of :data:`BLOCK_SIZE` bytes that are decompressed
+incrementally, in chunks of at most :data:`BLOCK_SIZE` bytes, and fed to the
+parsers. With ``decompress_thread=True``, blocks are decompressed in a
+background thread, which runs while the parser works on the previous blocks
+(:mod:`zlib`, :mod:`bz2` and :mod:`lzma` release the GIL) and holds at most a
+few chunks.
+
+:func:`~word_embedding_loader.word_embedding.WordEmbedding.save` and
+:func:`~word_embedding_loader.word_embedding.convert` compress their output
+according to the extension of its path (see :data:`EXTENSIONS`).
+
+``'zstd'`` requires the `zstandard <https://pypi.org/project/zstandard/>`_
+package and ``'xz'`` the :mod:`lzma` module of Python 3. Zip archives must
+contain a single file.
+"""
+
+from __future__ import absolute_import, division, print_function, \
+    unicode_literals
+
+import bz2
+import contextlib
+import io
+import os
+import shutil
+import tempfile
+import threading
+import zipfile
+import zlib
+from collections import OrderedDict
+
+import six
+from six.moves import queue
+
+try:
+    import lzma
+except ImportError:
+    # Python 2
+    lzma = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+__all__ = ["MAGIC", "EXTENSIONS", "BLOCK_SIZE", "available", "detect",
+           "infer", "member_name", "open_decompressed", "open_compressed"]
+
+
+#: First bytes of compressed files of each compression.
+MAGIC = OrderedDict((
+    ('gzip', b'\x1f\x8b'),
+    ('bz2', b'BZh'),
+    ('xz', b'\xfd7zXZ\x00'),
+    ('zstd', b'\x28\xb5\x2f\xfd'),
+    ('zip', b'PK\x03\x04'),
+))
+
+#: Extensions of the paths of compressed files, from which the compression of
+#: outputs is determined.
+EXTENSIONS = OrderedDict((
+    ('.gz', 'gzip'),
+    ('.bz2', 'bz2'),
+    ('.xz', 'xz'),
+    ('.zst', 'zstd'),
+    ('.zip', 'zip'),
+))
+
+#: Number of compressed bytes read (and decompressed) at a time.
+BLOCK_SIZE = 1 << 20
+
+# Number of decompressed blocks a background thread runs ahead of the parser
+_QUEUE_BLOCKS = 4
+
+# Compression levels of the command line tools; higher levels of gzip are
+# much slower for little gain
+_GZIP_LEVEL = 6
+_BZ2_LEVEL = 9
+
+
+def available(name):
+    """
+    Tell if a compression can be used in this environment.
+
+    Args:
+        name (str): One of the keys of :data:`MAGIC`.
+
+    Returns:
+        bool
+    """
+    if name == 'xz':
+        return lzma is not None
+    if name == 'zstd':
+        return zstandard is not None
+    return name in MAGIC
+
+
+def _check(name):
+    if name not in MAGIC:
+        raise ValueError(
+            ('Unknown compression "%s"' % name).encode('utf-8'))
+    if not available(name):
+        raise ValueError(
+            ('Compression "%s" requires %s' % (
+                name, 'zstandard' if name == 'zstd' else 'lzma')
+             ).encode('utf-8'))
+
+
+def detect(head):
+    """
+    Determine the compression of a file from its first bytes.
+
+    Args:
+        head (bytes): First bytes of the file (at least 6 bytes, unless the
+            file is shorter).
+
+    Returns:
+        str or None: Key of :data:`MAGIC`, or ``None`` if the file is not
+        compressed.
+    """
+    for name, magic in six.iteritems(MAGIC):
+        if head.startswith(magic):
+            if name == 'bz2' and not _is_bz2(head):
+                # Text files may begin with 'BZh'
+                continue
+            return name
+    return None
+
+
+# Magic numbers of the first block of bzip2 streams, and of the end of empty
+# streams
+_BZ2_BLOCK = b'1AY&SY'
+_BZ2_END = b'\x17rE8P\x90'
+
+
+def _is_bz2(head):
+    # 'BZh' is followed by the block size, 1 to 9, and by the magic number of
+    # the first block
+    if len(head) < 4 or head[3:4] not in (b'1', b'2', b'3', b'4', b'5', b'6',
+                                          b'7', b'8', b'9'):
+        return False
+    rest = head[4:4 + len(_BZ2_BLOCK)]
+    return _BZ2_BLOCK.startswith(rest) or _BZ2_END.startswith(rest)
+
+
+def infer(path):
+    """
+    Determine the compression of a file from the extension of its path (see
+    :data:`EXTENSIONS`).
+
+    Args:
+        path (str): Path of the file.
+
+    Returns:
+        str or None: ``None`` if the extension is not one of a compressed
+        file.
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if isinstance(ext, bytes):
+        ext = ext.decode('utf-8')
+    return EXTENSIONS.get(ext)
+
+
+def member_name(path):
+    """
+    Name of the file stored in a zip archive written at ``path``: the name of
+    the archive without ``.zip``.
+
+    Args:
+        path (str): Path of the archive.
+
+    Returns:
+        str
+    """
+    if isinstance(path, bytes):
+        path = path.decode('utf-8')
+    name = os.path.basename(path)
+    if name.lower().endswith('.zip'):
+        name = name[:-4]
+    return name or 'embedding'
+
+
+def _decompressor(name):
+    # Factory of incremental decompressors of one stream
+    if name == 'gzip':
+        return lambda: zlib.decompressobj(16 + zlib.MAX_WBITS)
+    if name == 'bz2':
+        return bz2.BZ2Decompressor
+    return lzma.LZMADecompressor
+
+
+_ZLIB_DECOMPRESS = type(zlib.decompressobj())
+
+
+def _decompress(d, data, block_size):
+    # Decompress data in chunks of at most block_size bytes, so that highly
+    # compressed blocks do not expand at once
+    if isinstance(d, _ZLIB_DECOMPRESS):
+        while data and not getattr(d, 'eof', False):
+            yield d.decompress(data, block_size)
+            data = d.unconsumed_tail
+    elif hasattr(d, 'needs_input'):
+        # bz2 and lzma of Python 3.5 and later
+        yield d.decompress(data, block_size)
+        while not d.eof and not d.needs_input:
+            yield d.decompress(b'', block_size)
+    else:
+        yield d.decompress(data)
+
+
+def _iter_zstd(fin, block_size):
+    reader = zstandard.ZstdDecompressor().stream_reader(
+        fin, read_size=block_size, read_across_frames=True)
+    with reader:
+        for chunk in _iter_blocks(reader, block_size):
+            yield chunk
+
+
+def _iter_decompressed(fin, name, block_size):
+    """
+    Decompress ``fin`` block by block into chunks of at most ``block_size``
+    bytes. Files made of several concatenated streams (e.g. by ``pigz`` or
+    ``pbzip2``) are decompressed to the concatenation of their contents.
+
+    Yields:
+        bytes: Decompressed data.
+    """
+    if name == 'zstd':
+        for chunk in _iter_zstd(fin, block_size):
+            yield chunk
+        return
+    factory = _decompressor(name)
+    d = factory()
+    in_stream = False
+    while True:
+        data = fin.read(block_size)
+        if not data:
+            if name == 'gzip':
+                # Output held back by the limit of the last call
+                out = d.flush()
+                if out:
+                    yield out
+            break
+        while data:
+            in_stream = True
+            for out in _decompress(d, data, block_size):
+                if out:
+                    yield out
+            # Data after the end of a stream begins the next one
+            data = getattr(d, 'unused_data', b'')
+            if data or getattr(d, 'eof', False):
+                d = factory()
+                in_stream = False
+                if name == 'gzip':
+                    # gzip files may be padded with zeros
+                    data = data.lstrip(b'\x00')
+    if in_stream and not getattr(d, 'eof', True):
+        raise EOFError(
+            b"Compressed file ended before the end-of-stream marker was "
+            b"reached")
+
+
+def _iter_blocks(f, block_size):
+    while True:
+        data = f.read(block_size)
+        if not data:
+            return
+        yield data
+
+
+class _Prefetcher(object):
+    """
+    Iterate the chunks of ``chunks``, which are produced by a background
+    thread up to :data:`_QUEUE_BLOCKS` chunks ahead. Exceptions of the thread
+    are raised by the iteration.
+    """
+    def __init__(self, chunks, depth=_QUEUE_BLOCKS):
+        self._queue = queue.Queue(depth)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(chunks,))
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _put(self, item):
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _run(self, chunks):
+        try:
+            for chunk in chunks:
+                if not self._put((chunk, None)):
+                    return
+        except BaseException as e:
+            self._put((None, e))
+            return
+        self._put((None, None))
+
+    def __iter__(self):
+        while True:
+            chunk, error = self._queue.get()
+            if error is not None:
+                raise error
+            if chunk is None:
+                return
+            yield chunk
+
+    def close(self):
+        """
+        Stop the thread, also when the chunks are not read to the end.
+        """
+        self._stop.set()
+        self._thread.join()
+
+
+class _ChunkReader(io.RawIOBase):
+    """
+    Non-seekable stream of the concatenation of chunks of bytes.
+    """
+    def __init__(self, chunks):
+        self._chunks = chunks
+        self._iter = iter(chunks)
+        self._chunk = memoryview(b'')
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while not len(self._chunk):
+            chunk = next(self._iter, None)
+            if chunk is None:
+                return 0
+            self._chunk = memoryview(chunk)
+        n = min(len(b), len(self._chunk))
+        b[:n] = self._chunk[:n]
+        self._chunk = self._chunk[n:]
+        return n
+
+    def close(self):
+        if not self.closed:
+            close = getattr(self._chunks, 'close', None)
+            if close is not None:
+                close()
+        super(_ChunkReader, self).close()
+
+
+@contextlib.contextmanager
+def _open_zip_member(fin):
+    # The index of zip archives is at their end
+    spool = None
+    if not _seekable(fin):
+        spool = tempfile.TemporaryFile()
+        shutil.copyfileobj(fin, spool, BLOCK_SIZE)
+        spool.seek(0)
+        fin = spool
+    try:
+        with zipfile.ZipFile(fin) as archive:
+            names = [i.filename for i in archive.infolist()
+                     if not i.filename.endswith('/')]
+            if len(names) != 1:
+                raise ValueError(
+                    ('Zip archive must contain a single file (found %s)' %
+                     ', '.join(names)).encode('utf-8'))
+            with archive.open(names[0]) as member:
+                yield member
+    finally:
+        if spool is not None:
+            spool.close()
+
+
+def _seekable(f):
+    try:
+        return f.seekable()
+    except AttributeError:
+        return False
+
+
+@contextlib.contextmanager
+def _open_chunks(chunks, thread, block_size):
+    if thread:
+        chunks = _Prefetcher(chunks)
+    f = io.BufferedReader(_ChunkReader(chunks), block_size)
+    try:
+        yield f
+    finally:
+        f.close()
+
+
+@contextlib.contextmanager
+def open_decompressed(fin, name, thread=False, block_size=None):
+    """
+    Decompress a file as it is read.
+
+    Args:
+        fin (File): Compressed file opened in binary mode. It may be a
+            non-seekable stream; zip archives are then copied to a temporary
+            file first, as their index is at their end.
+        name (str): Compression (see :func:`detect`).
+        thread (bool): Decompress in a background thread.
+        block_size (int or None): Number of compressed bytes read at a time.
+            :data:`BLOCK_SIZE` if ``None``.
+
+    Yields:
+        File: Non-seekable file object of the decompressed content.
+
+    Raises:
+        ValueError: The compression is not available, or a zip archive does
+            not contain exactly one file.
+    """
+    _check(name)
+    block_size = block_size or BLOCK_SIZE
+    if name == 'zip':
+        with _open_zip_member(fin) as member, \
+                _open_chunks(_iter_blocks(member, block_size), thread,
+                             block_size) as f:
+            yield f
+        return
+    with _open_chunks(_iter_decompressed(fin, name, block_size), thread,
+                      block_size) as f:
+        yield f
+
+
+class _CompressWriter(io.RawIOBase):
+    """
+    Non-seekable stream that compresses what is written to it into ``fout``.
+    The compressed stream is ended when it is closed; ``fout`` is left open.
+    """
+    def __init__(self, fout, compressor):
+        self._fout = fout
+        self._compressor = compressor
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        data = self._compressor.compress(bytes(b))
+        if data:
+            self._fout.write(data)
+        return len(b)
+
+    def close(self):
+        if not self.closed:
+            self._fout.write(self._compressor.flush())
+        super(_CompressWriter, self).close()
+
+
+def _compressor(name):
+    if name == 'gzip':
+        return zlib.compressobj(_GZIP_LEVEL, zlib.DEFLATED,
+                                16 + zlib.MAX_WBITS)
+    if name == 'bz2':
+        return bz2.BZ2Compressor(_BZ2_LEVEL)
+    if name == 'xz':
+        return lzma.LZMACompressor()
+    return zstandard.ZstdCompressor().compressobj()
+
+
+@contextlib.contextmanager
+def open_compressed(fout, name, member=None):
+    """
+    Compress what is written to a file.
+
+    Args:
+        fout (File): File opened for writing binary. It is not closed.
+        name (str or None): Compression (see :func:`detect`). ``fout`` itself
+            is yielded if ``None``.
+        member (str or None): Name of the file in zip archives.
+            ``'embedding'`` if ``None``.
+
+    Yields:
+        File: File object to write the uncompressed content to.
+
+    Raises:
+        ValueError: The compression is not available.
+    """
+    if name is None:
+        yield fout
+        return
+    _check(name)
+    if name == 'zip':
+        with zipfile.ZipFile(fout, mode='w',
+                             compression=zipfile.ZIP_DEFLATED) as archive:
+            with archive.open(member or 'embedding', mode='w',
+                              force_zip64=True) as f:
+                yield f
+        return
+    f = io.BufferedWriter(_CompressWriter(fout, _compressor(name)),
+                          BLOCK_SIZE)
+    try:
+        yield f
+    finally:
+        f.close()
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""
+Evaluation of word embedding vectors with word analogy questions, such as
+``questions-words.txt`` of
+`word2vec <https://code.google.com/archive/p/word2vec/>`_ or the BATS and
+MSR sets converted to the same format. A question file consists of lines of
+four words ``a b c d`` (``a : b :: c : d``), grouped in sections that begin
+with a ``: <section name>`` line.
+"""
+
+from __future__ import absolute_import, division, print_function, \
+    unicode_literals
+
+import time
+from collections import OrderedDict
+
+import numpy as np
+import six
+
+from word_embedding_loader import parse_warn
+
+
+__all__ = ["read_analogies", "evaluate_analogy"]
+
+
+def read_analogies(fin, lower=False):
+    """
+    Read analogy questions.
+
+    Args:
+        fin (File): File-like object to read from, opened in binary mode.
+        lower (bool): Convert the words to lower case (ASCII only).
+
+    Returns:
+        list: ``(section, a, b, c, d)`` tuple of each question (``bytes``).
+        ``section`` is ``b''`` for questions before the first section line.
+    """
+    section = b''
+    questions = []
+    for i, line in enumerate(fin):
+        line = line.strip()
+        if not line:
+            continue
+        if line.startswith(b':'):
+            section = line[1:].strip()
+            continue
+        if lower:
+            line = line.lower()
+        words = line.split()
+        if len(words) != 4:
+            parse_warn(('Line %d does not have four words; skipped' % (i + 1))
+                       .encode('utf-8'))
+            continue
+        questions.append((section, ) + tuple(words))
+    return questions
+
+
+def evaluate_analogy(embedding, questions, method='3cosadd',
+                     restrict_vocab=None, lower=False):
+    """
+    Answer analogy questions with
+    :func:`~word_embedding_loader.word_embedding.WordEmbedding.analogy` and
+    measure accuracy and throughput. Questions with a word that is not in the
+    (restricted) vocabulary are skipped, and counted as such.
+
+    Args:
+        embedding (word_embedding_loader.word_embedding.WordEmbedding):
+            Embedding to evaluate.
+        questions (str or list): Path of a question file, or questions as
+            returned by :func:`read_analogies`.
+        method (str): ``'3cosadd'`` or ``'3cosmul'``.
+        restrict_vocab (int or None): Only use the first ``restrict_vocab``
+            words, both for questions and for answers.
+        lower (bool): Check :func:`read_analogies`.
+
+    Returns:
+        dict: ``correct``, ``total`` (number of answered questions),
+        ``skipped``, ``accuracy`` (``correct / total``), ``seconds`` (time
+        taken to answer) and ``queries_per_second``. ``sections`` holds a dict
+        with ``correct``, ``total`` and ``accuracy`` for each section, in the
+        order of the questions.
+    """
+    if isinstance(questions, (six.text_type, bytes)):
+        with open(questions, mode='rb') as f:
+            questions = read_analogies(f, lower=lower)
+    n = len(questions)
+    ids = embedding.lookup_ids(
+        [q[j] for j in six.moves.range(1, 5) for q in questions]).reshape(4, n)
+    limit = len(embedding) if restrict_vocab is None else restrict_vocab
+    covered = ((ids >= 0) & (ids < limit)).all(axis=0)
+    answered = [questions[i] for i in np.flatnonzero(covered).tolist()]
+
+    start = time.time()
+    if answered:
+        indices, _ = embedding.analogy(
+            [q[1] for q in answered], [q[2] for q in answered],
+            [q[3] for q in answered], k=1, method=method,
+            restrict_vocab=restrict_vocab)
+        hits = indices[:, 0] == ids[3, covered]
+    else:
+        hits = np.zeros(0, dtype=np.bool_)
+    seconds = time.time() - start
+
+    results = OrderedDict()
+    for q, hit in six.moves.zip(answered, hits.tolist()):
+        r = results.setdefault(q[0], {'correct': 0, 'total': 0})
+        r['correct'] += hit
+        r['total'] += 1
+    for r in results.values():
+        r['accuracy'] = r['correct'] / r['total']
+    total = len(answered)
+    correct = int(hits.sum())
+    return {
+        'correct': correct,
+        'total': total,
+        'skipped': n - total,
+        'accuracy': correct / total if total > 0 else 0.0,
+        'seconds': seconds,
+        'queries_per_second': total / seconds if seconds > 0 else float('inf'),
+        'sections': results,
+    }
@@ -0,0 +1,423 @@
+# -*- coding: utf-8 -*-
+"""
+Approximate nearest neighbor search with an inverted file (IVF) index,
+optionally compressed by product quantization (PQ), in pure NumPy.
+
+Vectors are clustered by k-means into ``nlist`` lists and a query only
+scores the vectors of the ``nprobe`` lists whose centroids are the closest
+to it. With PQ, each vector is stored as the codes of its residual to its
+centroid (one byte per subvector) and scored through a lookup table per
+query, instead of being stored in full.
+
+An index is saved as a single file that consists of :data:`MAGIC`, a JSON
+header line (padded with spaces to a multiple of :data:`ALIGN`) describing
+the parameters and the position, data type and shape of each array, and
+the arrays themselves, each aligned to :data:`ALIGN`. It can be memory-mapped
+by :meth:`IVFIndex.load`.
+"""
+
+from __future__ import absolute_import, division, print_function, \
+    unicode_literals
+
+import json
+
+import numpy as np
+import six
+
+from word_embedding_loader import ParseError, similarity
+
+
+__all__ = ["IVFIndex", "kmeans"]
+
+
+MAGIC = b'\x93WEI\x01\n'
+VERSION = 1
+ALIGN = 64
+
+# Number of centroids of each subquantizer, so that codes fit in uint8
+_PQ_CLUSTERS = 256
+
+# Maximum number of residuals to train subquantizers with
+_PQ_TRAIN_SIZE = _PQ_CLUSTERS * 64
+
+
+def _align(n):
+    return -(-n // ALIGN) * ALIGN
+
+
+def _random_state(random_state):
+    if isinstance(random_state, np.random.RandomState):
+        return random_state
+    return np.random.RandomState(random_state)
+
+
+def _assign(data, centroids):
+    # Index of the closest centroid of each row
+    return similarity.search(centroids, data, 1, 'l2')[0][:, 0]
+
+
+def kmeans(data, n_clusters, n_iter=10, random_state=None):
+    """
+    Cluster rows by Lloyd's k-means algorithm. Assignments are computed by
+    :func:`word_embedding_loader.similarity.search`, which uses blocked
+    matrix multiplications.
+
+    Args:
+        data (numpy.ndarray): Rows to cluster.
+        n_clusters (int): Number of clusters. It must not exceed
+            ``len(data)``.
+        n_iter (int): Number of iterations.
+        random_state (int or numpy.random.RandomState or None): Random number
+            generator (or its seed) to pick the initial centroids and to
+            reinitialize empty clusters.
+
+    Returns:
+        numpy.ndarray: Centroids in shape of
+        ``(n_clusters, feature dimension)``.
+    """
+    rs = _random_state(random_state)
+    data = np.asarray(data, dtype=similarity.compute_dtype(data.dtype))
+    centroids = data[rs.choice(len(data), n_clusters, replace=False)].copy()
+    for _ in six.moves.range(n_iter):
+        labels = _assign(data, centroids)
+        counts = np.bincount(labels, minlength=n_clusters)
+        order = np.argsort(labels, kind='mergesort')
+        filled = np.flatnonzero(counts)
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])[filled]
+        sums = np.add.reduceat(data[order], starts, axis=0)
+        centroids[filled] = sums / counts[filled, None]
+        empty = np.flatnonzero(counts == 0)
+        if len(empty) > 0:
+            centroids[empty] = data[rs.choice(len(data), len(empty),
+                                              replace=False)]
+    return centroids
+
+
+class IVFIndex(object):
+    """
+    Inverted file index of word embedding vectors.
+
+    .. note:: You do not need to call initializer directly in normal usage.
+        Use :meth:`build`,
+        :func:`~word_embedding_loader.word_embedding.WordEmbedding.build_index`
+        or :meth:`load`.
+
+    Args:
+        arrays (dict): Arrays of the index: ``centroids``, ``offsets``
+            (``nlist + 1`` positions of the lists in ``ids``), ``ids``
+            (vector indices sorted by list), ``terms`` (squared L2 norms of
+            the stored vectors in the order of ``ids``), and either
+            ``vectors`` (the vectors in the order of ``ids``) or
+            ``codebooks`` and ``codes`` (for PQ).
+        metric (str): ``'cosine'``, ``'dot'`` or ``'l2'``.
+        nprobe (int): Default number of lists to search.
+
+    Attributes:
+        metric (str): Metric of the index.
+        nprobe (int): Default number of lists to search.
+        nlist (int): Number of lists.
+        pq (int or None): Number of subquantizers, or ``None`` without PQ.
+    """
+    def __init__(self, arrays, metric, nprobe=8):
+        if metric not in similarity.METRICS:
+            raise ValueError(('Unknown metric "%s"' % metric).encode('utf-8'))
+        self.arrays = arrays
+        self.metric = metric
+        self.nprobe = nprobe
+        self.nlist = len(arrays['centroids'])
+        self.pq = len(arrays['codebooks']) if 'codebooks' in arrays else None
+
+    def __len__(self):
+        return len(self.arrays['ids'])
+
+    @classmethod
+    def build(cls, vectors, nlist=None, nprobe=8, pq=None, metric='cosine',
+              n_iter=10, train_size=None, random_state=None):
+        """
+        Build an index.
+
+        Args:
+            vectors (numpy.ndarray or word_embedding_loader.arrays.RowVectors):
+                Vectors to index.
+            nlist (int or None): Number of lists. It is
+                ``4 * sqrt(len(vectors))`` if ``None``.
+            nprobe (int): Default number of lists to search.
+            pq (int or None): Number of subquantizers to compress vectors
+                with. It must divide the feature dimension. Vectors are stored
+                in full if ``None``.
+            metric (str): ``'cosine'``, ``'dot'`` or ``'l2'``.
+            n_iter (int): Number of k-means iterations.
+            train_size (int or None): Number of vectors sampled to train
+                k-means. It is ``64 * nlist`` (and at least ``256 * 64`` with
+                PQ) if ``None``. Subquantizers are trained with at most
+                ``256 * 64`` of them.
+            random_state (int or numpy.random.RandomState or None): Random
+                number generator (or its seed).
+
+        Returns:
+            IVFIndex
+        """
+        if metric not in similarity.METRICS:
+            raise ValueError(('Unknown metric "%s"' % metric).encode('utf-8'))
+        n, size = vectors.shape
+        if pq is not None and size % pq != 0:
+            raise ValueError(
+                ('pq=%d does not divide the feature dimension %d' %
+                 (pq, size)).encode('utf-8'))
+        rs = _random_state(random_state)
+        dtype = similarity.compute_dtype(vectors.dtype)
+        if metric == 'cosine':
+            data = similarity.normalize(vectors, dtype)
+        else:
+            data = np.asarray(vectors, dtype=dtype)
+        if nlist is None:
+            nlist = int(4 * np.sqrt(n))
+        nlist = max(1, min(nlist, n))
+        if train_size is None:
+            train_size = 64 * nlist
+            if pq is not None:
+                train_size = max(train_size, _PQ_TRAIN_SIZE)
+        sample = data[np.sort(rs.choice(n, min(n, train_size),
+                                        replace=False))]
+
+        centroids = kmeans(sample, nlist, n_iter, rs)
+        labels = _assign(data, centroids)
+        counts = np.bincount(labels, minlength=nlist)
+        order = np.argsort(labels, kind='mergesort')
+        arrays = {
+            'centroids': centroids,
+            'offsets': np.concatenate([[0], np.cumsum(counts)]).astype(
+                np.int64),
+            'ids': order.astype(np.int64),
+        }
+        if pq is None:
+            arrays['vectors'] = data[order]
+            arrays['terms'] = similarity.squared_norms(arrays['vectors'])
+        else:
+            arrays.update(cls._encode(
+                data[order] - centroids[labels[order]],
+                centroids[labels[order]], sample, centroids, pq, n_iter, rs))
+        return cls(arrays, metric, nprobe)
+
+    @staticmethod
+    def _encode(residuals, bases, sample, centroids, pq, n_iter, rs):
+        # Train subquantizers on the residuals of (part of) the sample and
+        # encode
+        sub = residuals.shape[1] // pq
+        if len(sample) > _PQ_TRAIN_SIZE:
+            sample = sample[rs.choice(len(sample), _PQ_TRAIN_SIZE,
+                                      replace=False)]
+        labels = _assign(sample, centroids)
+        train = sample - centroids[labels]
+        clusters = min(_PQ_CLUSTERS, len(train))
+        codebooks = np.zeros((pq, _PQ_CLUSTERS, sub), dtype=residuals.dtype)
+        codes = np.empty((len(residuals), pq), dtype=np.uint8)
+        for j in six.moves.range(pq):
+            cols = slice(j * sub, (j + 1) * sub)
+            codebooks[j, :clusters] = kmeans(train[:, cols], clusters, n_iter,
+                                             rs)
+            codes[:, j] = _assign(residuals[:, cols],
+                                  codebooks[j, :clusters])
+        decoded = bases + np.concatenate(
+            [codebooks[j][codes[:, j]] for j in six.moves.range(pq)], axis=1)
+        terms = similarity.squared_norms(decoded)
+        return {'codebooks': codebooks, 'codes': codes, 'terms': terms}
+
+    def _score_lists(self, query, lists):
+        # Scores (larger is better) of the vectors in lists. For 'l2',
+        # 2 q.v - |v|^2 ranks vectors v as -|q - v|^2 does
+        a = self.arrays
+        offsets = a['offsets']
+        ranges = [(offsets[l], offsets[l + 1]) for l in lists.tolist()]
+        ids = np.concatenate([a['ids'][s:e] for s, e in ranges])
+        if self.pq is None:
+            vecs = np.concatenate([a['vectors'][s:e] for s, e in ranges])
+            scores = np.dot(vecs, query)
+        else:
+            scores = self._score_codes(query, lists, ranges)
+        if self.metric == 'l2':
+            terms = np.concatenate([a['terms'][s:e] for s, e in ranges])
+            scores = 2 * scores - terms
+        return ids, scores
+
+    def _score_codes(self, query, lists, ranges):
+        # q.v = q.c + q.r where the residual r is approximated by the
+        # subquantizer centroids of its codes
+        a = self.arrays
+        # Lookup table of dot products between subqueries and subquantizer
+        # centroids
+        sub = len(query) // self.pq
+        table = np.einsum('jcs,js->jc', a['codebooks'],
+                          query.reshape(self.pq, sub))
+        centroid_scores = np.dot(a['centroids'][lists], query)
+        scores = []
+        for (s, e), c in six.moves.zip(ranges, centroid_scores):
+            codes = a['codes'][s:e]
+            scores.append(c + table[np.arange(self.pq), codes].sum(axis=1))
+        return np.concatenate(scores)
+
+    def search(self, queries, k=10, nprobe=None, exclude=None):
+        """
+        Find approximate nearest neighbors.
+
+        Args:
+            queries (numpy.ndarray): Query vectors in shape of
+                ``(number of queries, feature dimension)``.
+            k (int): Number of vectors to find for each query.
+            nprobe (int or None): Number of lists to search. :attr:`nprobe`
+                is used if ``None``.
+            exclude (numpy.ndarray or None): Vector index to exclude from the
+                results of each query, or ``-1`` to exclude nothing.
+
+        Returns:
+            numpy.ndarray: Vector indices in shape of
+            ``(number of queries, k)``, from the best. ``-1`` if fewer than
+            ``k`` vectors are found.
+            numpy.ndarray: Similarities (Euclidean distances for ``'l2'``)
+            of the vectors.
+        """
+        if nprobe is None:
+            nprobe = self.nprobe
+        nprobe = max(1, min(nprobe, self.nlist))
+        centroids = self.arrays['centroids']
+        dtype = centroids.dtype
+        queries = np.ascontiguousarray(queries, dtype=dtype)
+        if self.metric == 'cosine':
+            queries = similarity.normalize(queries)
+        lists, _ = similarity.search(
+            centroids, queries, nprobe,
+            'l2' if self.metric == 'l2' else 'dot')
+
+        indices = np.full((len(queries), k), -1, dtype=np.int64)
+        scores = np.full((len(queries), k), -np.inf, dtype=dtype)
+        for i, query in enumerate(queries):
+            ids, s = self._score_lists(query, lists[i])
+            if exclude is not None and exclude[i] >= 0:
+                keep = ids != exclude[i]
+                ids, s = ids[keep], s[keep]
+            n = min(k, len(ids))
+            if n == 0:
+                continue
+            idx, vals = similarity.top_k(s[None], n)
+            indices[i, :n] = ids[idx[0]]
+            scores[i, :n] = vals[0]
+        if self.metric == 'l2':
+            q_norms = np.einsum('ij,ij->i', queries, queries)
+            scores = np.sqrt(np.maximum(q_norms[:, None] - scores, 0))
+        return indices, scores
+
+    def recall(self, vectors, queries, k=10, nprobe=None):
+        """
+        Measure recall@k of the index against exact search.
+
+        Args:
+            vectors (numpy.ndarray or word_embedding_loader.arrays.RowVectors):
+                Vectors the index was built from.
+            queries (numpy.ndarray): Query vectors.
+            k (int): Number of vectors to find for each query.
+            nprobe (int or None): Check :meth:`search`.
+
+        Returns:
+            float: Average fraction of the exact ``k`` nearest neighbors that
+            the index finds.
+        """
+        queries = np.asarray(queries)
+        if len(queries) == 0:
+            return 1.0
+        found, _ = self.search(queries, k, nprobe)
+        if self.metric == 'cosine':
+            exact, _ = similarity.search(similarity.normalize(vectors),
+                                         similarity.normalize(queries), k)
+        else:
+            exact, _ = similarity.search(vectors, queries, k, self.metric)
+        hits = sum(len(np.intersect1d(f, e))
+                   for f, e in six.moves.zip(found, exact))
+        return hits / exact.size
+
+    def save(self, path):
+        """
+        Save the index to a file.
+
+        Args:
+            path (str): Path of the file.
+        """
+        names = sorted(self.arrays)
+        arrays = [np.ascontiguousarray(self.arrays[name]) for name in names]
+        header = {
+            'version': VERSION,
+            'metric': self.metric,
+            'nprobe': self.nprobe,
+            'arrays': {},
+        }
+        # Positions depend on the length of the header line, which depends on
+        # the positions; repeat until they agree
+        pos = [0] * len(names)
+        while True:
+            for name, arr, p in six.moves.zip(names, arrays, pos):
+                header['arrays'][name] = {
+                    'offset': p, 'dtype': arr.dtype.str,
+                    'shape': list(arr.shape)}
+            line = json.dumps(header, sort_keys=True).encode('ascii')
+            start = _align(len(MAGIC) + len(line) + 1)
+            new_pos = []
+            p = start
+            for arr in arrays:
+                new_pos.append(p)
+                p = _align(p + arr.nbytes)
+            if new_pos == pos:
+                break
+            pos = new_pos
+
+        with open(path, 'wb') as f:
+            f.write(MAGIC)
+            f.write(line)
+            f.write(b' ' * (start - len(MAGIC) - len(line) - 1) + b'\n')
+            for arr, p in six.moves.zip(arrays, pos):
+                f.write(b'\0' * (p - f.tell()))
+                f.write(arr.tobytes())
+
+    @classmethod
+    def load(cls, path, mmap=False):
+        """
+        Load an index saved by :meth:`save`.
+
+        Args:
+            path (str): Path of the file.
+            mmap (bool): Map the arrays of the file into memory instead of
+                reading them.
+
+        Returns:
+            IVFIndex
+        """
+        with open(path, 'rb') as f:
+            magic = f.read(len(MAGIC))
+            if magic != MAGIC:
+                raise ParseError(b'Invalid magic: ' + magic)
+            line = f.readline()
+            try:
+                header = json.loads(line.decode('ascii'))
+            except ValueError:
+                raise ParseError(b'Invalid header line: ' + line)
+            if header.get('version') != VERSION:
+                raise ParseError(
+                    ('Unsupported version: %s' % header.get('version')
+                     ).encode('utf-8'))
+            arrays = {}
+            buf = np.memmap(path, dtype=np.uint8, mode='r') if mmap else None
+            for name, spec in six.iteritems(header['arrays']):
+                dtype = np.dtype(str(spec['dtype']))
+                shape = tuple(spec['shape'])
+                count = int(np.prod(shape))
+                if count == 0:
+                    arrays[name] = np.empty(shape, dtype=dtype)
+                elif mmap:
+                    arrays[name] = np.ndarray(shape, dtype=dtype, buffer=buf,
+                                              offset=spec['offset'])
+                else:
+                    f.seek(spec['offset'])
+                    data = f.read(count * dtype.itemsize)
+                    if len(data) != count * dtype.itemsize:
+                        raise ParseError(b'Unexpected end of file')
+                    arrays[name] = np.frombuffer(data, dtype=dtype).reshape(
+                        shape).copy()
+        return cls(arrays, header['metric'], header['nprobe'])
@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+"""
+Lazy loading of word embedding files, where vectors are parsed only when they
+are accessed (see
+:func:`~word_embedding_loader.word_embedding.WordEmbedding.load` with
+``lazy=True``).
+
+The first load scans the file for its words and the position of the vector of
+each word, without parsing the vectors. The result is saved next to the file
+(at :func:`index_path`) in the ``'wel'`` format (see
+:mod:`word_embedding_loader.loader.wel`), with the position of each word as
+its only value. Later loads of the same file only map this index into memory,
+which takes a fraction of a second whatever the size of the file. The index is
+rebuilt if the file has changed since, and it is kept in memory if it cannot
+be written.
+"""
+
+from __future__ import absolute_import, division, print_function, \
+    unicode_literals
+
+import itertools
+import os
+import tempfile
+
+import numpy as np
+
+from word_embedding_loader import ParseError, loader, saver
+from word_embedding_loader._fileinfo import stat_file
+from word_embedding_loader.arrays import LazyVectors
+from word_embedding_loader.cache import _remove, _replace
+from word_embedding_loader.saver._rows import vocab_pairs
+from word_embedding_loader.vocabulary import Vocabulary
+
+
+__all__ = ["index_path", "load_lazy", "CACHE_ROWS"]
+
+
+# Default number of decoded rows kept in memory
+CACHE_ROWS = 1 << 16
+
+_SUFFIX = '.offsets.wel'
+
+
+def index_path(path):
+    """
+    Path of the index of the positions of the vectors in a file.
+
+    Args:
+        path (str): Path of the word embedding file.
+
+    Returns:
+        str
+    """
+    return path + _SUFFIX
+
+
+def _describe(path, mod):
+    return dict(stat_file(path), format=mod.format, binary=mod.binary)
+
+
+def _read_index(path, source, max_vocab):
+    try:
+        f = open(index_path(path), mode='rb')
+    except (IOError, OSError):
+        return None
+    with f:
+        try:
+            header = loader.wel.read_header(f)
+            found = dict(header['source'] or {})
+            size = found.pop('dimension', None)
+            if found != source or size is None:
+                return None
+            f.seek(0)
+            arr, vocab = loader.wel.load_mmap(f, dtype=np.int64,
+                                              max_vocab=max_vocab)
+        except (ParseError, KeyError, ValueError):
+            return None
+    return np.asarray(arr)[:, 0], vocab, size
+
+
+def _write_index(path, offsets, vocab, source):
+    dirname = os.path.dirname(os.path.abspath(path))
+    try:
+        fd, tmp_path = tempfile.mkstemp(suffix='.tmp', dir=dirname)
+    except (IOError, OSError):
+        # The directory is not writable
+        return False
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            saver.wel.save(f, offsets[:, None], vocab_pairs(vocab),
+                           source=source)
+        _replace(tmp_path, index_path(path))
+    except (IOError, OSError):
+        _remove(tmp_path)
+        return False
+    except BaseException:
+        _remove(tmp_path)
+        raise
+    return True
+
+
+def load_lazy(path, mod, dtype=np.float32, max_vocab=None,
+              cache_rows=CACHE_ROWS, fin=None):
+    """
+    Load a word embedding file lazily.
+
+    Args:
+        path (str): Path of file to load.
+        mod: Namespace of the format of the file, whose loader has
+            ``scan_offsets`` and ``read_rows_at``.
+        dtype (numpy.dtype): Element data type of the vectors.
+        max_vocab (int): Number of vocabulary to read.
+        cache_rows (int): Maximum number of parsed rows kept in memory (see
+            :class:`~word_embedding_loader.arrays.LazyVectors`).
+        fin (File or None): File object of ``path`` positioned at the
+            beginning, to scan instead of opening the file again.
+
+    Returns:
+        word_embedding_loader.arrays.LazyVectors: Vectors.
+        word_embedding_loader.vocabulary.Vocabulary: Mapping from words to
+        vector indices.
+    """
+    source = _describe(path, mod)
+    index = _read_index(path, source, max_vocab)
+    if index is None:
+        if fin is None:
+            with open(path, mode='rb') as f:
+                offsets, vocab, size = mod.loader.scan_offsets(f)
+        else:
+            offsets, vocab, size = mod.loader.scan_offsets(fin)
+        if _write_index(path, offsets, vocab,
+                        dict(source, dimension=size)):
+            index = _read_index(path, source, max_vocab)
+    if index is None:
+        # Keep the index in memory
+        if max_vocab is not None and max_vocab < len(vocab):
+            vocab = Vocabulary.from_words(itertools.islice(vocab, max_vocab))
+            offsets = offsets[:max_vocab]
+    else:
+        offsets, vocab, size = index
+    vectors = LazyVectors(path, offsets, size, mod.loader.read_rows_at,
+                          dtype=dtype, cache_rows=cache_rows)
+    return vectors, vocab
@@ -0,0 +1,350 @@
+# -*- coding: utf-8 -*-
+"""
+Multi-process parsing shared by the loaders of text formats
+(:mod:`~word_embedding_loader.loader.glove` and
+:mod:`~word_embedding_loader.loader.word2vec_text`).
+
+The part of a file after its header is split into byte ranges aligned to
+line boundaries, and each range is parsed by a process of a
+:class:`multiprocessing.Pool`. For :func:`load`, lines of each range are
+counted first so that every process writes its rows directly into its slice
+of a shared memory array, which the pool inherits when it starts. The
+vocabulary is merged in the parent process in the order of the file, so
+duplicated words are warned about and skipped just as in sequential loading.
+Files too small to be split into several ranges should be loaded
+sequentially (see :func:`can_split`), which avoids starting processes.
+"""
+
+from __future__ import absolute_import, division, print_function, \
+    unicode_literals
+
+import bz2
+import contextlib
+import gzip
+import itertools
+import multiprocessing
+import os
+
+import numpy as np
+import six
+
+from word_embedding_loader.loader import _text
+from word_embedding_loader.vocabulary import VocabularyBuilder
+
+
+# Number of ranges per process; more ranges than processes balance the load
+# when some parts of the file are slower to parse
+_RANGES_PER_WORKER = 4
+
+# Ranges are not made smaller than this many bytes
+_MIN_RANGE_BYTES = _text.BLOCK_SIZE
+
+# File objects of decompressed files, which cannot be reopened by name
+_DECOMPRESSING_TYPES = (gzip.GzipFile, bz2.BZ2File)
+try:
+    import lzma
+    _DECOMPRESSING_TYPES += (lzma.LZMAFile,)
+except ImportError:
+    pass
+
+# State of worker processes set by _init_worker
+_worker = {}
+
+
+def file_path(fin):
+    """
+    Get the path of the file behind ``fin``, which worker processes reopen.
+
+    Args:
+        fin (File): File object.
+
+    Returns:
+        str or None: Path of the file, or ``None`` if ``fin`` is not a
+        regular file (e.g. :class:`io.BytesIO` or :class:`gzip.GzipFile`).
+    """
+    if isinstance(fin, _DECOMPRESSING_TYPES):
+        # They have the name of the compressed file
+        return None
+    name = getattr(fin, 'name', None)
+    if not isinstance(name, (six.text_type, bytes)):
+        return None
+    if not os.path.isfile(name):
+        return None
+    return name
+
+
+def split_ranges(fin, start, n):
+    """
+    Split the part of a file after ``start`` into byte ranges that begin at
+    the beginning of a line.
+
+    Args:
+        fin (File): File object to read.
+        start (int): Position of the first line to split.
+        n (int): Number of ranges. Fewer ranges are returned for small files.
+
+    Returns:
+        list: ``(start, end)`` positions of each range.
+    """
+    fin.seek(0, os.SEEK_END)
+    end = fin.tell()
+    n = max(1, min(n, (end - start) // max(1, _MIN_RANGE_BYTES)))
+    bounds = [start]
+    for k in six.moves.range(1, n):
+        pos = start + (end - start) * k // n
+        if pos <= bounds[-1]:
+            continue
+        # Move to the beginning of the next line
+        fin.seek(pos - 1)
+        fin.readline()
+        pos = fin.tell()
+        if bounds[-1] < pos < end:
+            bounds.append(pos)
+    bounds.append(end)
+    return list(six.moves.zip(bounds[:-1], bounds[1:]))
+
+
+def can_split(fin, workers):
+    """
+    Check whether the part of a file after its current position is large
+    enough to be split into several ranges.
+
+    Args:
+        fin (File): File object positioned at the first line to parse.
+        workers (int): Number of processes.
+
+    Returns:
+        bool: ``True`` if there would be more than one range.
+    """
+    start = fin.tell()
+    try:
+        return len(split_ranges(fin, start,
+                                workers * _RANGES_PER_WORKER)) > 1
+    finally:
+        fin.seek(start)
+
+
+def _iter_range(fin, start, end, max_rows=None):
+    # Blocks of lines in [start, end) of fin
+    fin.seek(start)
+    pos = start
+    n = 0
+    while pos < end and (max_rows is None or n < max_rows):
+        lines = fin.readlines(min(_text.BLOCK_SIZE, end - pos))
+        if not lines:
+            break
+        if max_rows is not None:
+            lines = lines[:max_rows - n]
+        n += len(lines)
+        pos += sum(len(line) for line in lines)
+        yield lines
+
+
+def _count_lines(fin, start, end):
+    # Number of lines in [start, end) of fin
+    n = 0
+    last = b'\n'
+    fin.seek(start)
+    remaining = end - start
+    while remaining > 0:
+        chunk = fin.read(min(_text.BLOCK_SIZE, remaining))
+        if not chunk:
+            break
+        n += chunk.count(b'\n')
+        last = chunk[-1:]
+        remaining -= len(chunk)
+    if last != b'\n':
+        n += 1
+    return n
+
+
+def _parse_range(task):
+    # Parse rows of a range into their slice of the shared array
+    path, start, end, row, n_rows = task
+    arr = _worker['arr']
+    size = arr.shape[1]
+    tokens = []
+    pos = start
+    with open(path, 'rb') as fin:
+        for lines in _iter_range(fin, start, end, n_rows):
+            block_tokens, values = _text.split_lines(lines)
+            i = row + len(tokens)
+            arr[i:i + len(lines)] = _text.parse_values(
+                lines, values, arr.dtype, size)
+            tokens.extend(block_tokens)
+            pos += sum(len(line) for line in lines)
+    # pos is the position of the line after the last parsed one
+    return tokens, pos
+
+
+def _filter_range(task):
+    # Parse the rows of words in the vocabulary in a range
+    path, start, end, dtype, size = task
+    vocab = _worker['vocab']
+    found = set()
+    tokens = []
+    blocks = []
+    with open(path, 'rb') as fin:
+        for lines in _iter_range(fin, start, end):
+            block_tokens, lines = _text.filter_lines(lines, vocab, found)
+            if lines:
+                _, values = _text.split_lines(lines)
+                tokens.extend(block_tokens)
+                blocks.append(_text.parse_values(lines, values, dtype, size))
+    if not blocks:
+        return tokens, None
+    return tokens, np.concatenate(blocks)
+
+
+def _init_worker(buf, dtype, size, vocab):
+    if buf is not None:
+        _worker['arr'] = np.frombuffer(buf, dtype=dtype).reshape(-1, size)
+    _worker['vocab'] = vocab
+
+
+@contextlib.contextmanager
+def _pool(processes, buf=None, dtype=None, size=None, vocab=None):
+    # Workers inherit buf, which cannot be passed to them afterwards
+    pool = multiprocessing.Pool(processes, _init_worker,
+                                (buf, dtype, size, vocab))
+    try:
+        yield pool
+        pool.close()
+    except BaseException:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+
+
+def _read_size(fin, start):
+    fin.seek(start)
+    line = fin.readline()
+    if not line:
+        return None
+    _, values = _text.split_lines([line])
+    return _text.count_values(values[0])
+
+
+def load(fin, workers, dtype=np.float32, max_vocab=None, size=None):
+    """
+    Load lines of ``token v_1 ... v_size`` from the current position of a
+    file in parallel. Check :func:`word_embedding_loader.loader.glove.load`
+    for the API.
+
+    Args:
+        fin (File): File object positioned at the first line to parse.
+            :func:`file_path` must not be ``None``.
+        workers (int): Number of processes.
+        dtype (numpy.dtype): Element data type to use for the array.
+        max_vocab (int): Number of vocabulary to read.
+        size (int): Expected number of values in each line. It is determined
+            from the first line if ``None``.
+
+    Returns:
+        numpy.ndarray or None: Word embedding representation vectors.
+        ``None`` if there is no line to parse.
+        word_embedding_loader.vocabulary.Vocabulary: Mapping from words to
+        vector indices.
+    """
+    path = file_path(fin)
+    start = fin.tell()
+    vocab = VocabularyBuilder()
+    if size is None:
+        size = _read_size(fin, start)
+        if size is None:
+            return None, vocab.build()
+    dtype = np.dtype(dtype)
+
+    ranges = split_ranges(fin, start, workers * _RANGES_PER_WORKER)
+    # Lines are counted before starting the pool, which must inherit the
+    # shared array. Counting is bound by the speed of reading, not parsing,
+    # and it stops at max_vocab lines.
+    tasks = []
+    rows = 0
+    for s, e in ranges:
+        if max_vocab is not None and rows >= max_vocab:
+            break
+        n = _count_lines(fin, s, e)
+        if max_vocab is not None:
+            n = min(n, max_vocab - rows)
+        tasks.append((path, s, e, rows, n))
+        rows += n
+    if rows == 0:
+        return np.empty((0, size), dtype=dtype), vocab.build()
+
+    buf = multiprocessing.RawArray('b', rows * size * dtype.itemsize)
+    with _pool(min(workers, len(tasks)), buf, dtype, size) as pool:
+        results = pool.map(_parse_range, tasks, chunksize=1)
+    # arr shares memory with buf, which is kept alive as its base
+    arr = np.frombuffer(buf, dtype=dtype).reshape(rows, size)
+
+    keep, _ = vocab.add_tokens(
+        list(itertools.chain.from_iterable(t for t, _ in results)))
+    if len(keep) != rows:
+        arr = arr[keep]
+    if max_vocab is None or len(vocab) >= max_vocab:
+        return arr, vocab.build()
+
+    # Duplicated words were skipped, so read more lines up to max_vocab
+    fin.seek(results[-1][1])
+    blocks = [arr]
+    for lines in _text.iter_blocks(fin):
+        if len(vocab) >= max_vocab:
+            break
+        tokens, values = _text.split_lines(lines)
+        keep, n = vocab.add_tokens(tokens, max_vocab)
+        block = _text.parse_values(lines[:n], values[:n], dtype, size)
+        blocks.append(block[keep])
+    return np.concatenate(blocks), vocab.build()
+
+
+def load_with_vocab(fin, vocab, workers, dtype=np.float32, size=None):
+    """
+    Load lines of ``token v_1 ... v_size`` from the current position of a
+    file with predefined vocabulary in parallel. Check
+    :func:`word_embedding_loader.loader.glove.load_with_vocab` for the API.
+
+    Args:
+        fin (File): File object positioned at the first line to parse.
+            :func:`file_path` must not be ``None``.
+        vocab (dict): Mapping from words (``bytes``) to vector indices
+            (``int``).
+        workers (int): Number of processes.
+        dtype (numpy.dtype): Element data type to use for the array.
+        size (int): Expected number of values in each line. It is determined
+            from the first line if ``None``.
+
+    Returns:
+        numpy.ndarray or None: Word embedding representation vectors. Rows of
+        words that are not found are filled with ``NaN``. ``None`` if no word
+        is found.
+    """
+    path = file_path(fin)
+    start = fin.tell()
+    if size is None:
+        size = _read_size(fin, start)
+        if size is None:
+            return None
+
+    ranges = split_ranges(fin, start, workers * _RANGES_PER_WORKER)
+    with _pool(min(workers, len(ranges)), vocab=vocab) as pool:
+        results = pool.map(_filter_range,
+                           [(path, s, e, dtype, size) for s, e in ranges],
+                           chunksize=1)
+    arr = None
+    found = set()
+    # Apply in the order of the file so that the first occurrence wins
+    for tokens, block in results:
+        if block is None:
+            continue
+        if arr is None:
+            arr = np.empty((len(vocab), size), dtype=dtype)
+            arr.fill(np.nan)
+        keep = [i for i, token in enumerate(tokens) if token not in found]
+        found.update(tokens)
+        if len(keep) != len(tokens):
+            tokens = [tokens[i] for i in keep]
+            block = block[keep]
+        arr[[vocab[token] for token in tokens]] = block
+    return arr
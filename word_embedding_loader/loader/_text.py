@@ -0,0 +1,326 @@
+# -*- coding: utf-8 -*-
+"""
+Block parsing shared by the loaders of text formats
+(:mod:`~word_embedding_loader.loader.glove` and
+:mod:`~word_embedding_loader.loader.word2vec_text`). Instead of converting
+values one by one in Python, lines are read in large chunks and the numeric
+columns of all the lines in a chunk are converted with a single NumPy call.
+"""
+
+from __future__ import absolute_import, division, print_function, \
+    unicode_literals
+
+import warnings
+
+import numpy as np
+
+from word_embedding_loader import ParseError
+from word_embedding_loader.progress import NULL
+from word_embedding_loader.vocabulary import VocabularyBuilder
+
+
+# Approximate number of bytes to read and parse at once
+BLOCK_SIZE = 1 << 20
+
+
+def iter_blocks(fin, block_size=None, progress=NULL):
+    """
+    Read lines from a file in chunks.
+
+    Args:
+        fin (File): File object to read.
+        block_size (int): Approximate number of bytes in each chunk.
+            :data:`BLOCK_SIZE` is used if ``None``.
+        progress (word_embedding_loader.progress.Progress): Receives the
+            number of bytes read and the time spent reading.
+
+    Yields:
+        list: Lines (``bytes``) in the chunk. Lines are never split across
+        chunks.
+    """
+    if block_size is None:
+        block_size = BLOCK_SIZE
+    while True:
+        with progress.timer('io'):
+            lines = fin.readlines(block_size)
+        if not lines:
+            break
+        if progress.active:
+            progress.update(nbytes=sum(map(len, lines)))
+        yield lines
+
+
+def count_lines(fin):
+    """
+    Count the remaining lines of a file without parsing them.
+
+    Args:
+        fin (File): File object to read.
+
+    Returns:
+        int: Number of lines, including the last line even if it does not end
+        with a new line.
+    """
+    n = 0
+    last = b'\n'
+    while True:
+        chunk = fin.read(BLOCK_SIZE)
+        if not chunk:
+            break
+        n += chunk.count(b'\n')
+        last = chunk[-1:]
+    if last != b'\n':
+        n += 1
+    return n
+
+
+def split_lines(lines):
+    """
+    Split each line into its token and the (unparsed) numeric part.
+
+    Args:
+        lines (list): Lines (``bytes``) of a chunk.
+
+    Returns:
+        list: Tokens (``bytes``).
+        list: Space separated values (``bytes``) of each line.
+    """
+    tokens = []
+    values = []
+    for line in lines:
+        token, _, v = line.strip().partition(b' ')
+        tokens.append(token)
+        values.append(v)
+    return tokens, values
+
+
+def split_token(line):
+    """
+    Get the token of a line without splitting the rest of it. It is the same
+    as the token returned by :func:`split_lines`.
+
+    Args:
+        line (bytes): Line of a file.
+
+    Returns:
+        bytes: Token.
+    """
+    line = line.lstrip()
+    i = line.find(b' ')
+    return line.rstrip() if i < 0 else line[:i]
+
+
+def filter_lines(lines, vocab, found=None):
+    """
+    Select lines of words in ``vocab`` by looking only at their tokens, so
+    that the values of the other lines are never parsed.
+
+    Args:
+        lines (list): Lines (``bytes``) of a chunk.
+        vocab (dict): Words (``bytes``) to keep.
+        found (set): Words selected so far, updated in place. Lines of these
+            words are skipped, so that only the first occurrence of a
+            duplicated word is selected, as in
+            :func:`~word_embedding_loader.loader.glove.load`.
+
+    Returns:
+        list: Tokens (``bytes``) of the selected lines.
+        list: Selected lines (``bytes``).
+    """
+    if found is None:
+        found = set()
+    tokens = []
+    selected = []
+    for line in lines:
+        token = split_token(line)
+        if token in vocab and token not in found:
+            found.add(token)
+            tokens.append(token)
+            selected.append(line)
+    return tokens, selected
+
+
+def count_values(v):
+    """
+    Count number of space separated values in ``v`` (``bytes``).
+    """
+    return v.count(b' ') + 1 if v else 0
+
+
+def _fromstring(s, dtype):
+    # np.fromstring silently stops at the first malformed value (with a
+    # DeprecationWarning), so treat it as a failure
+    with warnings.catch_warnings():
+        warnings.simplefilter('error', DeprecationWarning)
+        try:
+            return np.fromstring(s, dtype=dtype, sep=' ')
+        except (ValueError, DeprecationWarning):
+            return None
+
+
+def _parse_slow(lines, values, dtype, size):
+    # Line by line fallback that reports the offending line
+    arr = np.empty((len(values), size), dtype=dtype)
+    for i, (line, v) in enumerate(zip(lines, values)):
+        try:
+            row = list(map(float, v.split(b' '))) if v else []
+        except (ValueError, IndexError):
+            raise ParseError(b'Parsing error in line: ' + line)
+        if len(row) != size:
+            raise ParseError(b'Vector size did not match in line: ' + line)
+        arr[i] = row
+    return arr
+
+
+def parse_values(lines, values, dtype, size):
+    """
+    Convert the numeric part of many lines at once.
+
+    Args:
+        lines (list): Original lines (``bytes``). Only used for error messages.
+        values (list): Numeric part of each line as returned by
+            :func:`split_lines`.
+        dtype (numpy.dtype): Element data type to use for the array.
+        size (int): Expected number of values in each line.
+
+    Returns:
+        numpy.ndarray: Array of shape ``(len(values), size)``.
+
+    Raises:
+        ParseError: A value could not be parsed or the number of values in a
+            line is not ``size``.
+    """
+    if all(count_values(v) == size for v in values):
+        arr = _fromstring(b' '.join(values), dtype)
+        if arr is not None and len(arr) == len(values) * size:
+            return arr.reshape(len(values), size)
+    return _parse_slow(lines, values, dtype, size)
+
+
+def scan_offsets(fin, max_rows=None):
+    """
+    Find the token and the position of each line without parsing the values.
+
+    Args:
+        fin (File): File object positioned at the first line to scan.
+        max_rows (int): Number of words to find.
+
+    Returns:
+        numpy.ndarray: ``int64`` byte offset in the file of the line of each
+        word.
+        word_embedding_loader.vocabulary.Vocabulary: Mapping from words to
+        indices. Duplicated words are skipped (with a warning) as in
+        :func:`~word_embedding_loader.loader.glove.load`.
+        int: Number of values in the first line, or ``None`` if there are no
+        lines.
+    """
+    pos = fin.tell()
+    vocab = VocabularyBuilder()
+    offsets = []
+    size = None
+    for lines in iter_blocks(fin):
+        if max_rows is not None and len(vocab) >= max_rows:
+            break
+        if size is None:
+            _, values = split_lines(lines[:1])
+            size = count_values(values[0])
+        lengths = np.fromiter(map(len, lines), dtype=np.int64,
+                              count=len(lines))
+        starts = pos + np.cumsum(lengths) - lengths
+        pos += int(lengths.sum())
+        keep, _ = vocab.add_tokens([split_token(line) for line in lines],
+                                   max_rows)
+        offsets.append(starts[keep])
+    if not offsets:
+        return np.zeros(0, dtype=np.int64), vocab.build(), size
+    return np.concatenate(offsets), vocab.build(), size
+
+
+def read_lines_at(fin, offsets, size, dtype):
+    """
+    Parse the lines that start at the given positions.
+
+    Args:
+        fin (File): File object to read.
+        offsets (numpy.ndarray): Byte offset of each line, as returned by
+            :func:`scan_offsets`.
+        size (int): Expected number of values in each line.
+        dtype (numpy.dtype): Element data type to use for the array.
+
+    Returns:
+        numpy.ndarray: Array of shape ``(len(offsets), size)``.
+    """
+    if len(offsets) == 0:
+        return np.empty((0, size), dtype=dtype)
+    lines = []
+    for offset in np.asarray(offsets).tolist():
+        fin.seek(offset)
+        lines.append(fin.readline())
+    _, values = split_lines(lines)
+    return parse_values(lines, values, dtype, size)
+
+
+def rebatch(blocks, batch_size):
+    """
+    Regroup blocks of rows into batches of a fixed size.
+
+    Args:
+        blocks (iterable): ``(tokens, arr)`` pairs of any size.
+        batch_size (int): Number of rows in each batch.
+
+    Yields:
+        list: Tokens (``bytes``) of at most ``batch_size`` rows.
+        numpy.ndarray: Corresponding vectors. Only the last batch can be
+        smaller than ``batch_size``.
+    """
+    tokens, arrs, n = [], [], 0
+    for block_tokens, block in blocks:
+        pos = 0
+        while pos < len(block_tokens):
+            m = min(batch_size - n, len(block_tokens) - pos)
+            tokens.extend(block_tokens[pos:pos + m])
+            arrs.append(block[pos:pos + m])
+            n += m
+            pos += m
+            if n == batch_size:
+                yield tokens, arrs[0] if len(arrs) == 1 else np.concatenate(arrs)
+                tokens, arrs, n = [], [], 0
+    if n > 0:
+        yield tokens, arrs[0] if len(arrs) == 1 else np.concatenate(arrs)
+
+
+def iter_rows(fin, dtype, batch_size, max_rows=None, size=None,
+              progress=NULL):
+    """
+    Parse lines of ``token v_1 ... v_size`` into batches.
+
+    Args:
+        fin (File): File object positioned at the first line to parse.
+        dtype (numpy.dtype): Element data type to use for the array.
+        batch_size (int): Number of rows in each batch.
+        max_rows (int): Number of lines to read.
+        size (int): Expected number of values in each line. It is determined
+            from the first line if ``None``.
+        progress (word_embedding_loader.progress.Progress): Receives the
+            progress of parsing.
+
+    Yields:
+        list: Tokens (``bytes``).
+        numpy.ndarray: Vectors of shape ``(len(tokens), size)``.
+    """
+    def blocks(size):
+        n = 0
+        for lines in iter_blocks(fin, progress=progress):
+            if max_rows is not None:
+                if n >= max_rows:
+                    break
+                lines = lines[:max_rows - n]
+            n += len(lines)
+            with progress.timer('parse'):
+                tokens, values = split_lines(lines)
+                if size is None:
+                    size = count_values(values[0])
+                block = parse_values(lines, values, dtype, size)
+            progress.update(rows=len(tokens))
+            yield tokens, block
+    return rebatch(blocks(size), batch_size)
@@ -11,7 +11,9 @@ from __future__ import absolute_import, division, print_function, \
 
 import numpy as np
 
-from word_embedding_loader import ParseError, parse_warn
+from word_embedding_loader.loader import _parallel, _text
+from word_embedding_loader.progress import as_progress
+from word_embedding_loader.vocabulary import VocabularyBuilder
 
 
 def check_valid(line0, line1):
@@ -37,14 +39,57 @@ def check_valid(line0, line1):
     return True
 
 
-def _parse_line(line, dtype):
-    data = line.strip().split(b' ')
-    token = data[0]
-    v = list(map(dtype, data[1:]))
-    return token, v
+def read_shape(fin):
+    """
+    Determine the shape of the vectors in a file without parsing them.
+
+    Args:
+        fin (File): File object to read. File should be open for reading ascii.
+
+    Returns:
+        tuple: Number of rows and feature dimension (``int``) of the
+        vectors. Duplicated words are counted as separate rows.
+    """
+    line = fin.readline()
+    if not line:
+        return 0, 0
+    _, values = _text.split_lines([line])
+    return 1 + _text.count_lines(fin), _text.count_values(values[0])
+
+
+# Number of rows allocated up front when the vocabulary size is unknown
+_INITIAL_ROWS = 1024
 
 
-def load_with_vocab(fin, vocab, dtype=np.float32):
+def _initial_rows(max_vocab):
+    if max_vocab is None:
+        return _INITIAL_ROWS
+    return max(1, min(max_vocab, _INITIAL_ROWS))
+
+
+def _grow(arr, n_rows, max_vocab=None):
+    """
+    Enlarge ``arr`` to hold at least ``n_rows`` rows. The capacity is at least
+    doubled (capped at ``max_vocab``) so that appending rows costs amortized
+    O(1). ``arr`` must own its data.
+    """
+    n = 2 * len(arr)
+    if max_vocab is not None:
+        n = min(n, max_vocab)
+    arr.resize((max(n, n_rows), arr.shape[1]), refcheck=False)
+    return arr
+
+
+def _use_workers(fin, workers):
+    # Parallel loading requires a regular file that workers can reopen, and
+    # is not worth starting processes for a single range
+    return workers is not None and workers > 1 and \
+        _parallel.file_path(fin) is not None and \
+        _parallel.can_split(fin, workers)
+
+
+def load_with_vocab(fin, vocab, dtype=np.float32, workers=None,
+                    progress=None):
     """
     Load word embedding file with predefined vocabulary
 
@@ -53,27 +98,48 @@ def load_with_vocab(fin, vocab, dtype=np.float32):
         vocab (dict): Mapping from words (``bytes``) to vector indices
             (``int``).
         dtype (numpy.dtype): Element data type to use for the array.
+        workers (int): Number of processes to parse the file with. The file
+            is parsed in the current process if ``None`` or ``1``, if
+            ``fin`` is not a regular file, or if it is too small to be split
+            (see :mod:`word_embedding_loader.loader._parallel`).
+        progress (word_embedding_loader.progress.Progress or callable):
+            Receives the progress of loading (see
+            :mod:`word_embedding_loader.progress`). Not reported when the
+            file is parsed by several processes.
 
     Returns:
         numpy.ndarray: Word embedding representation vectors
     """
+    if _use_workers(fin, workers):
+        return _parallel.load_with_vocab(fin, vocab, workers, dtype=dtype)
+    progress = as_progress(progress)
     arr = None
-    for line in fin:
-        try:
-            token, v = _parse_line(line, dtype)
-        except (ValueError, IndexError):
-            raise ParseError(b'Parsing error in line: ' + line)
-        if token in vocab:
+    size = None
+    # Words found so far; later occurrences of them are skipped
+    found = set()
+    for lines in _text.iter_blocks(fin, progress=progress):
+        n = len(lines)
+        with progress.timer('parse'):
+            if size is None:
+                _, values = _text.split_lines(lines[:1])
+                size = _text.count_values(values[0])
+            # Only lines of words in vocab are parsed
+            tokens, lines = _text.filter_lines(lines, vocab, found)
+            if lines:
+                _, values = _text.split_lines(lines)
+                block = _text.parse_values(lines, values, dtype, size)
+        progress.update(rows=n)
+        if not lines:
+            continue
+        with progress.timer('assemble'):
             if arr is None:
-                arr = np.empty((len(vocab), len(v)), dtype=dtype)
-                arr.fill(np.NaN)
-            elif arr.shape[1] != len(v):
-                raise ParseError(b'Vector size did not match in line: ' + line)
-            arr[vocab[token], :] = np.array(v, dtype=dtype).reshape(1, -1)
+                arr = np.empty((len(vocab), size), dtype=dtype)
+                arr.fill(np.nan)
+            arr[[vocab[token] for token in tokens]] = block
     return arr
 
 
-def load(fin, dtype=np.float32, max_vocab=None):
+def load(fin, dtype=np.float32, max_vocab=None, workers=None, progress=None):
     """
     Load word embedding file.
 
@@ -81,31 +147,104 @@ def load(fin, dtype=np.float32, max_vocab=None):
         fin (File): File object to read. File should be open for reading ascii.
         dtype (numpy.dtype): Element data type to use for the array.
         max_vocab (int): Number of vocabulary to read.
+        workers (int): Number of processes to parse the file with (see
+            :mod:`word_embedding_loader.loader._parallel`). The file is parsed
+            in the current process if ``None`` or ``1``, if ``fin`` is not a
+            regular file, or if it is too small to be split.
+        progress (word_embedding_loader.progress.Progress or callable):
+            Receives the progress of loading (see
+            :mod:`word_embedding_loader.progress`). Not reported when the
+            file is parsed by several processes.
 
     Returns:
         numpy.ndarray: Word embedding representation vectors
-        dict: Mapping from words to vector indices.
+        word_embedding_loader.vocabulary.Vocabulary: Mapping from words to
+        vector indices.
 
     """
-    vocab = {}
+    if _use_workers(fin, workers):
+        return _parallel.load(fin, workers, dtype=dtype, max_vocab=max_vocab)
+    progress = as_progress(progress)
+    vocab = VocabularyBuilder()
     arr = None
-    i = 0
-    for line in fin:
-        if max_vocab is not None and i >= max_vocab:
+    for lines in _text.iter_blocks(fin, progress=progress):
+        if max_vocab is not None and len(vocab) >= max_vocab:
             break
-        try:
-            token, v = _parse_line(line, dtype)
-        except (ValueError, IndexError):
-            raise ParseError(b'Parsing error in line: ' + line)
-        if token in vocab:
-            parse_warn(b'Duplicated vocabulary ' + token)
-            continue
-        if arr is None:
-            arr = np.array(v, dtype=dtype).reshape(1, -1)
-        else:
-            if arr.shape[1] != len(v):
-                raise ParseError(b'Vector size did not match in line: ' + line)
-            arr = np.append(arr, [v], axis=0)
-        vocab[token] = i
-        i += 1
-    return arr, vocab
+        with progress.timer('parse'):
+            tokens, values = _text.split_lines(lines)
+            i = len(vocab)
+            keep, n = vocab.add_tokens(tokens, max_vocab)
+            if arr is None:
+                arr = np.empty((_initial_rows(max_vocab),
+                                _text.count_values(values[0])), dtype=dtype)
+            # Duplicated words are parsed (and checked) too, but not stored
+            block = _text.parse_values(lines[:n], values[:n], dtype,
+                                       arr.shape[1])
+        with progress.timer('assemble'):
+            if len(vocab) > len(arr):
+                arr = _grow(arr, len(vocab), max_vocab)
+            arr[i:len(vocab)] = block if len(keep) == n else block[keep]
+        progress.update(rows=n)
+    if arr is not None and len(arr) != len(vocab):
+        # Release the unused capacity; this is a realloc, not a copy
+        arr.resize((len(vocab), arr.shape[1]), refcheck=False)
+    return arr, vocab.build()
+
+
+def iter_rows(fin, dtype=np.float32, batch_size=1024, max_vocab=None,
+              progress=None):
+    """
+    Read word embedding file in batches, holding only one batch in memory at
+    a time. Unlike :func:`load`, duplicated words are not removed.
+
+    Args:
+        fin (File): File object to read. File should be open for reading ascii.
+        dtype (numpy.dtype): Element data type to use for the array.
+        batch_size (int): Number of rows in each batch.
+        max_vocab (int): Number of rows to read.
+        progress (word_embedding_loader.progress.Progress or callable):
+            Receives the progress of reading (see
+            :mod:`word_embedding_loader.progress`).
+
+    Yields:
+        list: Words (``bytes``) in the batch.
+        numpy.ndarray: Vectors of shape ``(len(words), feature dimension)``.
+    """
+    return _text.iter_rows(fin, dtype, batch_size, max_rows=max_vocab,
+                           progress=as_progress(progress))
+
+
+def scan_offsets(fin, max_vocab=None):
+    """
+    Find the words of a file and the position of their vectors without
+    parsing the vectors.
+
+    Args:
+        fin (File): File object to read. File should be open for reading ascii.
+        max_vocab (int): Number of vocabulary to find.
+
+    Returns:
+        numpy.ndarray: ``int64`` position of the vector of each word, to be
+        passed to :func:`read_rows_at`.
+        word_embedding_loader.vocabulary.Vocabulary: Mapping from words to
+        vector indices, as returned by :func:`load`.
+        int: Feature dimension.
+    """
+    offsets, vocab, size = _text.scan_offsets(fin, max_vocab)
+    return offsets, vocab, 0 if size is None else size
+
+
+def read_rows_at(fin, offsets, size, dtype=np.float32):
+    """
+    Parse the vectors at positions found by :func:`scan_offsets`.
+
+    Args:
+        fin (File): File object to read. File should be open for reading ascii.
+        offsets (numpy.ndarray): Positions of the vectors to read.
+        size (int): Feature dimension.
+        dtype (numpy.dtype): Element data type to use for the array.
+
+    Returns:
+        numpy.ndarray: Vectors of shape ``(len(offsets), size)``.
+    """
+    return _text.read_lines_at(fin, offsets, size, dtype)
@@ -0,0 +1,395 @@
+# -*- coding: utf-8 -*-
+"""
+Low level API for loading of the native binary format of this package.
+It is meant as a cache of files in other formats that can be reloaded
+without any parsing, either by reading it or by mapping it into memory.
+
+A file consists of the following sections.
+
+#. :data:`MAGIC` followed by a header line, which is a JSON object with
+   ``version``, ``dtype`` (:attr:`numpy.dtype.str` of the vectors), ``shape``
+   (``[vocabulary size, feature dimension]``) and ``source`` (description of
+   the file it was converted from, or ``null``). The line is padded with spaces so that the vectors
+   start at a multiple of :data:`ALIGN`.
+#. Vectors as a raw C-contiguous array.
+#. If the header has ``"quantized": true`` (format version 2), the vectors
+   are ``uint8`` codes and they are followed by padding to a multiple of
+   :data:`ALIGN`, the scale of each row and the offset of each row, as
+   :data:`SCALE_DTYPE` (see
+   :class:`word_embedding_loader.arrays.QuantizedVectors`).
+#. Padding to a multiple of :data:`ALIGN`, then ``vocabulary size + 1``
+   little-endian ``int64`` offsets; word ``i`` is
+   ``tokens[offsets[i]:offsets[i + 1]]``.
+#. Words (``bytes``) concatenated in the order of vector indices.
+#. If the header has ``"hash": "crc32"``, padding to a multiple of
+   :data:`ALIGN` and the hash table of the words (see
+   :func:`word_embedding_loader.vocabulary.build_table`), so that the
+   vocabulary is loaded (or memory-mapped) without hashing every word.
+   Files without it are still valid; the table is then built when loading.
+"""
+
+from __future__ import absolute_import, division, print_function, \
+    unicode_literals
+
+import json
+
+import numpy as np
+import six
+
+from word_embedding_loader import ParseError
+from word_embedding_loader.arrays import QuantizedVectors, map_rows
+from word_embedding_loader.progress import NULL, as_progress
+from word_embedding_loader.vocabulary import HASH, Vocabulary, table_dtype, \
+    table_size
+
+
+MAGIC = b'\x93WEL\x01\n'
+VERSION = 1
+# Version of files with quantized vectors, which older versions cannot read
+QUANTIZED_VERSION = 2
+ALIGN = 64
+OFFSET_DTYPE = np.dtype('<i8')
+SCALE_DTYPE = np.dtype('<f4')
+
+# Approximate number of bytes of vectors read at once, and between progress
+# reports
+_CHUNK_BYTES = 1 << 24
+
+
+def check_valid(line0, line1):
+    """
+    Check :func:`word_embedding_loader.loader.glove.check_valid` for the API.
+    """
+    return line0 == MAGIC
+
+
+def _align(n):
+    return -(-n // ALIGN) * ALIGN
+
+
+def read_header(fin):
+    """
+    Read the header of a file.
+
+    Args:
+        fin (File): File object to read. File should be positioned at the
+            beginning of the file.
+
+    Returns:
+        dict: Header; see the module documentation. In addition, it contains
+        ``vectors_offset``, ``offsets_offset`` and ``tokens_offset`` (and
+        ``scales_offset`` for quantized vectors), which are positions of each
+        section in the file.
+    """
+    magic = fin.read(len(MAGIC))
+    if magic != MAGIC:
+        raise ParseError(b'Invalid magic: ' + magic)
+    line = fin.readline()
+    try:
+        header = json.loads(line.decode('ascii'))
+    except ValueError:
+        raise ParseError(b'Invalid header line: ' + line)
+    if header.get('version') not in (VERSION, QUANTIZED_VERSION):
+        raise ParseError(
+            ('Unsupported version: %s' % header.get('version')).encode('utf-8'))
+    words, size = header['shape']
+    itemsize = np.dtype(str(header['dtype'])).itemsize
+    header['vectors_offset'] = len(MAGIC) + len(line)
+    vectors_end = header['vectors_offset'] + words * size * itemsize
+    if header.get('quantized'):
+        header['scales_offset'] = _align(vectors_end)
+        vectors_end = header['scales_offset'] + \
+            2 * words * SCALE_DTYPE.itemsize
+    header['offsets_offset'] = _align(vectors_end)
+    header['tokens_offset'] = \
+        header['offsets_offset'] + (words + 1) * OFFSET_DTYPE.itemsize
+    return header
+
+
+def read_shape(fin):
+    """
+    Refer to :func:`word_embedding_loader.loader.glove.read_shape` for the API.
+    """
+    return tuple(read_header(fin)['shape'])
+
+
+def _read_exact(fin, n):
+    data = fin.read(n)
+    if len(data) != n:
+        raise ParseError(b'Unexpected end of file')
+    return data
+
+
+def _read_scales(fin, header, end, start=0):
+    # Scales and offsets of rows [start, end) of quantized vectors
+    ret = []
+    for section in six.moves.range(2):
+        fin.seek(header['scales_offset'] + SCALE_DTYPE.itemsize *
+                 (section * header['shape'][0] + start))
+        ret.append(np.frombuffer(
+            _read_exact(fin, (end - start) * SCALE_DTYPE.itemsize),
+            dtype=SCALE_DTYPE))
+    return tuple(ret)
+
+
+def _dequantize(codes, scale, offset, dtype):
+    arr = codes.astype(dtype)
+    arr *= scale[:, None]
+    arr += offset[:, None]
+    return arr
+
+
+def table_offset(header, tokens_bytes):
+    """
+    Position of the hash table in a file.
+
+    Args:
+        header (dict): Header as returned by :func:`read_header`.
+        tokens_bytes (int): Total length of the words.
+
+    Returns:
+        int
+    """
+    return _align(header['tokens_offset'] + tokens_bytes)
+
+
+def _has_table(header, words):
+    # The table in the file can only be used for all the words
+    return header.get('hash') == HASH and words == header['shape'][0]
+
+
+def _read_vocab(fin, header, words):
+    # Read the first `words` words
+    fin.seek(header['offsets_offset'])
+    offsets = np.frombuffer(
+        _read_exact(fin, (words + 1) * OFFSET_DTYPE.itemsize),
+        dtype=OFFSET_DTYPE)
+    fin.seek(header['tokens_offset'])
+    tokens = _read_exact(fin, int(offsets[words]))
+    table = None
+    if _has_table(header, words):
+        fin.seek(table_offset(header, len(tokens)))
+        dtype = table_dtype(words)
+        table = np.frombuffer(
+            _read_exact(fin, table_size(words) * dtype.itemsize), dtype=dtype)
+    return Vocabulary(tokens, offsets, table)
+
+
+def _readinto_rows(fin, arr, progress):
+    # Fill arr from the file in chunks so that progress can be reported
+    if not progress.active:
+        if len(arr) > 0 and fin.readinto(arr) != arr.nbytes:
+            raise ParseError(b'Unexpected end of file')
+        return
+    step = max(1, _CHUNK_BYTES // max(1, arr[:1].nbytes))
+    for start in six.moves.range(0, len(arr), step):
+        chunk = arr[start:start + step]
+        with progress.timer('io'):
+            if fin.readinto(chunk) != chunk.nbytes:
+                raise ParseError(b'Unexpected end of file')
+        progress.update(rows=len(chunk), position=fin.tell())
+
+
+def _iter_chunks(fin, header, words, progress=NULL):
+    # Read the first `words` vectors in chunks; quantized vectors are
+    # dequantized to float32
+    size = header['shape'][1]
+    file_dtype = np.dtype(str(header['dtype']))
+    scales = None
+    if header.get('quantized'):
+        scales = _read_scales(fin, header, words)
+    step = max(1, _CHUNK_BYTES // max(1, size * file_dtype.itemsize))
+    fin.seek(header['vectors_offset'])
+    for start in six.moves.range(0, words, step):
+        n = min(step, words - start)
+        chunk = np.empty((n, size), dtype=file_dtype)
+        with progress.timer('io'):
+            if fin.readinto(chunk) != chunk.nbytes:
+                raise ParseError(b'Unexpected end of file')
+        progress.update(rows=n, position=fin.tell())
+        if scales is not None:
+            with progress.timer('assemble'):
+                chunk = _dequantize(chunk, scales[0][start:start + n],
+                                    scales[1][start:start + n], np.float32)
+        yield start, chunk
+
+
+def load_with_vocab(fin, vocab, dtype=np.float32, progress=None):
+    """
+    Refer to :func:`word_embedding_loader.loader.glove.load_with_vocab` for the API.
+    """
+    progress = as_progress(progress)
+    header = read_header(fin)
+    words, size = header['shape']
+    with progress.timer('io'):
+        file_vocab = _read_vocab(fin, header, words)
+    # target[i] is the index in vocab of the i-th vector in the file
+    target = np.full(words, -1, dtype=np.int64)
+    for token, idx in six.iteritems(vocab):
+        i = file_vocab.get(token)
+        if i is None:
+            raise ParseError(
+                b"Some of vocab was not found in word embedding file")
+        target[i] = idx
+    arr = np.empty((len(vocab), size), dtype=dtype)
+    for start, chunk in _iter_chunks(fin, header, words, progress):
+        with progress.timer('assemble'):
+            t = target[start:start + len(chunk)]
+            rows = t >= 0
+            arr[t[rows]] = chunk[rows]
+    return arr
+
+
+def load(fin, dtype=np.float32, max_vocab=None, progress=None):
+    """
+    Refer to :func:`word_embedding_loader.loader.glove.load` for the API.
+    Quantized vectors are returned as
+    :class:`~word_embedding_loader.arrays.QuantizedVectors`, which are
+    dequantized to ``dtype`` when rows are accessed.
+    """
+    progress = as_progress(progress)
+    header = read_header(fin)
+    words, size = header['shape']
+    if max_vocab is not None:
+        words = min(max_vocab, words)
+    file_dtype = np.dtype(str(header['dtype']))
+    if header.get('quantized'):
+        codes = np.empty((words, size), dtype=file_dtype)
+        _readinto_rows(fin, codes, progress)
+        with progress.timer('io'):
+            scales = _read_scales(fin, header, words)
+        arr = QuantizedVectors(codes, *scales, dtype=dtype)
+    elif file_dtype == np.dtype(dtype):
+        arr = np.empty((words, size), dtype=file_dtype)
+        _readinto_rows(fin, arr, progress)
+    else:
+        # Convert chunk by chunk to avoid a full size temporary array
+        arr = np.empty((words, size), dtype=dtype)
+        for start, chunk in _iter_chunks(fin, header, words, progress):
+            with progress.timer('assemble'):
+                arr[start:start + len(chunk)] = chunk
+    with progress.timer('io'):
+        vocab = _read_vocab(fin, header, words)
+    return arr, vocab
+
+
+def _map_file(fin):
+    buf = np.memmap(fin, dtype=np.uint8, mode='r')
+    fin.seek(0)
+    header = read_header(fin)
+    words, size = header['shape']
+    row_bytes = size * np.dtype(str(header['dtype'])).itemsize
+    offsets = header['vectors_offset'] + row_bytes * np.arange(
+        words, dtype=np.int64)
+    return buf, header, offsets
+
+
+def _map_vocab(buf, header, words):
+    # Vocabulary of the first `words` words that refers to the mapped file
+    start = header['offsets_offset']
+    offsets = buf[start:start + (words + 1) * OFFSET_DTYPE.itemsize].view(
+        OFFSET_DTYPE)
+    if len(offsets) != words + 1:
+        raise ParseError(b'Unexpected end of file')
+    start = header['tokens_offset']
+    tokens_bytes = int(offsets[words])
+    tokens = buf[start:start + tokens_bytes]
+    table = None
+    if _has_table(header, words):
+        start = table_offset(header, tokens_bytes)
+        dtype = table_dtype(words)
+        table = buf[start:start + table_size(words) * dtype.itemsize].view(
+            dtype)
+    return Vocabulary(tokens, offsets, table)
+
+
+def _map_quantized(buf, header, dtype=np.float32):
+    # Quantized vectors that refer to the mapped file
+    words, size = header['shape']
+    start = header['vectors_offset']
+    codes = buf[start:start + words * size].reshape(words, size)
+    start = header['scales_offset']
+    scales = buf[start:start + 2 * words * SCALE_DTYPE.itemsize].view(
+        SCALE_DTYPE)
+    if len(scales) != 2 * words:
+        raise ParseError(b'Unexpected end of file')
+    return QuantizedVectors(codes, scales[:words], scales[words:], dtype)
+
+
+def load_mmap(fin, dtype=np.float32, max_vocab=None):
+    """
+    Refer to :func:`word_embedding_loader.loader.word2vec_bin.load_mmap` for the API.
+    The returned :class:`~word_embedding_loader.vocabulary.Vocabulary` is
+    mapped from the file too. Quantized vectors are returned as
+    :class:`~word_embedding_loader.arrays.QuantizedVectors` whose codes are
+    mapped from the file.
+    """
+    buf, header, offsets = _map_file(fin)
+    words, size = header['shape']
+    if max_vocab is not None:
+        words = min(max_vocab, words)
+    if header.get('quantized'):
+        arr = _map_quantized(buf, header, dtype).select(slice(0, words))
+    else:
+        arr = map_rows(buf, offsets[:words], size, dtype, header['dtype'])
+    return arr, _map_vocab(buf, header, words)
+
+
+def load_with_vocab_mmap(fin, vocab, dtype=np.float32):
+    """
+    Refer to :func:`word_embedding_loader.loader.word2vec_bin.load_mmap` and
+    :func:`word_embedding_loader.loader.glove.load_with_vocab` for the API.
+    """
+    buf, header, offsets = _map_file(fin)
+    words, size = header['shape']
+    file_vocab = _map_vocab(buf, header, words)
+    rows = np.empty(len(vocab), dtype=np.int64)
+    for word, idx in six.iteritems(vocab):
+        i = file_vocab.get(word)
+        if i is None:
+            raise ParseError(
+                b"Some of vocab was not found in word embedding file")
+        rows[idx] = i
+    if header.get('quantized'):
+        # Only the codes of the selected rows are copied
+        return _map_quantized(buf, header, dtype).select(rows)
+    return map_rows(buf, offsets[rows], size, dtype, header['dtype'])
+
+
+def iter_rows(fin, dtype=np.float32, batch_size=1024, max_vocab=None,
+              progress=None):
+    """
+    Refer to :func:`word_embedding_loader.loader.glove.iter_rows` for the API.
+    """
+    progress = as_progress(progress)
+    header = read_header(fin)
+    words, size = header['shape']
+    if max_vocab is not None:
+        words = min(max_vocab, words)
+    file_dtype = np.dtype(str(header['dtype']))
+    row_bytes = size * file_dtype.itemsize
+    for start in six.moves.range(0, words, batch_size):
+        n = min(batch_size, words - start)
+        with progress.timer('io'):
+            fin.seek(header['offsets_offset'] + start * OFFSET_DTYPE.itemsize)
+            offsets = np.frombuffer(
+                _read_exact(fin, (n + 1) * OFFSET_DTYPE.itemsize),
+                dtype=OFFSET_DTYPE)
+            fin.seek(header['tokens_offset'] + int(offsets[0]))
+            data = _read_exact(fin, int(offsets[-1] - offsets[0]))
+        offsets = (offsets - offsets[0]).tolist()
+        tokens = [data[offsets[i]:offsets[i + 1]] for i in six.moves.range(n)]
+
+        with progress.timer('io'):
+            fin.seek(header['vectors_offset'] + start * row_bytes)
+            arr = np.empty((n, size), dtype=file_dtype)
+            if fin.readinto(arr) != arr.nbytes:
+                raise ParseError(b'Unexpected end of file')
+            if header.get('quantized'):
+                scale, offset = _read_scales(fin, header, start + n, start)
+        progress.update(rows=n, position=fin.tell())
+        with progress.timer('assemble'):
+            if header.get('quantized'):
+                arr = _dequantize(arr, scale, offset, dtype)
+            arr = arr.astype(dtype, copy=False)
+        yield tokens, arr
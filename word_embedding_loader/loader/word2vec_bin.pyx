@@ -5,6 +5,10 @@ Low level API for loading of word embedding file that was implemented in
 `word2vec <https://code.google.com/archive/p/word2vec/>`_, by Mikolov.
 This implementation is for word embedding file created with ``-binary 1``
 option.
+
+Files are read in blocks through the file object, so any readable binary
+stream (e.g. :class:`io.BytesIO` or a gzip file) can be loaded, and a
+bytes-like object can be passed instead of a file object.
 """
 from __future__ import absolute_import, division, print_function, \
     unicode_literals
@@ -12,15 +16,173 @@ from __future__ import absolute_import, division, print_function, \
 from collections import OrderedDict
 
 import ctypes
-from libc.stdio cimport FILE, fscanf, fread, fdopen
+from libc.string cimport memchr, memcpy, memmove
+from cpython.bytes cimport PyBytes_FromStringAndSize
 import numpy as np
 cimport numpy as np
 from cpython cimport bool
 
 from word_embedding_loader import ParseError, parse_warn
+from word_embedding_loader.arrays import map_rows
+from word_embedding_loader.loader.word2vec_text import _warn_eof
+from word_embedding_loader.progress import as_progress
+from word_embedding_loader.vocabulary import VocabularyBuilder
 
 ctypedef np.float32_t FLOAT
 
+# Approximate number of bytes of vectors converted at once when dtype is not
+# float32, and between progress reports
+_CHUNK_BYTES = 1 << 24
+
+# Number of bytes read from the file at once. The buffer grows if a single
+# word is longer.
+_BLOCK_SIZE = 1 << 20
+
+
+cdef class _Reader:
+    # Reads a file in large blocks with readinto and finds words with
+    # memchr, so that words can be of any length and may contain any byte
+    # but a space. Vectors are copied out of the block with memcpy.
+    # Reading through the file object keeps its buffer consistent, and works
+    # for any readable stream (e.g. io.BytesIO or gzip files) as well as for
+    # bytes-like objects, which are used without a copy.
+    cdef object fin
+    # Buffer, whose first `end` bytes have been read; data points to it
+    cdef object buf
+    cdef char *data
+    cdef Py_ssize_t pos
+    cdef Py_ssize_t end
+    # Position in the file of data[0]
+    cdef long long base
+    cdef bint eof
+    # Rows that are skipped can be sought past
+    cdef bint seekable
+
+    def __cinit__(self, fin):
+        if not hasattr(fin, 'read'):
+            self.buf = np.frombuffer(fin, dtype=np.uint8)
+            self.end = len(self.buf)
+            self.eof = True
+        else:
+            self.fin = fin
+            try:
+                self.base = fin.tell()
+                self.seekable = fin.seekable()
+            except (AttributeError, IOError, OSError, ValueError):
+                # Not seekable; positions are counted from here
+                pass
+            self.buf = np.empty(_BLOCK_SIZE, dtype=np.uint8)
+        self.data = np.PyArray_BYTES(self.buf)
+
+    cdef long long tell(self):
+        return self.base + self.pos
+
+    def release(self):
+        # Leave the file positioned right after the bytes consumed
+        if self.fin is not None and self.pos != self.end:
+            try:
+                self.fin.seek(self.tell())
+            except (AttributeError, IOError, OSError, ValueError):
+                pass
+
+    cdef Py_ssize_t fill(self) except -1:
+        # Move the unread bytes to the beginning of the buffer and read more
+        # after them. Returns the number of bytes read, 0 at the end of file.
+        cdef Py_ssize_t n
+        cdef bytes chunk
+        if self.eof:
+            return 0
+        if self.pos > 0:
+            memmove(self.data, self.data + self.pos, self.end - self.pos)
+            self.base += self.pos
+            self.end -= self.pos
+            self.pos = 0
+        if self.end == len(self.buf):
+            buf = np.empty(2 * len(self.buf), dtype=np.uint8)
+            buf[:self.end] = self.buf[:self.end]
+            self.buf = buf
+            self.data = np.PyArray_BYTES(self.buf)
+        if hasattr(self.fin, 'readinto'):
+            n = self.fin.readinto(self.buf[self.end:]) or 0
+        else:
+            chunk = self.fin.read(len(self.buf) - self.end)
+            n = len(chunk)
+            memcpy(self.data + self.end, <const char*>chunk, n)
+        if n == 0:
+            self.eof = True
+        self.end += n
+        return n
+
+    cdef bint skip_separators(self) except -1:
+        # Skip new lines and spaces before a word. Returns False at the end
+        # of file.
+        cdef char c
+        while True:
+            while self.pos < self.end:
+                c = self.data[self.pos]
+                if c != b' ' and c != b'\n' and c != b'\r':
+                    return True
+                self.pos += 1
+            if self.fill() == 0:
+                return False
+
+    cdef object read_until(self, char sep):
+        # Bytes up to sep, which is consumed. None if the file ends first.
+        cdef char *p
+        cdef Py_ssize_t scanned = 0
+        while True:
+            p = <char*>memchr(self.data + self.pos + scanned, sep,
+                              self.end - self.pos - scanned)
+            if p != NULL:
+                ret = PyBytes_FromStringAndSize(self.data + self.pos,
+                                                p - self.data - self.pos)
+                self.pos = p - self.data + 1
+                return ret
+            # Bytes already scanned stay in the buffer
+            scanned = self.end - self.pos
+            if self.fill() == 0:
+                return None
+
+    cdef object read_word(self):
+        # Next word, or None at the end of file
+        if not self.skip_separators():
+            return None
+        return self.read_until(b' ')
+
+    cdef bint read_into(self, char *dest, Py_ssize_t n) except -1:
+        # Copy the next n bytes to dest (or skip them if dest is NULL).
+        # Returns False if the file ends first.
+        cdef Py_ssize_t m
+        if (dest == NULL and self.seekable and not self.eof and
+                n > self.end - self.pos):
+            # Seek past the rest of the row instead of reading it
+            self.base += self.pos + n
+            self.pos = self.end = 0
+            self.fin.seek(self.base)
+            return True
+        while n > 0:
+            if self.pos == self.end and self.fill() == 0:
+                return False
+            m = min(n, self.end - self.pos)
+            if dest != NULL:
+                memcpy(dest, self.data + self.pos, m)
+                dest += m
+            self.pos += m
+            n -= m
+        return True
+
+    def read_header(self):
+        line = self.read_until(b'\n')
+        data = (line or b'').split()
+        try:
+            return int(data[0]), int(data[1])
+        except (ValueError, IndexError):
+            raise ParseError(b'Invalid header line: ' + (line or b''))
+
+
+cdef inline char* _row(np.ndarray arr, Py_ssize_t i):
+    return np.PyArray_BYTES(arr) + i * arr.strides[0]
+
 
 def check_valid(line0, line1):
     """
@@ -38,79 +200,281 @@ def check_valid(line0, line1):
     return True
 
 
-cdef _load_with_vocab_impl(FILE *f, vocabs, long long size):
-    cdef char ch
-    cdef int l
-    cdef char[100] vocab
-    cdef int words = len(vocabs)
-    cdef np.ndarray[FLOAT, ndim=2, mode="c"] arr = np.empty([words, size], dtype=np.float32)
-    cdef np.ndarray[FLOAT, ndim=2, mode="c"] dummy = np.empty([1, size], dtype=np.float32)
-    cdef int i = 0
-    cdef int idx
-    while True:
-        if i == words:
+cdef _load_with_vocab_impl(_Reader reader, vocabs, long long words,
+                           long long size, dtype, progress):
+    cdef long long n_vocab = len(vocabs)
+    cdef Py_ssize_t row_bytes = size * sizeof(FLOAT)
+    cdef bint native = np.dtype(dtype) == np.float32
+    arr = np.empty([n_vocab, size], dtype=dtype)
+    # Rows are read into dummy and then converted unless dtype is float32
+    cdef np.ndarray dest = arr if native else None
+    cdef np.ndarray dummy = np.empty([1, size], dtype=np.float32)
+    cdef np.ndarray[np.uint8_t, ndim=1] found = np.zeros(n_vocab, dtype=np.uint8)
+    cdef long long n_found = 0
+    cdef long long i
+    cdef long long idx
+    cdef long long step = max(1, _CHUNK_BYTES // max(1, row_bytes))
+    cdef long long reported = 0
+    cdef bint report = progress.active
+    for i in range(words):
+        # Stop as soon as every word has been found
+        if n_found == n_vocab:
             break
-        # Remove any new line/spaces between vocabulary
-        fscanf(f, "%*[ \n\r]")
-        fscanf(f, "%s%n%c", &vocab, &l, &ch)
-        ustring = <bytes>vocab[:l]
-        if ustring in vocabs:
-            idx = vocabs[ustring]
-            fread(&arr[idx, 0], sizeof(FLOAT), size, f)
-            # Word counting does not take duplicated words in consideration
-            i += 1
-        else:
-            fread(&dummy[0, 0], sizeof(FLOAT), size, f)
+        if report and i - reported >= step:
+            progress.update(rows=i - reported, position=reader.tell())
+            reported = i
+        token = reader.read_word()
+        if token is None:
+            break
+        idx = vocabs.get(token, -1)
+        if idx >= 0 and not found[idx]:
+            # Use the first occurrence of duplicated words as in load
+            if native:
+                if not reader.read_into(_row(dest, idx), row_bytes):
+                    break
+            else:
+                if not reader.read_into(_row(dummy, 0), row_bytes):
+                    break
+                arr[idx] = dummy[0]
+            found[idx] = 1
+            n_found += 1
+        elif not reader.read_into(NULL, row_bytes):
+            break
+    else:
+        i = words
+    if report:
+        progress.update(rows=i - reported, position=reader.tell())
+    if n_found != n_vocab:
+        raise ParseError(b"Some of vocab was not found in word embedding file")
     return arr
 
 
-def load_with_vocab(fin, vocab, dtype=np.float32):
+def read_shape(fin):
+    """
+    Refer to :func:`word_embedding_loader.loader.glove.read_shape` for the API.
+    """
+    data = fin.readline().split()
+    try:
+        return int(data[0]), int(data[1])
+    except (ValueError, IndexError):
+        raise ParseError(b'Invalid header line: ' + b' '.join(data))
+
+
+def load_with_vocab(fin, vocab, dtype=np.float32, progress=None):
     """
     Refer to :func:`word_embedding_loader.loader.glove.load_with_vocab` for the API.
     """
-    cdef FILE *f = fdopen(fin.fileno(), 'rb') # attach the stream
-    if (f) == NULL:
-       raise IOError()
-    cdef long long words, size
-    fscanf(f, '%lld', &words)
-    fscanf(f, '%lld', &size)
-    ret = _load_with_vocab_impl(f, vocab, size)
-    return ret.astype(dtype)
-
-
-cdef _load_impl(FILE *f, long long words, long long size):
-    cdef char ch
-    cdef int l
-    cdef char[100] vocab
-    vocabs = dict()
-    cdef np.ndarray[FLOAT, ndim=2, mode="c"] arr = np.zeros([words, size], dtype=np.float32)
-    cdef int i = 0
-    while True:
-        if i >= words:
+    progress = as_progress(progress)
+    reader = _Reader(fin)
+    words, size = reader.read_header()
+    # Words are scanned while reading, so all the time counts as I/O
+    with progress.timer('io'):
+        arr = _load_with_vocab_impl(reader, vocab, words, size, dtype,
+                                    progress)
+    reader.release()
+    return arr
+
+
+cdef list _read_rows(_Reader reader, np.ndarray arr):
+    # Read at most as many rows as arr (C-contiguous float32) has and return
+    # their words. Fewer words are returned if the file ends first.
+    cdef Py_ssize_t row_bytes = arr.shape[1] * sizeof(FLOAT)
+    cdef Py_ssize_t i
+    tokens = []
+    for i in range(arr.shape[0]):
+        token = reader.read_word()
+        if token is None or not reader.read_into(_row(arr, i), row_bytes):
             break
-        # Remove any new line/spaces between vocabulary
-        fscanf(f, "%*[ \n\r]")
-        fscanf(f, "%s%n%c", &vocab, &l, &ch)
-        vocabs[<bytes>vocab[:l]] = i
-        fread(&arr[i, 0], sizeof(FLOAT), size, f)
-        i += 1
-    return arr, vocabs
+        tokens.append(token)
+    return tokens
+
+
+cdef _load_impl(_Reader reader, long long words, long long size, dtype,
+                progress):
+    # Read rows until words distinct words are found, skipping duplicated
+    # words as the text loaders do
+    cdef long long i, n, step
+    arr = np.empty([words, size], dtype=dtype)
+    native = arr.dtype == np.float32
+    step = max(1, _CHUNK_BYTES // max(1, size * sizeof(FLOAT)))
+    if not native:
+        # Convert chunk by chunk to avoid a full size temporary array
+        chunk = np.empty([min(step, words), size], dtype=np.float32)
+    vocabs = VocabularyBuilder()
+    i = 0
+    while i < words:
+        n = min(step, words - i)
+        if native:
+            # Read directly into the result
+            rows = arr[i:i + n]
+        else:
+            rows = chunk[:n]
+        with progress.timer('io'):
+            chunk_tokens = _read_rows(reader, rows)
+        with progress.timer('assemble'):
+            keep, _ = vocabs.add_tokens(chunk_tokens, words)
+            if len(keep) != len(chunk_tokens):
+                arr[i:i + len(keep)] = rows[keep]
+            elif not native:
+                arr[i:i + len(keep)] = rows[:len(keep)]
+        i += len(keep)
+        if progress.active:
+            progress.update(rows=len(chunk_tokens), position=reader.tell())
+        if len(chunk_tokens) != n:
+            break
+    if i != words:
+        _warn_eof(i, words)
+        arr = arr[:i]
+    return arr, vocabs.build()
 
 
-def load(fin, dtype=np.float32, max_vocab=None):
+def load(fin, dtype=np.float32, max_vocab=None, progress=None):
     """
     Refer to :func:`word_embedding_loader.loader.glove.load` for the API.
     """
-    cdef FILE *f = fdopen(fin.fileno(), 'rb') # attach the stream
-    if (f) == NULL:
-       raise IOError()
-    cdef long long words, size
-    fscanf(f, '%lld', &words)
-    fscanf(f, '%lld', &size)
-    if max_vocab is None:
-        words = words
-    else:
+    progress = as_progress(progress)
+    reader = _Reader(fin)
+    words, size = reader.read_header()
+    if max_vocab is not None:
+        words = min(max_vocab, words)
+    ret = _load_impl(reader, words, size, dtype, progress)
+    reader.release()
+    return ret
+
+
+def iter_rows(fin, dtype=np.float32, batch_size=1024, max_vocab=None,
+              progress=None):
+    """
+    Refer to :func:`word_embedding_loader.loader.glove.iter_rows` for the API.
+    """
+    progress = as_progress(progress)
+    reader = _Reader(fin)
+    words, size = reader.read_header()
+    if max_vocab is not None:
         words = min(max_vocab, words)
-    ret = _load_impl(f, words, size)
-    arr, vocabs = ret
-    return arr.astype(dtype), vocabs
+    i = 0
+    while i < words:
+        n = min(batch_size, words - i)
+        arr = np.empty([n, size], dtype=np.float32)
+        with progress.timer('io'):
+            tokens = _read_rows(reader, arr)
+        i += len(tokens)
+        if progress.active:
+            progress.update(rows=len(tokens), position=reader.tell())
+        with progress.timer('assemble'):
+            arr = arr[:len(tokens)].astype(dtype, copy=False)
+        if tokens:
+            yield tokens, arr
+        if len(tokens) != n:
+            break
+    reader.release()
+    if i != words:
+        _warn_eof(i, words)
+
+
+cdef _scan_offsets(const unsigned char[:] buf, Py_ssize_t pos,
+                   long long words, long long size):
+    # Same rules as _Reader: words are separated by new lines and spaces
+    # and end at a space. Duplicated words are skipped as in load.
+    cdef Py_ssize_t n = buf.shape[0]
+    cdef Py_ssize_t row_bytes = size * sizeof(FLOAT)
+    cdef const unsigned char *p
+    cdef long long i = 0
+    cdef np.ndarray[np.int64_t, ndim=1] offsets = np.empty(words, dtype=np.int64)
+    vocabs = VocabularyBuilder()
+    while i < words:
+        # Remove any new line/spaces between vocabulary
+        while pos < n and (buf[pos] == b' ' or buf[pos] == b'\n' or
+                           buf[pos] == b'\r'):
+            pos += 1
+        if pos == n and i > 0:
+            # Fewer distinct words than declared
+            _warn_eof(i, words)
+            break
+        p = NULL
+        if pos < n:
+            p = <const unsigned char*>memchr(&buf[pos], b' ', n - pos)
+        if p == NULL or p - &buf[pos] + 1 + row_bytes > n - pos:
+            raise ParseError(b'Unexpected end of file')
+        token = PyBytes_FromStringAndSize(<const char*>&buf[pos],
+                                          p - &buf[pos])
+        pos += p - &buf[pos] + 1
+        if vocabs.add(token) < 0:
+            parse_warn(b'Duplicated vocabulary ' + token)
+        else:
+            offsets[i] = pos
+            i += 1
+        pos += row_bytes
+    return offsets[:i], vocabs.build()
+
+
+def _map_file(fin, max_vocab):
+    buf = np.memmap(fin, dtype=np.uint8, mode='r')
+    header = bytes(buf[:1024]).split(b'\n', 1)[0]
+    try:
+        words, size = map(int, header.split())
+    except ValueError:
+        raise ParseError(b'Invalid header line: ' + header)
+    if max_vocab is not None:
+        words = min(max_vocab, words)
+    offsets, vocabs = _scan_offsets(buf, len(header), words, size)
+    return buf, offsets, vocabs, size
+
+
+def load_mmap(fin, dtype=np.float32, max_vocab=None):
+    """
+    Map word embedding file into memory instead of reading it. Only the
+    words are read; vectors are shared with the page cache, so several
+    processes loading the same file do not hold their own copy.
+
+    Refer to :func:`word_embedding_loader.loader.glove.load` for the API.
+
+    Returns:
+        numpy.ndarray or word_embedding_loader.arrays.MappedVectors: A
+        read-only view of the file if rows are evenly spaced in the file and
+        ``dtype`` is ``float32``. Otherwise rows are gathered lazily on
+        access.
+        word_embedding_loader.vocabulary.Vocabulary: Mapping from words to
+        vector indices.
+    """
+    buf, offsets, vocabs, size = _map_file(fin, max_vocab)
+    return map_rows(buf, offsets, size, dtype), vocabs
+
+
+def load_with_vocab_mmap(fin, vocab, dtype=np.float32):
+    """
+    Refer to :func:`word_embedding_loader.loader.word2vec_bin.load_mmap` and
+    :func:`word_embedding_loader.loader.glove.load_with_vocab` for the API.
+    """
+    buf, offsets, vocabs, size = _map_file(fin, None)
+    rows = np.empty(len(vocab), dtype=np.int64)
+    for word, idx in vocab.items():
+        if word not in vocabs:
+            raise ParseError(
+                b"Some of vocab was not found in word embedding file")
+        rows[idx] = offsets[vocabs[word]]
+    return map_rows(buf, rows, size, dtype)
+
+
+def scan_offsets(fin, max_vocab=None):
+    """
+    Refer to :func:`word_embedding_loader.loader.glove.scan_offsets` for the API.
+    Like :func:`load_mmap`, words are found in a memory map of the file.
+    """
+    _, offsets, vocabs, size = _map_file(fin, max_vocab)
+    return offsets, vocabs, size
+
+
+def read_rows_at(fin, offsets, size, dtype=np.float32):
+    """
+    Refer to :func:`word_embedding_loader.loader.glove.read_rows_at` for the API.
+    """
+    cdef long long row_bytes = size * sizeof(FLOAT)
+    arr = np.empty((len(offsets), size), dtype=dtype)
+    for i, offset in enumerate(np.asarray(offsets).tolist()):
+        fin.seek(offset)
+        data = fin.read(row_bytes)
+        if len(data) != row_bytes:
+            raise ParseError(b'Unexpected end of file')
+        arr[i] = np.frombuffer(data, dtype=np.float32)
+    return arr
@@ -12,6 +12,10 @@ from __future__ import absolute_import, division, print_function, \
 import numpy as np
 
 from word_embedding_loader import ParseError, parse_warn
+from word_embedding_loader.loader import _parallel, _text
+from word_embedding_loader.loader.glove import _use_workers
+from word_embedding_loader.progress import as_progress
+from word_embedding_loader.vocabulary import VocabularyBuilder
 
 
 def check_valid(line0, line1):
@@ -41,63 +45,136 @@ def _parse_line(line, dtype):
     return token, v
 
 
-def _load_line(line, dtype, size):
-    # Parse line and do a sanity check
-    token, v = _parse_line(line, dtype)
-    if len(v) != size:
-        raise ParseError(b'Vector size did not match in line: ' + line)
-    return token, v
+def _read_header(fin):
+    line = fin.readline()
+    data = line.strip().split(b' ')
+    if len(data) != 2:
+        raise ParseError(b'Invalid header line: ' + line)
+    try:
+        return int(data[0]), int(data[1])
+    except ValueError:
+        raise ParseError(b'Invalid header line: ' + line)
 
 
-def load_with_vocab(fin, vocab, dtype=np.float32):
+def read_shape(fin):
+    """
+    Refer to :func:`word_embedding_loader.loader.glove.read_shape` for the API.
+    """
+    words, size = _read_header(fin)
+    return min(words, _text.count_lines(fin)), size
+
+
+def _warn_eof(read, expected):
+    # Use + instead of formatting because python 3.4.* does not allow
+    # format with bytes
+    parse_warn(
+        b'EOF before the defined size (read ' + str(read).encode('ascii') +
+        b', expected ' + str(expected).encode('ascii') + b')'
+    )
+
+
+def load_with_vocab(fin, vocab, dtype=np.float32, workers=None,
+                    progress=None):
     """
     Refer to :func:`word_embedding_loader.loader.glove.load_with_vocab` for the API.
     """
-    line = next(fin)
-    data = line.strip().split(b' ')
-    assert len(data) == 2
-    size = int(data[1])
+    _, size = _read_header(fin)
+    if _use_workers(fin, workers):
+        arr = _parallel.load_with_vocab(fin, vocab, workers, dtype=dtype,
+                                        size=size)
+        if arr is None or np.any(np.isnan(arr)):
+            raise ParseError(
+                b"Some of vocab was not found in word embedding file")
+        return arr
+    progress = as_progress(progress)
     arr = np.empty((len(vocab), size), dtype=dtype)
-    arr.fill(np.NaN)
-    for line in fin:
-        token, v = _load_line(line, dtype, size)
-        if token in vocab:
-            arr[vocab[token], :] = v
+    arr.fill(np.nan)
+    # Words found so far; later occurrences of them are skipped
+    found = set()
+    for lines in _text.iter_blocks(fin, progress=progress):
+        n = len(lines)
+        with progress.timer('parse'):
+            # Only lines of words in vocab are parsed
+            tokens, lines = _text.filter_lines(lines, vocab, found)
+            if lines:
+                _, values = _text.split_lines(lines)
+                block = _text.parse_values(lines, values, dtype, size)
+        if lines:
+            with progress.timer('assemble'):
+                arr[[vocab[token] for token in tokens]] = block
+        progress.update(rows=n)
     if np.any(np.isnan(arr)):
         raise ParseError(b"Some of vocab was not found in word embedding file")
     return arr
 
 
-def load(fin, dtype=np.float32, max_vocab=None):
+def load(fin, dtype=np.float32, max_vocab=None, workers=None, progress=None):
     """
     Refer to :func:`word_embedding_loader.loader.glove.load` for the API.
     """
-    vocab = {}
-    line = next(fin)
-    data = line.strip().split(b' ')
-    assert len(data) == 2
-    words = int(data[0])
+    words, size = _read_header(fin)
     if max_vocab is not None:
         words = min(max_vocab, words)
-    size = int(data[1])
+    if _use_workers(fin, workers):
+        arr, vocab = _parallel.load(fin, workers, dtype=dtype, max_vocab=words,
+                                    size=size)
+        if len(vocab) != words:
+            _warn_eof(len(vocab), words)
+        return arr, vocab
+    progress = as_progress(progress)
+    vocab = VocabularyBuilder()
     arr = np.empty((words, size), dtype=dtype)
-    i = 0
-    for n_line, line in enumerate(fin):
-        if i >= words:
+    for lines in _text.iter_blocks(fin, progress=progress):
+        if len(vocab) >= words:
             break
-        token, v = _load_line(line, dtype, size)
-        if token in vocab:
-            parse_warn(b'Duplicated vocabulary ' + token)
-            continue
-        arr[i, :] = v
-        vocab[token] = i
-        i += 1
+        with progress.timer('parse'):
+            tokens, values = _text.split_lines(lines)
+            i = len(vocab)
+            keep, n = vocab.add_tokens(tokens, words)
+            # Duplicated words are parsed (and checked) too, but not stored
+            block = _text.parse_values(lines[:n], values[:n], dtype, size)
+        with progress.timer('assemble'):
+            arr[i:len(vocab)] = block if len(keep) == n else block[keep]
+        progress.update(rows=n)
+    i = len(vocab)
     if i != words:
-        # Use + instead of formatting because python 3.4.* does not allow
-        # format with bytes
-        parse_warn(
-            b'EOF before the defined size (read ' + bytes(i) + b', expected '
-            + bytes(words) + b')'
-        )
+        _warn_eof(i, words)
         arr = arr[:i, :]
-    return arr, vocab
+    return arr, vocab.build()
+
+
+def iter_rows(fin, dtype=np.float32, batch_size=1024, max_vocab=None,
+              progress=None):
+    """
+    Refer to :func:`word_embedding_loader.loader.glove.iter_rows` for the API.
+    """
+    words, size = _read_header(fin)
+    if max_vocab is not None:
+        words = min(max_vocab, words)
+    i = 0
+    for tokens, arr in _text.iter_rows(fin, dtype, batch_size, words, size,
+                                       progress=as_progress(progress)):
+        i += len(tokens)
+        yield tokens, arr
+    if i != words:
+        _warn_eof(i, words)
+
+
+def scan_offsets(fin, max_vocab=None):
+    """
+    Refer to :func:`word_embedding_loader.loader.glove.scan_offsets` for the API.
+    """
+    words, size = _read_header(fin)
+    if max_vocab is not None:
+        words = min(max_vocab, words)
+    offsets, vocab, _ = _text.scan_offsets(fin, words)
+    if len(vocab) != words:
+        _warn_eof(len(vocab), words)
+    return offsets, vocab, size
+
+
+def read_rows_at(fin, offsets, size, dtype=np.float32):
+    """
+    Refer to :func:`word_embedding_loader.loader.glove.read_rows_at` for the API.
+    """
+    return _text.read_lines_at(fin, offsets, size, dtype)
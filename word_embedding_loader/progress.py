@@ -0,0 +1,325 @@
+# -*- coding: utf-8 -*-
+"""
+Progress reporting and timing of loading, saving and conversion.
+
+Pass a callback (or a :class:`Progress`) as ``progress`` to
+:func:`~word_embedding_loader.word_embedding.WordEmbedding.load`,
+:func:`~word_embedding_loader.word_embedding.WordEmbedding.save` or
+:func:`~word_embedding_loader.word_embedding.convert`. The callback is called
+periodically with a :class:`ProgressInfo`:
+
+.. code:: python
+
+   def show(info):
+       print(info.phase, info.bytes, info.total_bytes, info.rows, info.elapsed)
+
+   wv = WordEmbedding.load('path/to/embedding.txt', progress=show)
+
+Loaders and savers also record where the time goes. Keep the
+:class:`Progress` to print the breakdown afterwards:
+
+.. code:: python
+
+   progress = Progress()
+   wv = WordEmbedding.load('path/to/embedding.txt', progress=progress)
+   print(progress.report())
+"""
+
+from __future__ import absolute_import, division, print_function, \
+    unicode_literals
+
+import os
+import time
+from collections import OrderedDict, namedtuple
+
+
+__all__ = ["Progress", "ProgressInfo", "PHASES", "CATEGORIES", "NULL",
+           "as_progress"]
+
+
+#: Phases of an operation, in order. ``detect``: determining the format of
+#: the file. ``parse``: reading vectors. ``convert``: streaming rows to another
+#: file. ``build-vocab``: building the
+#: :class:`~word_embedding_loader.vocabulary.Vocabulary`. ``write``: saving.
+PHASES = ('detect', 'parse', 'convert', 'build-vocab', 'write')
+
+#: Categories of time. ``io``: reading from and writing to files (in binary
+#: word2vec files, tokens are scanned while reading). ``parse``: splitting
+#: lines and converting text to numbers. ``format``: converting numbers to
+#: text and writing it. ``assemble``: gathering and converting rows and
+#: building the vocabulary.
+CATEGORIES = ('io', 'parse', 'format', 'assemble')
+
+
+class ProgressInfo(namedtuple('ProgressInfo', [
+        'phase', 'bytes', 'total_bytes', 'rows', 'elapsed'])):
+    """
+    State of an operation passed to progress callbacks.
+
+    Attributes:
+        phase (str): One of :data:`PHASES`.
+        bytes (int): Number of bytes read from (or written to) the file so
+            far.
+        total_bytes (int or None): Size of the file read, if it is known.
+        rows (int): Number of rows parsed (or written) so far.
+        elapsed (float): Seconds since the operation started.
+    """
+    __slots__ = ()
+
+
+class _Timer(object):
+    def __init__(self, progress, category, module):
+        self._progress = progress
+        self._key = (module, category)
+
+    def __enter__(self):
+        self._progress._push(self._key)
+        return self
+
+    def __exit__(self, *exc):
+        self._progress._pop()
+        return False
+
+
+class Progress(object):
+    """
+    Receives the progress of an operation from loaders and savers, reports it
+    to a callback and records the time spent in each category.
+
+    Timers nest. The time of an inner timer is not counted in the outer
+    timer, so the categories add up to the time of the operation.
+
+    Args:
+        callback (callable or None): Called with a :class:`ProgressInfo` at
+            the start of each phase, at most every ``interval`` seconds in
+            between, and when the operation finishes.
+        total_bytes (int or None): Size of the file. It is filled in from the
+            file when a path is loaded.
+        interval (float): Minimum number of seconds between calls of
+            ``callback`` within a phase.
+
+    Attributes:
+        phase (str or None): Current phase.
+        module (str or None): Name of the loader or saver module being run
+            (e.g. ``'glove'``).
+        bytes (int): Check :class:`ProgressInfo`.
+        rows (int): Check :class:`ProgressInfo`.
+        timings (OrderedDict): Seconds spent in each ``(module, category)``;
+            see :data:`CATEGORIES`.
+        phases (OrderedDict): Seconds spent in each phase.
+    """
+    active = True
+
+    def __init__(self, callback=None, total_bytes=None, interval=0.5):
+        self.callback = callback
+        self.total_bytes = total_bytes
+        self.interval = interval
+        self.phase = None
+        self.module = None
+        self.bytes = 0
+        self.rows = 0
+        self.timings = OrderedDict()
+        self.phases = OrderedDict()
+        self._start = time.time()
+        self._phase_start = self._start
+        self._last_report = self._start
+        self._stack = []
+        self._switch = self._start
+
+    def start_phase(self, phase, module=None):
+        """
+        Start a phase of the operation.
+
+        Args:
+            phase (str): One of :data:`PHASES`.
+            module (str or None): Name of the module run in this phase. The
+                current module is kept if ``None``.
+        """
+        now = time.time()
+        self._end_phase(now)
+        self.phase = phase
+        self._phase_start = now
+        if module is not None:
+            self.module = module
+        self._report(now)
+
+    def _end_phase(self, now):
+        if self.phase is not None:
+            self.phases[self.phase] = self.phases.get(self.phase, 0.0) + \
+                now - self._phase_start
+
+    def update(self, rows=0, nbytes=0, position=None):
+        """
+        Report progress.
+
+        Args:
+            rows (int): Number of rows parsed (or written) since the last
+                update.
+            nbytes (int): Number of bytes read (or written) since the last
+                update.
+            position (int or None): Position in the file, which replaces the
+                number of bytes so far.
+        """
+        self.rows += rows
+        if position is not None:
+            self.bytes = position
+        else:
+            self.bytes += nbytes
+        now = time.time()
+        if now - self._last_report >= self.interval:
+            self._report(now)
+
+    def timer(self, category, module=None):
+        """
+        Context manager that records the time spent in it.
+
+        Args:
+            category (str): One of :data:`CATEGORIES`.
+            module (str or None): Module to record the time for. The current
+                module if ``None``.
+        """
+        return _Timer(self, category, self.module if module is None
+                      else module)
+
+    def _charge(self, now):
+        # Add the time since the last switch to the innermost timer
+        if self._stack:
+            key = self._stack[-1]
+            self.timings[key] = self.timings.get(key, 0.0) + now - self._switch
+        self._switch = now
+
+    def _push(self, key):
+        self._charge(time.time())
+        self._stack.append(key)
+
+    def _pop(self):
+        self._charge(time.time())
+        self._stack.pop()
+
+    @property
+    def elapsed(self):
+        """
+        Seconds since the operation started.
+        """
+        return time.time() - self._start
+
+    def info(self):
+        """
+        Current state.
+
+        Returns:
+            ProgressInfo
+        """
+        return ProgressInfo(self.phase, self.bytes, self.total_bytes,
+                            self.rows, self.elapsed)
+
+    def _report(self, now):
+        self._last_report = now
+        if self.callback is not None:
+            self.callback(self.info())
+
+    def finish(self):
+        """
+        End the operation and report the final state.
+        """
+        now = time.time()
+        self._end_phase(now)
+        self._phase_start = now
+        self._report(now)
+
+    def report(self):
+        """
+        Summary of the time spent in each phase and, for each module, in each
+        category.
+
+        Returns:
+            str
+        """
+        lines = ['Total: %.3f s, %d rows, %.1f MB' % (
+            sum(self.phases.values()), self.rows, self.bytes / 1e6)]
+        for phase, seconds in self.phases.items():
+            lines.append('  %-12s %9.3f s' % (phase, seconds))
+        modules = []
+        for module, _ in self.timings:
+            if module not in modules:
+                modules.append(module)
+        if modules:
+            lines.append('%-14s' % 'module' + ''.join(
+                '%12s' % c for c in CATEGORIES))
+            for module in modules:
+                lines.append('%-14s' % (module or '-') + ''.join(
+                    '%10.3f s' % self.timings.get((module, c), 0.0)
+                    for c in CATEGORIES))
+        return '\n'.join(lines)
+
+
+class _NullProgress(Progress):
+    # Progress that ignores everything, so that loaders do not need to check
+    # whether progress is reported
+    active = False
+
+    def start_phase(self, phase, module=None):
+        pass
+
+    def update(self, rows=0, nbytes=0, position=None):
+        pass
+
+    def timer(self, category, module=None):
+        return _NULL_TIMER
+
+    def finish(self):
+        pass
+
+
+class _NullTimer(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+#: :class:`Progress` that does nothing.
+NULL = _NullProgress()
+
+
+def as_progress(progress):
+    """
+    Get a :class:`Progress` from the ``progress`` argument of loaders and
+    savers.
+
+    Args:
+        progress (Progress or callable or None): A callable is wrapped in a
+            new :class:`Progress`.
+
+    Returns:
+        Progress: :data:`NULL` if ``progress`` is ``None``.
+    """
+    if progress is None:
+        return NULL
+    if isinstance(progress, Progress):
+        return progress
+    return Progress(progress)
+
+
+def file_position(f):
+    """
+    Position of a file for progress reports, also when it is read or written
+    through a C stream attached to its file descriptor.
+
+    Args:
+        f (File): File object.
+
+    Returns:
+        int or None: ``None`` if it cannot be determined.
+    """
+    try:
+        return os.lseek(f.fileno(), 0, os.SEEK_CUR)
+    except (AttributeError, IOError, OSError, ValueError):
+        pass
+    try:
+        return f.tell()
+    except (AttributeError, IOError, OSError, ValueError):
+        return None
@@ -6,6 +6,6 @@ loader module provides actual implementation of the file savers.
              :class:`word_embedding_loader.word_embedding.WordEmbedding`
 """
 
-__all__ = ["glove", "word2vec_bin", "word2vec_text"]
+__all__ = ["glove", "wel", "word2vec_bin", "word2vec_text"]
 
-from word_embedding_loader.saver import glove, word2vec_bin, word2vec_text
+from word_embedding_loader.saver import glove, wel, word2vec_bin, word2vec_text
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+"""
+Helpers to prepare the ``vocab`` argument of ``save`` and to turn the
+``(arr, vocab)`` arguments of ``save`` into the batches of rows taken by
+``save_rows``.
+"""
+
+from __future__ import absolute_import, division, print_function, \
+    unicode_literals
+
+import itertools
+
+import numpy as np
+import six
+
+from word_embedding_loader.progress import NULL
+from word_embedding_loader.vocabulary import Vocabulary, _ItemsView
+
+
+def vocab_pairs(vocab, freqs=None):
+    """
+    Order a vocabulary for saving without sorting it in Python.
+
+    Args:
+        vocab (dict): Mapping from words (``bytes``) to vector indices
+            (``int``).
+        freqs (dict or None): Mapping from words to frequency counts.
+
+    Returns:
+        iterable: ``(word, index)`` pairs in ascending order of indices, or
+        in descending order of frequency if ``freqs`` is given. Ties keep the
+        iteration order of ``vocab``. If ``vocab`` already iterates in the
+        order of indices (as do vocabularies created by the loaders), its
+        items are returned as they are.
+    """
+    if freqs is None and isinstance(vocab, Vocabulary):
+        # Always in the order of indices
+        return vocab.items()
+    if freqs is None:
+        keys = np.fromiter(six.itervalues(vocab), dtype=np.int64,
+                           count=len(vocab))
+    else:
+        keys = -np.fromiter((freqs[w] for w in six.iterkeys(vocab)),
+                            dtype=np.float64, count=len(vocab))
+    if np.all(keys[1:] >= keys[:-1]):
+        return six.iteritems(vocab)
+    order = np.argsort(keys, kind='mergesort')
+    items = list(six.iteritems(vocab))
+    return [items[i] for i in order.tolist()]
+
+
+def iter_batches(arr, vocab, batch_size, take=None, progress=NULL):
+    """
+    Gather rows of ``arr`` in the order of ``vocab``.
+
+    Args:
+        arr (numpy.ndarray): Word embedding vectors.
+        vocab (iterable): Each element is pair of a word (``bytes``) and
+            ``arr`` index (``int``).
+        batch_size (int): Number of rows in each batch.
+        take (callable or None): Function that selects rows of ``arr`` by a
+            slice or an index array. ``arr[rows]`` if ``None``.
+        progress (word_embedding_loader.progress.Progress): Receives the
+            number of rows of each batch once it has been consumed, and the
+            time spent gathering rows.
+
+    Yields:
+        list: Words (``bytes``) in the batch.
+        numpy.ndarray: Corresponding rows of ``arr``. Consecutive indices are
+        sliced rather than copied.
+    """
+    if take is None:
+        take = arr.__getitem__
+    if isinstance(vocab, _ItemsView):
+        # Items of a Vocabulary are in the order of indices, so rows are
+        # sliced and words are copied from its buffer without pairs
+        words = vocab._mapping
+        for start in six.moves.range(0, len(words), batch_size):
+            stop = min(start + batch_size, len(words))
+            with progress.timer('assemble'):
+                batch = words.words(start, stop), take(slice(start, stop))
+            yield batch
+            progress.update(rows=stop - start)
+        return
+    itr = iter(vocab)
+    while True:
+        with progress.timer('assemble'):
+            chunk = list(itertools.islice(itr, batch_size))
+            if not chunk:
+                break
+            indices = [idx for _, idx in chunk]
+            start = indices[0]
+            if indices == list(six.moves.range(start, start + len(indices))):
+                rows = take(slice(start, start + len(indices)))
+            else:
+                rows = take(np.array(indices, dtype=np.int64))
+        yield [word for word, _ in chunk], rows
+        progress.update(rows=len(chunk))
@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+"""
+Block formatting shared by the savers of text formats
+(:mod:`~word_embedding_loader.saver.glove` and
+:mod:`~word_embedding_loader.saver.word2vec_text`). Rows are formatted and
+written in blocks. With a fixed ``precision``, the values of a whole block are
+converted to characters by NumPy arithmetic instead of formatting values one
+by one in Python.
+"""
+
+from __future__ import absolute_import, division, print_function, \
+    unicode_literals
+
+import numpy as np
+import six
+
+
+# Approximate number of bytes of values formatted at once
+BLOCK_SIZE = 1 << 22
+
+# Values are formatted by Python if they are not smaller than this after
+# scaling, since float64 cannot represent all the integers beyond
+_MAX_SCALED = float(1 << 52)
+
+# Largest n for which 10.0 ** n is exact
+_MAX_EXACT_POWER = 22
+
+# Largest precision for which float32 values times 10 ** precision are exact
+# in float64 (24 bits of float32 and 28 bits of 5 ** 12)
+_MAX_EXACT_FLOAT32 = 12
+
+# 2 ** 27 + 1 splits float64 values into halves whose products are exact
+_SPLIT = float((1 << 27) + 1)
+
+_ZERO = ord('0')
+
+
+def block_rows(size, precision=None):
+    """
+    Number of rows to format at once.
+
+    Args:
+        size (int): Feature dimension.
+        precision (int or None): Check :func:`format_rows`.
+
+    Returns:
+        int
+    """
+    width = 24 if precision is None else precision + 8
+    return max(1, BLOCK_SIZE // max(1, size * width))
+
+
+def _format_python(arr, precision):
+    if precision is None:
+        # Shortest representation that is read back to the same value
+        return [b' '.join(six.text_type(v).encode('utf-8') for v in vec)
+                for vec in arr]
+    fmt = ' '.join(['%.{}f'.format(precision)] * arr.shape[1])
+    return [(fmt % tuple(vec)).encode('ascii') for vec in arr.tolist()]
+
+
+def _digits(q, n):
+    # Decimal digits of non-negative integers q, from the most significant,
+    # zero padded to n digits
+    out = np.empty(q.shape + (n, ), dtype=np.uint8)
+    if q.size > 0 and q.max() < 1 << 32:
+        # Division is much faster for narrower types
+        q = q.astype(np.uint32)
+    for k in six.moves.range(n - 1, -1, -1):
+        q, d = np.divmod(q, 10)
+        out[..., k] = d + _ZERO
+    return out
+
+
+def _two_product(a, b):
+    # hi + lo == a * b exactly, with hi the rounded product (Dekker)
+    hi = a * b
+    a_hi = a * _SPLIT
+    a_hi = a_hi - (a_hi - a)
+    a_lo = a - a_hi
+    b_hi = b * _SPLIT
+    b_hi = b_hi - (b_hi - b)
+    b_lo = b - b_hi
+    lo = ((a_hi * b_hi - hi) + a_hi * b_lo + a_lo * b_hi) + a_lo * b_lo
+    return hi, lo
+
+
+def _round_scaled(a, precision):
+    # Round a * 10 ** precision to the nearest integer, ties to even, as
+    # '%.<precision>f' does with the exact value of a. The product is rounded
+    # to float64 before rint, so values close to a tie are corrected with the
+    # rounding error of the product.
+    hi, lo = _two_product(a, 10.0 ** precision)
+    q = np.rint(hi)
+    diff = hi - q
+    q[(diff == 0.5) & (lo > 0)] += 1
+    q[(diff == -0.5) & (lo < 0)] -= 1
+    return q
+
+
+def _format_fixed(arr, precision):
+    if precision > _MAX_EXACT_POWER:
+        return None
+    x = arr.astype(np.float64)
+    a = np.abs(x)
+    if not (np.all(np.isfinite(a)) and
+            np.all(a * 10.0 ** precision < _MAX_SCALED)):
+        return None
+    if arr.dtype.itemsize <= 4 and precision <= _MAX_EXACT_FLOAT32:
+        # Products of float32 values are exact
+        q = np.rint(a * 10.0 ** precision)
+    else:
+        q = _round_scaled(a, precision)
+    q = q.astype(np.int64)
+    ip, frac = np.divmod(q, 10 ** precision)
+    # Number of digits of the integer part of each value
+    nd = np.ones(ip.shape, dtype=np.int64)
+    digits = 1
+    while np.any(ip >= 10 ** digits):
+        nd += ip >= 10 ** digits
+        digits += 1
+
+    # Each value takes a fixed width field of
+    # [sign][integer part, right aligned][.][fraction][separator]
+    # and unused positions are 0, which are removed at the end
+    n, size = x.shape
+    width = 1 + digits + (precision + 1 if precision > 0 else 0) + 1
+    chars = np.zeros((n, size, width), dtype=np.uint8)
+    int_chars = _digits(ip, digits)
+    # Leading zeros are unused except the last digit
+    int_chars[np.arange(digits) < digits - nd[..., None]] = 0
+    chars[..., 1:1 + digits] = int_chars
+    neg = np.signbit(x)
+    rows, cols = np.nonzero(neg)
+    chars[rows, cols, digits - nd[neg]] = ord('-')
+    if precision > 0:
+        chars[..., 1 + digits] = ord('.')
+        chars[..., 2 + digits:2 + digits + precision] = \
+            _digits(frac, precision)
+    chars[:, :-1, -1] = ord(' ')
+
+    chars = chars.reshape(n, -1)
+    used = chars != 0
+    ends = np.cumsum(used.sum(axis=1)).tolist()
+    data = chars[used].tobytes()
+    return [data[s:e] for s, e in six.moves.zip([0] + ends[:-1], ends)]
+
+
+def format_rows(arr, precision=None):
+    """
+    Format vectors as space separated values.
+
+    Args:
+        arr (numpy.ndarray): Vectors of shape
+            ``(number of rows, feature dimension)``.
+        precision (int or None): Number of digits after the decimal point,
+            as in ``'%.<precision>f'``. If ``None``, each value is written in
+            the shortest form that is read back to the same value, which is
+            much slower.
+
+    Returns:
+        list: Values of each row (``bytes``).
+    """
+    arr = np.asarray(arr)
+    if precision is not None and len(arr) > 0 and arr.shape[1] > 0:
+        ret = _format_fixed(arr, precision)
+        if ret is not None:
+            return ret
+    return _format_python(arr, precision)
+
+
+def format_lines(tokens, arr, precision=None):
+    """
+    Format rows as ``token v_1 ... v_size`` lines.
+
+    Args:
+        tokens (list): Words (``bytes``) of the rows.
+        arr (numpy.ndarray): Vectors of the rows.
+        precision (int or None): Check :func:`format_rows`.
+
+    Returns:
+        bytes: Lines joined by new lines, without a new line at the end.
+    """
+    return b'\n'.join(
+        token + b' ' + v
+        for token, v in six.moves.zip(tokens, format_rows(arr, precision)))
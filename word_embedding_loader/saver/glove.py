@@ -8,14 +8,10 @@ from Stanford NLP group.
 from __future__ import absolute_import, division, print_function, \
     unicode_literals
 
-import  six
+from word_embedding_loader.saver import _rows, _text
 
-def _write_line(f, vec, word):
-    v_text = b' '.join(map(lambda v: six.text_type(v).encode('utf-8'), vec))
-    f.write(word + b' ' + v_text)
 
-
-def save(f, arr, vocab):
+def save(f, arr, vocab, precision=None):
     """
     Save word embedding file.
 
@@ -25,11 +21,39 @@ def save(f, arr, vocab):
         arr (numpy.array): Numpy array with ``float`` dtype.
         vocab (iterable): Each element is pair of a word (``bytes``) and ``arr``
             index (``int``). Word should be encoded to str apriori.
+        precision (int or None): Number of digits after the decimal point of
+            each value. Values are formatted by NumPy in blocks, which is much
+            faster. If ``None``, values are written in the shortest form that
+            is read back to the same value.
+    """
+    batches = _rows.iter_batches(
+        arr, vocab, _text.block_rows(arr.shape[1], precision))
+    save_rows(f, batches, precision=precision)
+
+
+def save_rows(f, batches, words=None, size=None, precision=None):
+    """
+    Save word embedding file from batches of rows, holding only one batch in
+    memory at a time.
+
+    Args:
+        f (File): File to write the vectors. File should be open for writing
+            ascii.
+        batches (iterable): Each element is a pair of words (list of
+            ``bytes``) and their vectors (``numpy.ndarray``), such as the
+            output of :func:`word_embedding_loader.loader.glove.iter_rows`.
+        words (int): Total number of rows in ``batches``. Formats with a
+            header need it before writing the first row; it is ignored by
+            this format.
+        size (int): Feature dimension. Ignored by this format.
+        precision (int or None): Check :func:`save`.
     """
-    itr = iter(vocab)
-    # Avoid empty line at the end
-    word, idx = next(itr)
-    _write_line(f, arr[idx], word)
-    for word, idx in itr:
-        f.write(b'\n')
-        _write_line(f, arr[idx], word)
+    first = True
+    for tokens, arr in batches:
+        if len(tokens) == 0:
+            continue
+        # Avoid empty line at the end
+        if not first:
+            f.write(b'\n')
+        f.write(_text.format_lines(tokens, arr, precision))
+        first = False
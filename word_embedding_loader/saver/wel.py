@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+"""
+Low level API for saving of the native binary format of this package. Refer
+to :mod:`word_embedding_loader.loader.wel` for the file layout.
+"""
+from __future__ import absolute_import, division, print_function, \
+    unicode_literals
+
+import itertools
+import json
+import shutil
+import tempfile
+
+import numpy as np
+import six
+
+from word_embedding_loader.arrays import QuantizedVectors, quantize_rows
+from word_embedding_loader.loader.wel import ALIGN, MAGIC, OFFSET_DTYPE, \
+    QUANTIZED_VERSION, SCALE_DTYPE, VERSION
+from word_embedding_loader.progress import as_progress
+from word_embedding_loader.vocabulary import HASH, build_table, table_dtype
+from word_embedding_loader.saver._rows import iter_batches
+from word_embedding_loader.saver.word2vec_text import _check_rows
+
+
+# Approximate number of bytes of vectors written at once
+_CHUNK_BYTES = 1 << 24
+
+
+def _header_line(header):
+    text = json.dumps(header, sort_keys=True).encode('ascii')
+    # Pad with spaces so that the vectors start at a multiple of ALIGN
+    n = len(MAGIC) + len(text) + 1
+    return text + b' ' * (-n % ALIGN) + b'\n'
+
+
+def save(f, arr, vocab, source=None, progress=None):
+    """
+    Save word embedding file.
+    Check :func:`word_embedding_loader.saver.glove.save` for the API.
+
+    Args:
+        source (dict or None): Description of the file that ``arr`` was loaded
+            from (e.g. its path and checksum). It must be serializable as
+            JSON.
+        progress (word_embedding_loader.progress.Progress or callable):
+            Receives the number of rows written (see
+            :mod:`word_embedding_loader.progress`).
+
+    If ``arr`` is a :class:`~word_embedding_loader.arrays.QuantizedVectors`,
+    its codes, scales and offsets are stored as they are.
+    """
+    size = arr.shape[1]
+    if not hasattr(vocab, '__len__'):
+        # The number of words is written before them
+        vocab = list(vocab)
+    quantized = isinstance(arr, QuantizedVectors)
+    itemsize = 1 if quantized else np.dtype(arr.dtype).itemsize
+    step = max(1, _CHUNK_BYTES // max(1, size * itemsize))
+    # Vectors are written in the order of vocab
+    batches = iter_batches(arr, vocab, step,
+                           take=arr.select if quantized else None,
+                           progress=as_progress(progress))
+    save_rows(f, batches, len(vocab), size, source=source, dtype=arr.dtype,
+              quantize=quantized)
+
+
+def save_rows(f, batches, words, size, source=None, dtype=None,
+              quantize=False):
+    """
+    Check :func:`word_embedding_loader.saver.glove.save_rows` for the API.
+    Words are spooled to temporary files until all the vectors are written.
+
+    Args:
+        source (dict or None): Check :func:`save`.
+        dtype (numpy.dtype): Element data type to store the vectors in. The
+            data type of the first batch is used if ``None``. It is ignored
+            if ``quantize`` is ``True``.
+        quantize (bool): Store the vectors as 8 bit codes with a scale and
+            an offset for each row (see
+            :func:`word_embedding_loader.arrays.quantize_rows`). Batches may
+            then be :class:`~word_embedding_loader.arrays.QuantizedVectors`,
+            which are stored without quantizing them again.
+    """
+    batches = iter(batches)
+    first = next(batches, None)
+    if first is not None:
+        batches = itertools.chain([first], batches)
+    if dtype is None:
+        dtype = np.float32 if first is None else first[1].dtype
+    dtype = np.dtype(np.uint8 if quantize else dtype)
+
+    header = {
+        'version': QUANTIZED_VERSION if quantize else VERSION,
+        'dtype': dtype.str,
+        'shape': [words, size],
+        'source': source,
+        'hash': HASH,
+    }
+    if quantize:
+        header['quantized'] = True
+    head = MAGIC + _header_line(header)
+    f.write(head)
+
+    n = 0
+    total = 0
+    with tempfile.TemporaryFile() as offsets, \
+            tempfile.TemporaryFile() as tokens, \
+            tempfile.TemporaryFile() as scales, \
+            tempfile.TemporaryFile() as biases:
+        offsets.write(np.zeros(1, dtype=OFFSET_DTYPE).tobytes())
+        for batch_tokens, arr in batches:
+            if quantize:
+                if isinstance(arr, QuantizedVectors):
+                    arr, scale, offset = arr.codes, arr.scale, arr.offset
+                else:
+                    arr, scale, offset = quantize_rows(arr)
+                scales.write(np.asarray(scale, dtype=SCALE_DTYPE).tobytes())
+                biases.write(np.asarray(offset, dtype=SCALE_DTYPE).tobytes())
+            f.write(np.ascontiguousarray(arr, dtype=dtype).tobytes())
+            ends = np.cumsum([len(t) for t in batch_tokens], dtype=np.int64)
+            offsets.write((total + ends).astype(OFFSET_DTYPE).tobytes())
+            tokens.write(b''.join(batch_tokens))
+            if len(ends) > 0:
+                total += int(ends[-1])
+            n += len(batch_tokens)
+        _check_rows(n, words)
+
+        pos = len(head) + words * size * dtype.itemsize
+        if quantize:
+            # Scales then offsets of the rows
+            f.write(b'\0' * (-pos % ALIGN))
+            pos += -pos % ALIGN + 2 * words * SCALE_DTYPE.itemsize
+            for spool in (scales, biases):
+                spool.seek(0)
+                shutil.copyfileobj(spool, f)
+        f.write(b'\0' * (-pos % ALIGN))
+        pos += -pos % ALIGN + (words + 1) * OFFSET_DTYPE.itemsize + total
+        for spool in (offsets, tokens):
+            spool.seek(0)
+            shutil.copyfileobj(spool, f)
+
+        # Hash table of words
+        offsets.seek(0)
+        tokens.seek(0)
+        table = build_table(
+            tokens.read(),
+            np.frombuffer(offsets.read(), dtype=OFFSET_DTYPE))
+    f.write(b'\0' * (-pos % ALIGN))
+    f.write(table.astype(table_dtype(words), copy=False).tobytes())
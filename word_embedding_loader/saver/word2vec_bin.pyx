@@ -5,61 +5,73 @@ Low level API for loading of word embedding file that was implemented in
 `word2vec <https://code.google.com/archive/p/word2vec/>`_, by Mikolov.
 This implementation is for word embedding file created with ``-binary 1``
 option.
-"""
 
-from collections import OrderedDict
+Rows are formatted into blocks in memory and written with ``f.write``, so any
+writable binary stream (e.g. :class:`io.BytesIO` or a gzip file) can be used.
+"""
 
-import ctypes
-from libc.stdio cimport FILE, fprintf, fwrite, fdopen, fflush, ferror
 import numpy as np
 cimport numpy as np
-from libcpp.pair cimport pair
-from libcpp.vector cimport vector
-from libcpp.string cimport string
-from cython.operator cimport dereference, preincrement
+from libc.string cimport memcpy
+from cpython.bytes cimport PyBytes_AS_STRING, PyBytes_FromStringAndSize, \
+    PyBytes_GET_SIZE
+
+from word_embedding_loader.saver import _rows
+from word_embedding_loader.saver.word2vec_text import _check_rows
 
 ctypedef np.float32_t FLOAT
 
+# Approximate number of bytes of vectors written at once
+_CHUNK_BYTES = 1 << 24
+
 
-cdef int _save_impl(FILE *f, np.ndarray[FLOAT, ndim=2, mode="c"] arr, vector[pair[string, int]]& vocab, long long size) except -1:
-    cdef vector[pair[string, int]].iterator end = vocab.end()
-    cdef vector[pair[string, int]].iterator it = vocab.begin()
-    cdef int ret = 0
+cdef bytes _format_rows(list tokens, np.ndarray arr):
+    # "\n<word> <vector>" for each row of arr (C-contiguous float32)
+    cdef Py_ssize_t row_bytes = arr.shape[1] * sizeof(FLOAT)
+    cdef Py_ssize_t total = 0
+    cdef Py_ssize_t i, n
+    cdef bytes token
+    for token in tokens:
+        total += PyBytes_GET_SIZE(token) + 2 + row_bytes
+    cdef bytes out = PyBytes_FromStringAndSize(NULL, total)
+    cdef char *p = PyBytes_AS_STRING(out)
+    cdef char *src = np.PyArray_BYTES(arr)
+    for i in range(len(tokens)):
+        token = tokens[i]
+        n = PyBytes_GET_SIZE(token)
+        p[0] = b'\n'
+        memcpy(p + 1, PyBytes_AS_STRING(token), n)
+        p[n + 1] = b' '
+        p += n + 2
+        memcpy(p, src + i * row_bytes, row_bytes)
+        p += row_bytes
+    return out
 
-    while it != end:
-        # Write word
-        fprintf(f, "\n%s ", dereference(it).first.c_str())
-        if ferror(f) != 0:
-            ret = -1
-            break
-        # Write the vector
-        fwrite(&arr[dereference(it).second, 0], sizeof(FLOAT), size, f)
-        if ferror(f) != 0:
-            ret = -1
-            break
-        preincrement(it)
-    return ret
+
+def _write_rows(f, batches):
+    # Write rows after the header and return the number of rows
+    n = 0
+    for tokens, arr in batches:
+        if len(tokens) == 0:
+            continue
+        f.write(_format_rows(list(tokens),
+                             np.ascontiguousarray(arr, dtype=np.float32)))
+        n += len(tokens)
+    return n
 
 
 def save(f, arr, vocab, counts=None):
     u"""
     Refer to :func:`word_embedding_loader.saver.glove.save` for the API.
     """
-    cdef long long size = arr.shape[1]
-    cdef long long words = arr.shape[0]
-    cdef np.ndarray[FLOAT, ndim=2, mode="c"] carr = arr
-    cdef vector[pair[string, int]] cvocab = vocab
+    f.write(('%d %d' % (arr.shape[0], arr.shape[1])).encode('utf-8'))
+    step = max(1, _CHUNK_BYTES // max(1, arr.shape[1] * sizeof(FLOAT)))
+    _write_rows(f, _rows.iter_batches(arr, vocab, step))
+
 
-    cdef FILE *fin = fdopen(f.fileno(), 'w') # attach the stream
-    if (fin) == NULL:
-       raise IOError()
-    cdef int ret = 0
-    ret = fprintf(fin, '%lld %lld', words, size)
-    if ret < 0:
-        raise IOError()
-    ret = _save_impl(fin, carr, cvocab, size)
-    if ret < 0:
-        raise IOError()
-    fflush(fin)
-    if ferror(fin) != 0:
-        raise IOError()
+def save_rows(f, batches, long long words, long long size):
+    u"""
+    Check :func:`word_embedding_loader.saver.glove.save_rows` for the API.
+    """
+    f.write(('%d %d' % (words, size)).encode('utf-8'))
+    _check_rows(_write_rows(f, batches), words)
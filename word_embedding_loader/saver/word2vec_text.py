@@ -8,20 +8,42 @@ option (the default).
 from __future__ import absolute_import, division, print_function, \
     unicode_literals
 
-import six
+from word_embedding_loader.saver import _rows, _text
 
 
-def _write_line(f, vec, word):
-    v_text = b' '.join(map(lambda v: six.text_type(v).encode('utf-8'), vec))
-    # Avoid empty line at the end
-    f.write(b'\n' + word + b' ' +  v_text)
+def _write_rows(f, batches, precision):
+    # Write rows after the header and return the number of rows
+    n = 0
+    for tokens, arr in batches:
+        if len(tokens) == 0:
+            continue
+        # Avoid empty line at the end
+        f.write(b'\n')
+        f.write(_text.format_lines(tokens, arr, precision))
+        n += len(tokens)
+    return n
 
 
-def save(f, arr, vocab):
+def save(f, arr, vocab, precision=None):
     """
     Save word embedding file.
     Check :func:`word_embedding_loader.saver.glove.save` for the API.
     """
     f.write(('%d %d' % (arr.shape[0], arr.shape[1])).encode('utf-8'))
-    for word, idx in vocab:
-        _write_line(f, arr[idx], word)
+    _write_rows(f, _rows.iter_batches(
+        arr, vocab, _text.block_rows(arr.shape[1], precision)), precision)
+
+
+def save_rows(f, batches, words, size, precision=None):
+    """
+    Check :func:`word_embedding_loader.saver.glove.save_rows` for the API.
+    """
+    f.write(('%d %d' % (words, size)).encode('utf-8'))
+    _check_rows(_write_rows(f, batches, precision), words)
+
+
+def _check_rows(n, words):
+    if n != words:
+        raise ValueError(
+            ('Number of rows (%d) did not match the header (%d)' %
+             (n, words)).encode('utf-8'))
@@ -0,0 +1,339 @@
+# -*- coding: utf-8 -*-
+"""
+Exact nearest neighbor search over word embedding vectors, which backs
+:func:`~word_embedding_loader.word_embedding.WordEmbedding.most_similar`.
+
+Queries are stacked into a matrix and scored against blocks of vector rows
+with one matrix multiplication per block, so that the temporary score matrix
+stays within :data:`SCRATCH_BYTES`. The best ``k`` rows of each block are
+selected with :func:`numpy.argpartition` and merged into the running top
+``k``; only the final ``k`` candidates of each query are sorted.
+"""
+
+from __future__ import absolute_import, division, print_function, \
+    unicode_literals
+
+import numpy as np
+import six
+
+
+__all__ = ["normalize", "squared_norms", "inverse_norms", "search",
+           "analogy", "METRICS", "ANALOGY_METHODS"]
+
+
+METRICS = ('cosine', 'dot', 'l2')
+
+ANALOGY_METHODS = ('3cosadd', '3cosmul')
+
+# Added to the denominator of 3CosMul to avoid division by zero
+_COSMUL_EPS = 1e-3
+
+# Approximate number of bytes of a score matrix
+SCRATCH_BYTES = 1 << 24
+
+# Number of queries scored at once
+_QUERY_BLOCK = 1024
+
+
+def compute_dtype(dtype):
+    """
+    Element data type to compute scores in. Types that BLAS does not support
+    (e.g. ``float16``) are computed in ``float32``.
+
+    Args:
+        dtype (numpy.dtype): Element data type of vectors.
+
+    Returns:
+        numpy.dtype
+    """
+    return np.result_type(np.dtype(dtype), np.float32)
+
+
+def _blocks(vectors, step, dtype, end=None):
+    # Consecutive blocks of rows before end in dtype
+    end = len(vectors) if end is None else min(end, len(vectors))
+    for start in six.moves.range(0, end, step):
+        yield start, np.asarray(vectors[start:min(start + step, end)],
+                                dtype=dtype)
+
+
+def normalize(vectors, dtype=None):
+    """
+    Scale rows to unit L2 norm. Rows of all zeros are left as they are.
+
+    Args:
+        vectors (numpy.ndarray or word_embedding_loader.arrays.RowVectors):
+            Vectors in shape of ``(number of rows, feature dimension)``.
+        dtype (numpy.dtype): Element data type of the result. It is
+            :func:`compute_dtype` of ``vectors.dtype`` if ``None``.
+
+    Returns:
+        numpy.ndarray: Normalized copy of ``vectors``.
+    """
+    if dtype is None:
+        dtype = compute_dtype(vectors.dtype)
+    out = np.empty(vectors.shape, dtype=dtype)
+    step = max(1, SCRATCH_BYTES // max(1, out.itemsize * out.shape[-1]))
+    for start, block in _blocks(vectors, step, dtype):
+        norms = np.sqrt(np.einsum('ij,ij->i', block, block))
+        norms[norms == 0] = 1
+        out[start:start + len(block)] = block / norms[:, None]
+    return out
+
+
+def squared_norms(vectors, dtype=None):
+    """
+    Squared L2 norm of each row.
+
+    Args:
+        vectors (numpy.ndarray or word_embedding_loader.arrays.RowVectors):
+            Vectors in shape of ``(number of rows, feature dimension)``.
+        dtype (numpy.dtype): Element data type of the result. It is
+            :func:`compute_dtype` of ``vectors.dtype`` if ``None``.
+
+    Returns:
+        numpy.ndarray
+    """
+    if dtype is None:
+        dtype = compute_dtype(vectors.dtype)
+    out = np.empty(len(vectors), dtype=dtype)
+    step = max(1, SCRATCH_BYTES // max(1, np.dtype(dtype).itemsize *
+                                       vectors.shape[1]))
+    for start, block in _blocks(vectors, step, dtype):
+        out[start:start + len(block)] = np.einsum('ij,ij->i', block, block)
+    return out
+
+
+def inverse_norms(vectors, dtype=None):
+    """
+    Inverse of the L2 norm of each row (``0`` for rows of all zeros), by
+    which dot products are scaled to cosine similarities without a
+    normalized copy of the vectors.
+
+    Args:
+        vectors (numpy.ndarray or word_embedding_loader.arrays.RowVectors):
+            Vectors in shape of ``(number of rows, feature dimension)``.
+        dtype (numpy.dtype): Element data type of the result. It is
+            :func:`compute_dtype` of ``vectors.dtype`` if ``None``.
+
+    Returns:
+        numpy.ndarray
+    """
+    norms = np.sqrt(squared_norms(vectors, dtype))
+    nonzero = norms > 0
+    norms[nonzero] = 1 / norms[nonzero]
+    return norms
+
+
+def top_k(scores, k):
+    """
+    Select the ``k`` largest scores of each row.
+
+    Args:
+        scores (numpy.ndarray): Scores in shape of
+            ``(number of queries, number of candidates)``.
+        k (int): Number of scores to select. It must not exceed the number of
+            candidates.
+
+    Returns:
+        numpy.ndarray: Column indices in shape of ``(number of queries, k)``
+        in descending order of scores.
+        numpy.ndarray: Corresponding scores.
+    """
+    rows = np.arange(len(scores))[:, None]
+    if k < scores.shape[1]:
+        idx = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        idx = np.broadcast_to(np.arange(scores.shape[1]), scores.shape)
+    vals = scores[rows, idx]
+    order = np.argsort(-vals, axis=1, kind='mergesort')
+    return idx[rows, order], vals[rows, order]
+
+
+def _blocked_top_k(vectors, n, k, score, exclude, dtype, end, width=1):
+    # Running top k of n queries over blocks of rows before end. score(start,
+    # block) computes the scores of a block, with about width scores of
+    # scratch space per query and row. exclude is an (n, m) array of row
+    # indices to exclude.
+    best_idx = np.full((n, k), -1, dtype=np.int64)
+    best = np.full((n, k), -np.inf, dtype=dtype)
+    rows = np.arange(n)
+    step = max(k, SCRATCH_BYTES // max(1, np.dtype(dtype).itemsize * n *
+                                       width))
+    for start, block in _blocks(vectors, step, dtype, end):
+        scores = score(start, block)
+        if exclude is not None:
+            for col in exclude.T:
+                hit = (col >= start) & (col < start + len(block))
+                scores[rows[hit], col[hit] - start] = -np.inf
+        idx, vals = top_k(scores, min(k, len(block)))
+        cand_idx = np.concatenate([best_idx, idx + start], axis=1)
+        cand = np.concatenate([best, vals], axis=1)
+        sel, best = top_k(cand, k)
+        best_idx = cand_idx[rows[:, None], sel]
+    return best_idx, best
+
+
+def _exclusions(exclude, n):
+    # Row indices to exclude as an (n, m) array
+    if exclude is None:
+        return None
+    exclude = np.asarray(exclude, dtype=np.int64)
+    return exclude.reshape(n, -1)
+
+
+def _max_k(k, rows, exclude):
+    # Reduce k to the number of rows before rows that every query can return,
+    # so that no excluded row fills the results
+    if exclude is None or exclude.size == 0:
+        return min(k, rows)
+    exclude = np.sort(exclude, axis=1)
+    hit = (exclude >= 0) & (exclude < rows)
+    hit[:, 1:] &= exclude[:, 1:] != exclude[:, :-1]
+    return max(0, min(k, rows - int(hit.sum(axis=1).max())))
+
+
+def search(vectors, queries, k=10, metric='dot', norms=None, exclude=None,
+           restrict=None, weights=None):
+    """
+    Find the rows of ``vectors`` with the highest scores for each query.
+
+    Args:
+        vectors (numpy.ndarray or word_embedding_loader.arrays.RowVectors):
+            Vectors to search in shape of
+            ``(number of rows, feature dimension)``. For cosine similarity,
+            pass vectors and queries normalized by :func:`normalize` with
+            ``metric='dot'``.
+        queries (numpy.ndarray): Query vectors in shape of
+            ``(number of queries, feature dimension)``.
+        k (int): Number of rows to find for each query. It is reduced to the
+            number of rows if it is larger, minus the most rows that a query
+            excludes.
+        metric (str): ``'dot'`` for dot product or ``'l2'`` for Euclidean
+            distance.
+        norms (numpy.ndarray or None): :func:`squared_norms` of ``vectors``
+            for ``metric='l2'``. They are computed if ``None``.
+        exclude (numpy.ndarray or None): Row index to exclude from the
+            results of each query, or ``-1`` to exclude nothing. Several
+            indices can be given for each query in shape of
+            ``(number of queries, m)``.
+        restrict (int or None): Only search the first ``restrict`` rows.
+        weights (numpy.ndarray or None): Factor of each row that dot
+            products are multiplied by, such as :func:`inverse_norms` for
+            cosine similarity with vectors that are not normalized.
+
+    Returns:
+        numpy.ndarray: Row indices in shape of ``(number of queries, k)``,
+        from the best.
+        numpy.ndarray: Dot products, or Euclidean distances for
+        ``metric='l2'``, of the rows.
+    """
+    if metric not in ('dot', 'l2'):
+        raise ValueError(('Unknown metric "%s"' % metric).encode('utf-8'))
+    dtype = compute_dtype(vectors.dtype)
+    queries = np.ascontiguousarray(queries, dtype=dtype)
+    if metric == 'l2' and norms is None:
+        norms = squared_norms(vectors, dtype)
+    if metric == 'dot':
+        norms = None
+    rows = len(vectors) if restrict is None else min(restrict, len(vectors))
+    exclude = _exclusions(exclude, len(queries))
+    k = _max_k(k, rows, exclude)
+    indices = np.empty((len(queries), k), dtype=np.int64)
+    scores = np.empty((len(queries), k), dtype=dtype)
+    for start in six.moves.range(0, len(queries), _QUERY_BLOCK):
+        end = start + _QUERY_BLOCK
+        q = queries[start:end]
+
+        def score(row, block):
+            ret = np.dot(q, block.T)
+            if weights is not None:
+                ret *= weights[row:row + len(block)]
+            if norms is not None:
+                # Ranking by 2 q.v - |v|^2 is ranking by -|q - v|^2
+                ret *= 2
+                ret -= norms[row:row + len(block)]
+            return ret
+        indices[start:end], scores[start:end] = _blocked_top_k(
+            vectors, len(q), k, score,
+            None if exclude is None else exclude[start:end], dtype, rows)
+    if metric == 'l2':
+        q_norms = np.einsum('ij,ij->i', queries, queries)
+        scores = np.sqrt(np.maximum(q_norms[:, None] - scores, 0))
+    return indices, scores
+
+
+def analogy(vectors, a, b, c, k=1, method='3cosadd', exclude=None,
+            restrict=None, weights=None):
+    """
+    Solve analogies ``a : b :: c : ?`` by finding the rows of ``vectors``
+    that are similar to ``b`` and ``c`` and dissimilar to ``a``.
+
+    Args:
+        vectors (numpy.ndarray or word_embedding_loader.arrays.RowVectors):
+            Vectors to search, normalized by :func:`normalize` unless
+            ``weights`` is given.
+        a (numpy.ndarray): Normalized vectors of ``a`` in shape of
+            ``(number of queries, feature dimension)``.
+        b (numpy.ndarray): Normalized vectors of ``b``.
+        c (numpy.ndarray): Normalized vectors of ``c``.
+        k (int): Number of rows to find for each query. It is reduced as in
+            :func:`search`.
+        method (str): ``'3cosadd'`` to rank rows ``d`` by
+            ``cos(d, b) - cos(d, a) + cos(d, c)``, or ``'3cosmul'`` to rank
+            them by ``cos'(d, b) cos'(d, c) / (cos'(d, a) + 0.001)``, where
+            ``cos' = (cos + 1) / 2`` (Levy and Goldberg, 2014).
+        exclude (numpy.ndarray or None): Row indices to exclude from the
+            results of each query (usually those of ``a``, ``b`` and ``c``)
+            in shape of ``(number of queries, m)``.
+        restrict (int or None): Only search the first ``restrict`` rows.
+        weights (numpy.ndarray or None): :func:`inverse_norms` of
+            ``vectors`` if they are not normalized.
+
+    Returns:
+        numpy.ndarray: Row indices in shape of ``(number of queries, k)``,
+        from the best.
+        numpy.ndarray: Scores of the rows.
+    """
+    if method not in ANALOGY_METHODS:
+        raise ValueError(('Unknown method "%s"' % method).encode('utf-8'))
+    dtype = compute_dtype(vectors.dtype)
+    a, b, c = (np.ascontiguousarray(x, dtype=dtype) for x in (a, b, c))
+    rows = len(vectors) if restrict is None else min(restrict, len(vectors))
+    exclude = _exclusions(exclude, len(a))
+    k = _max_k(k, rows, exclude)
+    indices = np.empty((len(a), k), dtype=np.int64)
+    scores = np.empty((len(a), k), dtype=dtype)
+    for start in six.moves.range(0, len(a), _QUERY_BLOCK):
+        end = start + _QUERY_BLOCK
+        n = len(a[start:end])
+        if method == '3cosadd':
+            # The sum of cosines is the dot product with b - a + c
+            q = b[start:end] - a[start:end] + c[start:end]
+
+            def score(row, block):
+                ret = np.dot(q, block.T)
+                if weights is not None:
+                    ret *= weights[row:row + len(block)]
+                return ret
+            width = 1
+        else:
+            # Cosines with a, b and c by one matrix multiplication
+            q = np.concatenate([a[start:end], b[start:end], c[start:end]])
+
+            def score(row, block):
+                cos = np.dot(q, block.T)
+                if weights is not None:
+                    cos *= weights[row:row + len(block)]
+                cos += 1
+                cos /= 2
+                ret = cos[n:2 * n]
+                ret *= cos[2 * n:]
+                ret /= cos[:n] + _COSMUL_EPS
+                return ret
+            width = 3
+        indices[start:end], scores[start:end] = _blocked_top_k(
+            vectors, n, k, score,
+            None if exclude is None else exclude[start:end], dtype, rows,
+            width)
+    return indices, scores
@@ -0,0 +1,358 @@
+# -*- coding: utf-8 -*-
+"""
+Compact mapping from words to vector indices.
+
+A :class:`Vocabulary` stores all the words in a single ``bytes`` buffer
+together with their offsets, and finds words through an open addressing hash
+table held in a NumPy array. It takes a small fraction of the memory of a
+``dict`` of ``bytes``, and since all of its state consists of flat arrays, it
+can be saved to and memory-mapped from a file (see
+:mod:`word_embedding_loader.loader.wel`).
+"""
+
+from __future__ import absolute_import, division, print_function, \
+    unicode_literals
+
+try:
+    from collections.abc import ItemsView, Mapping
+except ImportError:
+    from collections import ItemsView, Mapping
+
+import numpy as np
+import six
+
+from word_embedding_loader._vocabulary import Builder, HashTable, crc32_words
+
+
+__all__ = ["Vocabulary", "VocabularyBuilder"]
+
+
+# Name of the hash function, which is recorded in files that store the table
+HASH = 'crc32'
+
+
+def hash_words(tokens, offsets):
+    """
+    Compute the CRC-32 (same as :func:`zlib.crc32`) of many words at once.
+
+    Args:
+        tokens (bytes or numpy.ndarray): Concatenated words.
+        offsets (numpy.ndarray): Word ``i`` is
+            ``tokens[offsets[i]:offsets[i + 1]]``.
+
+    Returns:
+        numpy.ndarray: ``uint32`` hash of each word.
+    """
+    buf = np.frombuffer(tokens, dtype=np.uint8) \
+        if not isinstance(tokens, np.ndarray) else tokens
+    return crc32_words(np.ascontiguousarray(buf, dtype=np.uint8),
+                       np.ascontiguousarray(offsets, dtype=np.int64))
+
+
+def table_size(n):
+    """
+    Number of slots of the hash table for ``n`` words, which is the smallest
+    power of two that keeps the table at most half full.
+    """
+    return 1 << max(3, (2 * n - 1).bit_length())
+
+
+def table_dtype(n):
+    """
+    Element data type of the hash table for ``n`` words.
+    """
+    return np.dtype('<i4') if n < (1 << 31) else np.dtype('<i8')
+
+
+def build_table(tokens, offsets):
+    """
+    Build the hash table of words.
+
+    Args:
+        tokens (bytes or numpy.ndarray): Concatenated words.
+        offsets (numpy.ndarray): Word ``i`` is
+            ``tokens[offsets[i]:offsets[i + 1]]``.
+
+    Returns:
+        numpy.ndarray: Table of :func:`table_size` slots holding a word index
+        or ``-1`` for empty slots. Words are placed by linear probing from
+        ``hash % table size``.
+    """
+    n = len(offsets) - 1
+    size = table_size(n)
+    table = np.full(size, -1, dtype=table_dtype(n))
+    slots = hash_words(tokens, offsets).astype(np.int64) & (size - 1)
+    pending = np.arange(n, dtype=np.int64)
+    # Insert all the pending words at once; when several words claim the
+    # same empty slot, one of them wins and the others probe the next slot
+    while len(pending) > 0:
+        s = slots[pending]
+        free = table[s] < 0
+        table[s[free]] = pending[free]
+        placed = np.zeros(len(pending), dtype=np.bool_)
+        placed[free] = table[s[free]] == pending[free]
+        pending = pending[~placed]
+        slots[pending] = (slots[pending] + 1) & (size - 1)
+    return table
+
+
+def _equal_bytes(a, a_starts, b, b_starts, lengths):
+    # Compare a[a_starts[i]:a_starts[i] + lengths[i]] with the same slice of
+    # b for every i
+    total = int(lengths.sum())
+    if total == 0:
+        return np.ones(len(lengths), dtype=np.bool_)
+    owner = np.repeat(np.arange(len(lengths)), lengths)
+    pos = np.arange(total) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    differ = a[a_starts[owner] + pos] != b[b_starts[owner] + pos]
+    return np.bincount(owner[differ], minlength=len(lengths)) == 0
+
+
+class _ItemsView(ItemsView):
+    def __iter__(self):
+        return six.moves.zip(self._mapping, six.moves.range(len(self._mapping)))
+
+
+class Vocabulary(HashTable, Mapping):
+    """
+    Read-only mapping from words (``bytes``) to vector indices (``int``).
+    Indices are ``0, 1, ...`` in the order of the words, and iteration
+    yields words in that order. Words must be unique.
+
+    .. note:: You do not need to call initializer directly in normal usage.
+        Use :meth:`from_words` or :meth:`from_dict`, or get one from
+        :func:`~word_embedding_loader.word_embedding.WordEmbedding.load`.
+
+    Args:
+        tokens (bytes or numpy.ndarray): Concatenated words, such as a
+            ``uint8`` :class:`numpy.memmap`.
+        offsets (numpy.ndarray): ``len(words) + 1`` offsets; word ``i`` is
+            ``tokens[offsets[i]:offsets[i + 1]]``.
+        table (numpy.ndarray or None): Hash table built by
+            :func:`build_table`. It is built if ``None``.
+    """
+    def __init__(self, tokens, offsets, table=None):
+        self._tokens = tokens
+        # Slices of a memoryview are much cheaper than those of an ndarray
+        self._buf = tokens if isinstance(tokens, bytes) else memoryview(tokens)
+        # Arrays read from files are little-endian; lookups need native ones
+        offsets = np.asanyarray(offsets)
+        if offsets.dtype != np.int64:
+            offsets = offsets.astype(np.int64)
+        self._offsets = offsets
+        if table is None:
+            table = build_table(tokens, offsets)
+        if table.dtype not in (np.int32, np.int64):
+            table = table.astype(table.dtype.newbyteorder('='))
+        self._table = table
+        self._set_table(tokens, offsets, table)
+
+    @classmethod
+    def from_words(cls, words):
+        """
+        Create vocabulary from words.
+
+        Args:
+            words (iterable): Unique words (``bytes``) in the order of
+                indices.
+
+        Returns:
+            Vocabulary
+        """
+        words = list(words)
+        offsets = np.zeros(len(words) + 1, dtype=np.int64)
+        np.cumsum(np.fromiter(six.moves.map(len, words), dtype=np.int64,
+                              count=len(words)), out=offsets[1:])
+        return cls(b''.join(words), offsets)
+
+    @classmethod
+    def from_dict(cls, vocab):
+        """
+        Create vocabulary from a ``dict``.
+
+        Args:
+            vocab (dict): Mapping from words (``bytes``) to vector indices,
+                which must be ``0, 1, ..., len(vocab) - 1``.
+
+        Returns:
+            Vocabulary
+
+        Raises:
+            ValueError: Indices are not ``0, 1, ..., len(vocab) - 1``.
+        """
+        words = [None] * len(vocab)
+        try:
+            for word, idx in six.iteritems(vocab):
+                words[idx] = word
+        except (IndexError, TypeError):
+            raise ValueError(b'Vocabulary indices must be consecutive')
+        if any(w is None for w in words):
+            raise ValueError(b'Vocabulary indices must be consecutive')
+        return cls.from_words(words)
+
+    def word(self, index):
+        """
+        Get the word of a vector index.
+
+        Args:
+            index (int): Vector index.
+
+        Returns:
+            bytes
+        """
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(b'index out of bounds')
+        w = self._buf[self._offsets.item(index):self._offsets.item(index + 1)]
+        return w if isinstance(w, bytes) else w.tobytes()
+
+    def words(self, start=0, stop=None):
+        """
+        Get the words of a range of vector indices.
+
+        Args:
+            start (int): First index.
+            stop (int or None): Index after the last one. Up to the last word
+                if ``None``.
+
+        Returns:
+            list: Words (``bytes``).
+        """
+        start, stop, _ = slice(start, stop).indices(len(self))
+        return self._words(start, max(start, stop))
+
+    def lookup_ids(self, words, default=-1):
+        """
+        Get the vector indices of many words at once. Words are hashed by
+        :func:`hash_words` and the table is probed for all of them together.
+
+        Args:
+            words (iterable): Words (``bytes``).
+            default (int): Index of words that are not in the vocabulary.
+
+        Returns:
+            numpy.ndarray: ``int64`` index of each word.
+        """
+        if not hasattr(words, '__len__'):
+            words = list(words)
+        try:
+            buf = b''.join(words)
+            is_bytes = None
+        except TypeError:
+            # Words other than bytes are never found
+            is_bytes = np.fromiter((isinstance(w, bytes) for w in words),
+                                   dtype=np.bool_, count=len(words))
+            words = [w for w, b in six.moves.zip(words, is_bytes) if b]
+            buf = b''.join(words)
+        found = self._probe_all(words, buf)
+        if default != -1:
+            found[found < 0] = default
+        if is_bytes is None:
+            return found
+        ids = np.full(len(is_bytes), default, dtype=np.int64)
+        ids[is_bytes] = found
+        return ids
+
+    def _probe_all(self, words, buf):
+        # Find all the words (concatenated in buf) by linear probing, one
+        # slot per step for all the words not yet found or missed
+        buf = np.frombuffer(buf, dtype=np.uint8)
+        starts = np.zeros(len(words) + 1, dtype=np.int64)
+        np.cumsum(np.fromiter(six.moves.map(len, words), dtype=np.int64,
+                              count=len(words)), out=starts[1:])
+        lengths = np.diff(starts)
+        tokens = np.frombuffer(self._tokens, dtype=np.uint8) \
+            if not isinstance(self._tokens, np.ndarray) else self._tokens
+        mask = len(self._table) - 1
+        slots = hash_words(buf, starts).astype(np.int64) & mask
+        found = np.full(len(words), -1, dtype=np.int64)
+        pending = np.arange(len(words), dtype=np.int64)
+        while len(pending) > 0:
+            idx = self._table[slots[pending]].astype(np.int64)
+            # An empty slot means that the word is missing
+            pending = pending[idx >= 0]
+            idx = idx[idx >= 0]
+            begin = self._offsets[idx]
+            same = self._offsets[idx + 1] - begin == lengths[pending]
+            cand = np.flatnonzero(same)
+            equal = _equal_bytes(tokens, begin[cand], buf,
+                                 starts[pending[cand]], lengths[pending[cand]])
+            same[cand[~equal]] = False
+            found[pending[same]] = idx[same]
+            pending = pending[~same]
+            slots[pending] = (slots[pending] + 1) & mask
+        return found
+
+    def _read_only(self, *args):
+        raise TypeError(
+            b"Vocabulary is read-only; convert it to a dict with "
+            b"dict(vocab) to modify it")
+
+    __setitem__ = __delitem__ = _read_only
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __iter__(self):
+        offsets = self._offsets.tolist()
+        buf = self._buf
+        if isinstance(buf, bytes):
+            for i in six.moves.range(len(offsets) - 1):
+                yield buf[offsets[i]:offsets[i + 1]]
+        else:
+            for i in six.moves.range(len(offsets) - 1):
+                yield buf[offsets[i]:offsets[i + 1]].tobytes()
+
+    def keys(self):
+        return list(self) if six.PY2 else super(Vocabulary, self).keys()
+
+    def values(self):
+        return six.moves.range(len(self))
+
+    def items(self):
+        return list(_ItemsView(self)) if six.PY2 else _ItemsView(self)
+
+    iterkeys = __iter__
+
+    def itervalues(self):
+        return iter(six.moves.range(len(self)))
+
+    def iteritems(self):
+        return iter(_ItemsView(self))
+
+    def __getstate__(self):
+        # memoryview cannot be pickled
+        return {'tokens': self._tokens, 'offsets': self._offsets,
+                'table': self._table}
+
+    def __setstate__(self, state):
+        self.__init__(state['tokens'], state['offsets'], state['table'])
+
+    def __repr__(self):
+        return '<Vocabulary of %d words>' % len(self)
+
+
+class VocabularyBuilder(Builder):
+    """
+    Vocabulary that grows as a loader reads words. Words are stored in the
+    layout of :class:`Vocabulary` as they are added, so :meth:`build` only
+    copies flat arrays.
+
+    Methods:
+        add(word): Add ``word`` (``bytes``) unless it is already known, and
+            return its new index, or ``-1`` for a duplicate.
+        add_tokens(tokens, max_vocab=None): Add words in order of appearance,
+            skipping (and warning about) duplicates until there are
+            ``max_vocab`` words. Return the positions in ``tokens`` of the
+            newly added words and the number of tokens consumed.
+        find(word): Index of ``word``, or ``-1``.
+    """
+    def build(self):
+        """
+        Create the vocabulary of the words added so far.
+
+        Returns:
+            Vocabulary
+        """
+        return Vocabulary(*self.arrays(table_dtype(len(self))))
@@ -3,29 +3,69 @@ from __future__ import absolute_import, division, print_function, \
     unicode_literals
 import six
 
-__all__ = ["WordEmbedding", "classify_format"]
+__all__ = ["WordEmbedding", "classify_format", "convert", "sniff"]
 
+import contextlib
+import io
+import os
+import shutil
+import tempfile
 import warnings
 
 import numpy as np
 
-from word_embedding_loader import loader, saver
+from word_embedding_loader import loader, saver, similarity
+from word_embedding_loader._fileinfo import checksum_file, stat_file
+from word_embedding_loader.arrays import QuantizedVectors, RowVectors
+from word_embedding_loader.cache import LoadCache
+from word_embedding_loader.compression import detect as detect_compression, \
+    infer as infer_compression, member_name, open_compressed, \
+    open_decompressed
+from word_embedding_loader.exceptions import ParseWarning
+from word_embedding_loader.index import IVFIndex
+from word_embedding_loader.lazy import CACHE_ROWS, load_lazy
+from word_embedding_loader.progress import as_progress, file_position
+from word_embedding_loader.saver._rows import iter_batches, vocab_pairs
+from word_embedding_loader.vocabulary import Vocabulary, VocabularyBuilder
 
 
-# Mimick namespace
+# Mimick namespace. format and binary are the arguments of _select_module
+# that select the namespace. parallel tells if the loader accepts workers.
+# name identifies the loader and saver in progress reports.
 class _glove:
     loader = loader.glove
     saver = saver.glove
+    name = 'glove'
+    format = 'glove'
+    binary = False
+    parallel = True
 
 
 class _word2vec_bin:
     loader = loader.word2vec_bin
     saver = saver.word2vec_bin
+    name = 'word2vec_bin'
+    format = 'word2vec'
+    binary = True
+    parallel = False
 
 
 class _word2vec_text:
     loader = loader.word2vec_text
     saver = saver.word2vec_text
+    name = 'word2vec_text'
+    format = 'word2vec'
+    binary = False
+    parallel = True
+
+
+class _wel:
+    loader = loader.wel
+    saver = saver.wel
+    name = 'wel'
+    format = 'wel'
+    binary = False
+    parallel = False
 
 
 def _select_module(format, binary):
@@ -40,14 +80,34 @@ def _select_module(format, binary):
             mod = _word2vec_bin
         else:
             mod = _word2vec_text
+    elif format == 'wel':
+        mod = _wel
     else:
         raise NameError(('Unknown format "%s"' % format).encode('utf-8'))
     return mod
 
 
+def _saver_options(mod, precision):
+    # Keyword arguments for mod.saver; only text formats take precision
+    if precision is None:
+        return {}
+    if mod not in (_glove, _word2vec_text):
+        warnings.warn("Argument precision is ignored for this format.",
+                      UserWarning)
+        return {}
+    return {'precision': precision}
+
+
+# Maximum number of bytes read to determine the format of a file
+PEEK_BYTES = 1 << 16
+
+
 def _get_two_lines(f):
     """
-    Get the first and second lines
+    Get the first and second lines. At most :data:`PEEK_BYTES` bytes are
+    read, so that a binary file without new lines is not read to its end;
+    lines are truncated beyond it.
+
     Args:
         f (filelike): File that is opened for ascii.
 
@@ -55,16 +115,18 @@ def _get_two_lines(f):
         bytes
 
     """
-    l0 = f.readline()
-    l1 = f.readline()
+    head = io.BytesIO(f.read(PEEK_BYTES))
+    l0 = head.readline()
+    l1 = head.readline()
     return l0, l1
 
 
 def classify_format(f):
     """
     Determine the format of word embedding file by their content. This operation
-    only looks at the first two lines and does not check the sanity of input
-    file.
+    only looks at the first two lines (up to :data:`PEEK_BYTES` bytes) and does
+    not check the sanity of input file. Compressed files are decompressed (see
+    :mod:`word_embedding_loader.compression`).
 
     Args:
         f (Filelike):
@@ -73,8 +135,16 @@ def classify_format(f):
         class
 
     """
-    l0, l1 = _get_two_lines(f)
-    if loader.glove.check_valid(l0, l1):
+    head = f.read(PEEK_BYTES)
+    compression = detect_compression(head)
+    if compression is not None:
+        f = io.BufferedReader(_PrefixedReader(head, f))
+        with open_decompressed(f, compression) as d:
+            return classify_format(d)
+    l0, l1 = _get_two_lines(io.BytesIO(head))
+    if loader.wel.check_valid(l0, l1):
+        return _wel
+    elif loader.glove.check_valid(l0, l1):
         return _glove
     elif loader.word2vec_text.check_valid(l0, l1):
         return _word2vec_text
@@ -84,6 +154,304 @@ def classify_format(f):
         raise OSError(b"Invalid format")
 
 
+def _is_path(path):
+    return isinstance(path, (six.text_type, bytes))
+
+
+def _seekable(f):
+    try:
+        return f.seekable()
+    except AttributeError:
+        # Python 2 file objects
+        try:
+            f.tell()
+            return True
+        except (IOError, OSError):
+            return False
+
+
+class _PrefixedReader(io.RawIOBase):
+    """
+    Stream of bytes already read from a non-seekable stream (e.g. a pipe),
+    followed by the rest of that stream.
+    """
+    def __init__(self, prefix, f):
+        self._prefix = memoryview(prefix)
+        self._pos = 0
+        self._f = f
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        n = min(len(b), len(self._prefix) - self._pos)
+        if n > 0:
+            b[:n] = self._prefix[self._pos:self._pos + n]
+            self._pos += n
+            return n
+        return self._f.readinto(b)
+
+
+@contextlib.contextmanager
+def _open_input(path, format=None, binary=False, spool=True, mmap=False,
+                decompress_thread=False):
+    """
+    Open a file once both to determine its format and to load it. Compressed
+    files are decompressed as they are read.
+
+    Args:
+        path (str or File): Path of the file, or a file object opened in
+            binary mode. Non-seekable streams, such as pipes and sockets, are
+            accepted.
+        format (str or None): Check
+            :func:`~word_embedding_loader.word_embedding.WordEmbedding.load`.
+            The format is determined from the first :data:`PEEK_BYTES` bytes
+            if ``None``.
+        binary (bool): Check
+            :func:`~word_embedding_loader.word_embedding.WordEmbedding.load`.
+        spool (bool): Copy non-seekable streams of ``'wel'`` files, whose
+            loader seeks, to a temporary file.
+        mmap (bool): Also copy non-seekable streams of formats that can be
+            mapped into memory, so that they are mapped.
+        decompress_thread (bool): Decompress compressed files in a background
+            thread.
+
+    Yields:
+        File: File object positioned at the beginning of the file. It is
+        ``path`` itself if it is a seekable file object. Decompressed
+        contents are non-seekable streams.
+        class: Namespace of the format.
+        str or None: Compression of the file (see
+        :func:`word_embedding_loader.compression.detect`).
+    """
+    if _is_path(path):
+        with open(path, mode='rb') as f:
+            with _open_input(f, format, binary, spool, mmap,
+                             decompress_thread) as ret:
+                yield ret
+        return
+    f = path
+    seekable = _seekable(f)
+    start = f.tell() if seekable else 0
+    head = f.read(PEEK_BYTES)
+    if seekable:
+        f.seek(start)
+    else:
+        # Replay the bytes read above before the rest of the stream
+        f = io.BufferedReader(_PrefixedReader(head, f))
+    compression = detect_compression(head)
+    if compression is not None:
+        with open_decompressed(f, compression,
+                               thread=decompress_thread) as d:
+            with _open_input(d, format, binary, spool, mmap) as (d, mod, _):
+                yield d, mod, compression
+        return
+    if format is None:
+        mod = classify_format(io.BytesIO(head))
+    else:
+        mod = _select_module(format, binary)
+    if not seekable and spool and (
+            mod is _wel or (mmap and hasattr(mod.loader, 'load_mmap'))):
+        with tempfile.TemporaryFile() as tmp:
+            shutil.copyfileobj(f, tmp)
+            tmp.seek(0)
+            yield tmp, mod, None
+    else:
+        yield f, mod, None
+
+
+def sniff(path, format=None, binary=False):
+    """
+    Describe a word embedding file from its header without parsing the
+    vectors.
+
+    Args:
+        path (str or File): Path of the file, or a file object opened in
+            binary mode.
+        format (str or None): Check
+            :func:`~word_embedding_loader.word_embedding.WordEmbedding.load`.
+        binary (bool): Check
+            :func:`~word_embedding_loader.word_embedding.WordEmbedding.load`.
+
+    Returns:
+        dict: ``format`` and ``binary`` (arguments of
+        :func:`~word_embedding_loader.word_embedding.WordEmbedding.load` for
+        the file), ``words`` (number of words declared in the header; GloVe
+        files have no header, so their lines are counted without being
+        parsed), ``size`` (feature dimension), ``dtype`` (name of the data
+        type the vectors are stored in, or ``None`` for text formats),
+        ``quantized`` and ``compression`` (see
+        :func:`word_embedding_loader.compression.detect`).
+    """
+    with _open_input(path, format, binary, spool=False) as (f, mod,
+                                                            compression):
+        quantized = False
+        if mod is _wel:
+            header = loader.wel.read_header(f)
+            words, size = header['shape']
+            dtype = np.dtype(str(header['dtype'])).name
+            quantized = bool(header.get('quantized'))
+        elif mod is _glove:
+            words, size = loader.glove.read_shape(f)
+            dtype = None
+        else:
+            # Binary and text word2vec files share the header line
+            words, size = loader.word2vec_text._read_header(f)
+            dtype = 'float32' if mod.binary else None
+    return {
+        'format': mod.format,
+        'binary': mod.binary,
+        'words': words,
+        'size': size,
+        'dtype': dtype,
+        'quantized': quantized,
+        'compression': compression,
+    }
+
+
+def convert(inputfile, outputfile, to_format, to_binary=False,
+            from_format=None, from_binary=False, dtype=np.float32,
+            max_vocab=None, batch_size=1024, precision=None, quantize=False,
+            progress=None, compression='infer', decompress_thread=False):
+    """
+    Convert word embedding file to another format. Rows are streamed from
+    the input to the output in batches, so that vectors are never all held
+    in memory. Rows are written in the same order as the input. As in
+    :func:`~word_embedding_loader.word_embedding.WordEmbedding.load`,
+    duplicated words are skipped with a warning, so that the result is the
+    same as loading and saving the file. Finding them takes the set of words
+    seen so far, so memory grows with the number of distinct words (but not
+    with their vectors), except for ``'wel'`` inputs, whose words are unique.
+    Compressed inputs are decompressed as they are read (see
+    :mod:`word_embedding_loader.compression`). Unless the output is
+    ``'glove'``, distinct words are counted in a first pass, which only reads
+    the words of uncompressed inputs.
+
+    Args:
+        inputfile (str): Path of file to load.
+        outputfile (str): Path of file to save.
+        to_format (str): Format of the output. Refer to ``format`` argument of
+            :func:`~word_embedding_loader.word_embedding.WordEmbedding.load`.
+        to_binary (bool): Refer to ``binary`` argument of
+            :func:`~word_embedding_loader.word_embedding.WordEmbedding.load`.
+        from_format (str or None): Format of the input. The format is guessed
+            from the content if ``None``.
+        from_binary (bool): Refer to ``binary`` argument of
+            :func:`~word_embedding_loader.word_embedding.WordEmbedding.load`.
+        dtype (numpy.dtype): Element data type to convert the vectors to.
+        max_vocab (int): Number of distinct words to convert.
+        batch_size (int): Number of rows held in memory at a time.
+        precision (int or None): Refer to ``precision`` argument of
+            :func:`~word_embedding_loader.word_embedding.WordEmbedding.save`.
+        quantize (bool): Store vectors quantized to 8 bits (see
+            :func:`~word_embedding_loader.word_embedding.WordEmbedding.quantize`).
+            Only supported for ``'wel'`` output.
+        progress (word_embedding_loader.progress.Progress or callable):
+            Receives the progress of the conversion, in bytes read from
+            ``inputfile`` and rows converted (see
+            :mod:`word_embedding_loader.progress`). Time spent writing is
+            recorded under the module of the output format. Bytes of
+            compressed inputs are counted after decompression.
+        compression (str or None): Compression of ``outputfile`` (see
+            :func:`word_embedding_loader.compression.detect`). ``'infer'``
+            determines it from the extension of ``outputfile`` (e.g.
+            ``.gz``); ``None`` writes it uncompressed.
+        decompress_thread (bool): Refer to ``decompress_thread`` argument of
+            :func:`~word_embedding_loader.word_embedding.WordEmbedding.load`.
+    """
+    dst = _select_module(to_format, to_binary)
+    if quantize and dst is not _wel:
+        raise ValueError(b'quantize is only supported for wel format')
+    if compression == 'infer':
+        compression = infer_compression(outputfile)
+
+    progress = as_progress(progress)
+    kwargs = {'progress': progress} if progress.active else {}
+    progress.start_phase('detect')
+    words = size = None
+    if dst is not _glove:
+        # The header of the output holds the number of distinct words
+        with _open_input(inputfile, from_format, from_binary,
+                         decompress_thread=decompress_thread) as (fin, src, _):
+            with progress.timer('io', module=src.name):
+                words, size = _count_words(fin, src, batch_size, max_vocab)
+    # Open the input again rather than seeking back, which decompressed
+    # inputs do not support
+    with _open_input(inputfile, from_format, from_binary,
+                     decompress_thread=decompress_thread) as (fin, src, _), \
+            open(outputfile, mode='wb') as fout:
+        _set_total_bytes(progress, fin)
+        progress.start_phase('convert', module=src.name)
+        rows = src.loader.iter_rows(
+            fin, dtype=dtype, batch_size=batch_size,
+            max_vocab=max_vocab if src is _wel else None, **kwargs)
+        if src is not _wel:
+            rows = _unique_rows(rows, max_vocab)
+        # Time not spent reading rows is spent writing them
+        with progress.timer('format', module=dst.name), \
+                open_compressed(fout, compression,
+                                member_name(outputfile)) as f:
+            if dst is _wel:
+                dst.saver.save_rows(f, rows, words, size, dtype=dtype,
+                                    source=dict(stat_file(inputfile),
+                                                format=src.format,
+                                                binary=src.binary),
+                                    quantize=quantize)
+            else:
+                dst.saver.save_rows(f, rows, words, size,
+                                    **_saver_options(dst, precision))
+    progress.finish()
+
+
+def _unique_rows(rows, max_vocab=None):
+    # Skip duplicated words (with a warning) and stop after max_vocab
+    # distinct words, as the loaders do
+    seen = VocabularyBuilder()
+    for tokens, arr in rows:
+        keep, n = seen.add_tokens(tokens, max_vocab)
+        if len(keep) != len(tokens):
+            arr = arr[keep]
+            tokens = [tokens[k] for k in keep]
+        if len(tokens) > 0:
+            yield tokens, arr
+        if max_vocab is not None and len(seen) >= max_vocab:
+            return
+
+
+def _count_words(fin, mod, batch_size, max_vocab=None):
+    # Number of distinct words and feature dimension of the file
+    if mod is _wel:
+        # Words of wel files are unique
+        words, size = mod.loader.read_shape(fin)
+        if max_vocab is not None:
+            words = min(max_vocab, words)
+        return words, size
+    # Warnings are issued once, when the rows are converted
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', ParseWarning)
+        if _seekable(fin):
+            # Only the words are read, not the vectors
+            _, vocab, size = mod.loader.scan_offsets(fin, max_vocab)
+            return len(vocab), size
+        # Decompressed inputs are parsed, as they cannot be scanned
+        words, size = 0, 0
+        for tokens, arr in _unique_rows(
+                mod.loader.iter_rows(fin, batch_size=batch_size), max_vocab):
+            words += len(tokens)
+            size = arr.shape[1]
+        return words, size
+
+
+def _set_total_bytes(progress, f):
+    # Size of the file being read, for progress reports
+    if not progress.active or progress.total_bytes is not None:
+        return
+    try:
+        progress.total_bytes = os.fstat(f.fileno()).st_size
+    except (AttributeError, IOError, OSError, ValueError):
+        pass
+
+
 class WordEmbedding(object):
     """
     Main API for loading and saving of pretrained word embedding files.
@@ -93,28 +461,34 @@ class WordEmbedding(object):
         :func:`~word_embedding_loader.word_embedding.WordEmbedding.load`.
 
     Args:
-        vectors (numpy.ndarray): Word embedding representation vectors
-        vocab (dict): Mapping from words (bytes) to vector
-            indices (int).
+        vectors (numpy.ndarray or word_embedding_loader.arrays.RowVectors):
+            Word embedding representation vectors
+        vocab (dict or word_embedding_loader.vocabulary.Vocabulary): Mapping
+            from words (bytes) to vector indices (int).
         freqs (dict): Mapping from words (bytes) to word frequency counts
             (int).
 
     Attributes:
-        vectors (numpy.ndarray): Word embedding vectors in shape of
+        vectors (numpy.ndarray or word_embedding_loader.arrays.RowVectors):
+            Word embedding vectors in shape of
             ``(vocabulary size, feature dimension)``.
-        vocab (dict): Mapping from words (bytes) to vector indices (int)
+        vocab (dict or word_embedding_loader.vocabulary.Vocabulary): Mapping
+            from words (bytes) to vector indices (int). It is a read-only
+            :class:`~word_embedding_loader.vocabulary.Vocabulary` when loaded
+            by :func:`~word_embedding_loader.word_embedding.WordEmbedding.load`;
+            replace it with ``dict(vocab)`` to modify it.
         freqs (dict or None): Mapping from words (bytes) to frequency counts
             (int).
 
     """
     def __init__(self, vectors, vocab, freqs=None):
-        if not isinstance(vectors, np.ndarray):
+        if not isinstance(vectors, (np.ndarray, RowVectors)):
             raise TypeError(
                 ("Expected numpy.ndarray for vectors, %s found."% type(vectors)
                  ).encode('utf-8'))
-        if not isinstance(vocab, dict):
+        if not isinstance(vocab, (dict, Vocabulary)):
             raise TypeError(
-                ("Expected dict for vocab, %s found." % type(vectors)
+                ("Expected dict for vocab, %s found." % type(vocab)
                  ).encode('utf-8'))
         if len(vectors) != len(vocab):
             warnings.warn(
@@ -124,15 +498,30 @@ class WordEmbedding(object):
         self.vocab = vocab
         self.freqs = freqs
         self._load_cond = None
+        self._source = None
+        # Arrays derived from vectors, see _derived
+        self._derived_cache = {}
 
     @classmethod
     def load(cls, path, vocab=None, dtype=np.float32, max_vocab=None,
-             format=None, binary=False):
+             format=None, binary=False, mmap=False, cache_dir=None,
+             workers=None, lazy=False, cache_rows=CACHE_ROWS, progress=None,
+             decompress_thread=False):
         """
         Load pretrained word embedding from a file.
 
         Args:
-            path (str): Path of file to load.
+            path (str or File): Path of file to load, or a file object
+                opened in binary mode. The file is opened once; its format is
+                determined from the first :data:`PEEK_BYTES` bytes. File
+                objects may be in memory (e.g. :class:`io.BytesIO`) or
+                non-seekable streams such as pipes and sockets, which are
+                read as they arrive. ``'wel'`` files, and files to map into
+                memory, are then copied to a temporary file first. Files
+                compressed with gzip, bzip2, xz, zstd or zip are detected
+                from their first bytes and decompressed as they are read
+                (see :mod:`word_embedding_loader.compression`), like
+                non-seekable streams.
             vocab (str or None): Path to vocabulary file created by word2vec
                 with ``-save-vocab <file>`` option. If vocab is given,
                 :py:attr:`~vectors` and :py:attr:`~vocab` is ordered in
@@ -146,16 +535,81 @@ class WordEmbedding(object):
                 `GloVe <https://nlp.stanford.edu/projects/glove/>`_, Global
                 Vectors for Word Representation, by Jeffrey Pennington,
                 Richard Socher, Christopher D. Manning from Stanford NLP group.
+                ``'wel'`` for the native binary format of this package, which
+                is the fastest to load (see
+                :mod:`word_embedding_loader.loader.wel`).
                 If ``None`` is given, the format is guessed from the content.
             binary (bool): Load file as binary file as in word embedding file
                 created by
                 `word2vec <https://code.google.com/archive/p/word2vec/>`_ with
                 ``-binary 1`` option. If ``format`` is ``'glove'`` or ``None``,
                 this argument is simply ignored
+            mmap (bool): Map the file into memory instead of reading vectors
+                into a new array. :py:attr:`~vectors` is then a read-only
+                view of the file (see
+                :func:`word_embedding_loader.loader.word2vec_bin.load_mmap`),
+                which is shared between processes through the page cache.
+                Only supported for binary word2vec and ``'wel'`` files; it is
+                ignored with a warning for other formats.
+            cache_dir (str or word_embedding_loader.cache.LoadCache): If
+                given, the parsed result is cached in this directory and
+                later loads of the same file with the same arguments are
+                served from the cache (see :mod:`word_embedding_loader.cache`).
+                Pass a :class:`~word_embedding_loader.cache.LoadCache` to
+                bound the size of the cache or to fingerprint the file by
+                its contents. Cached results can be memory-mapped whatever the
+                format of the original file.
+            workers (int): Number of processes to parse the file with. Text
+                files (GloVe and text word2vec) are split into parts that are
+                parsed in parallel (see
+                :mod:`word_embedding_loader.loader._parallel`). The result is
+                the same as loading with a single process. It is ignored with
+                a warning for other formats.
+            lazy (bool): Only find the words and the position of their vectors
+                in the file, and parse vectors when they are accessed.
+                :py:attr:`~vectors` is then a
+                :class:`~word_embedding_loader.arrays.LazyVectors`. The
+                positions are saved next to the file (see
+                :mod:`word_embedding_loader.lazy`), so that later loads do not
+                scan the file again. ``mmap`` and ``workers`` are ignored. For
+                ``'wel'`` files, it is the same as ``mmap=True``.
+            cache_rows (int): Maximum number of parsed vectors kept in memory
+                when ``lazy`` is ``True``.
+            progress (word_embedding_loader.progress.Progress or callable):
+                Called periodically with a
+                :class:`~word_embedding_loader.progress.ProgressInfo` (bytes
+                read, rows parsed, elapsed time and phase). Pass a
+                :class:`~word_embedding_loader.progress.Progress` to also get
+                the time spent in I/O, parsing and array assembly. Rows are
+                not reported when ``mmap``, ``lazy`` or ``workers`` is used.
+            decompress_thread (bool): Decompress compressed files in a
+                background thread, so that decompression and parsing
+                overlap.
 
         Returns:
             :class:`~word_embedding_loader.word_embedding.WordEmbedding`
+
+        Raises:
+            ValueError: ``lazy`` is ``True`` and ``vocab`` or ``cache_dir`` is
+                given, or ``lazy`` or ``cache_dir`` is given with a file
+                object, or ``lazy`` is ``True`` for a compressed GloVe or
+                word2vec file.
         """
+        if lazy and (vocab is not None or cache_dir is not None):
+            raise ValueError(
+                b"lazy=True cannot be used with vocab or cache_dir")
+        if (lazy or cache_dir is not None) and not _is_path(path):
+            raise ValueError(
+                b"lazy=True and cache_dir require the path of the file")
+        progress = as_progress(progress)
+        if cache_dir is not None:
+            if not isinstance(cache_dir, LoadCache):
+                cache_dir = LoadCache(cache_dir)
+            return cls._load_cached(
+                cache_dir, path, vocab=vocab, dtype=dtype, max_vocab=max_vocab,
+                format=format, binary=binary, mmap=mmap, workers=workers,
+                progress=progress, decompress_thread=decompress_thread)
+
         freqs = None
         if vocab is not None:
             with open(vocab, mode='rb') as f:
@@ -166,24 +620,154 @@ class WordEmbedding(object):
                      sorted(six.iteritems(freqs),
                             key=lambda k_v: k_v[1], reverse=True)[:max_vocab])}
 
-        with open(path, mode='rb') as f:
-            if format is None:
-                mod = classify_format(f)
-            else:
-                mod = _select_module(format, binary)
+        progress.start_phase('detect')
+        with _open_input(path, format, binary, mmap=mmap or lazy,
+                         decompress_thread=decompress_thread) as (
+                             f, mod, compression):
+            _set_total_bytes(progress, f)
+            progress.start_phase('parse', module=mod.name)
+            if lazy and mod is not _wel and compression is not None:
+                # Vectors are parsed from their position in the file
+                raise ValueError(
+                    b"lazy=True cannot be used with compressed files")
+            if lazy and mod is not _wel:
+                with progress.timer('io'):
+                    arr, v = load_lazy(path, mod, dtype=dtype,
+                                       max_vocab=max_vocab,
+                                       cache_rows=cache_rows, fin=f)
+                progress.finish()
+                obj = cls(arr, v)
+                obj._load_cond = mod
+                obj._source = stat_file(path)
+                return obj
+            mmap = mmap or lazy
+            if mmap and not hasattr(mod.loader, 'load_mmap'):
+                warnings.warn(
+                    "Argument mmap=True is ignored for this format.",
+                    UserWarning)
+                mmap = False
+            if workers is not None and not mod.parallel:
+                warnings.warn(
+                    "Argument workers is ignored for this format.",
+                    UserWarning)
+                workers = None
+            # Only pass workers and progress when given so that loaders
+            # without them work
+            kwargs = {} if workers is None else {'workers': workers}
+            if progress.active:
+                kwargs['progress'] = progress
 
-        with open(path, mode='rb') as f:
-            if vocab is not None:
-                arr = mod.loader.load_with_vocab(f, vocab, dtype=dtype)
-                v = vocab
-            else:
-                arr, v = mod.loader.load(f, max_vocab=max_vocab, dtype=dtype)
+            # Time not attributed by the loader is spent on its own work
+            with progress.timer('parse'):
+                if vocab is not None:
+                    if mmap:
+                        arr = mod.loader.load_with_vocab_mmap(f, vocab,
+                                                              dtype=dtype)
+                    else:
+                        arr = mod.loader.load_with_vocab(f, vocab, dtype=dtype,
+                                                         **kwargs)
+                    v = vocab
+                elif mmap:
+                    arr, v = mod.loader.load_mmap(
+                        f, max_vocab=max_vocab, dtype=dtype)
+                else:
+                    arr, v = mod.loader.load(f, max_vocab=max_vocab,
+                                             dtype=dtype, **kwargs)
+            if progress.active:
+                progress.update(position=file_position(f))
 
+        progress.start_phase('build-vocab')
+        if not isinstance(v, Vocabulary):
+            # Loaders build a Vocabulary; vocab given by the caller may be
+            # a dict
+            with progress.timer('assemble'):
+                v = Vocabulary.from_dict(v)
+        progress.finish()
         obj = cls(arr, v, freqs)
         obj._load_cond = mod
+        obj._source = stat_file(path) if _is_path(path) else None
+        return obj
+
+    @staticmethod
+    def iter_rows(path, format=None, binary=False, dtype=np.float32,
+                  batch_size=1024, max_vocab=None, decompress_thread=False):
+        """
+        Read pretrained word embedding file in batches. Unlike
+        :func:`~word_embedding_loader.word_embedding.WordEmbedding.load`, only
+        one batch is held in memory at a time, and duplicated words are not
+        removed. For most arguments, you should refer to
+        :func:`~word_embedding_loader.word_embedding.WordEmbedding.load`.
+
+        Args:
+            batch_size (int): Number of rows in each batch.
+            max_vocab (int): Number of rows to read.
+            decompress_thread (bool): Decompress compressed files in a
+                background thread.
+
+        Yields:
+            list: Words (``bytes``) in the batch.
+            numpy.ndarray: Vectors of shape
+            ``(len(words), feature dimension)``.
+        """
+        with _open_input(path, format, binary,
+                         decompress_thread=decompress_thread) as (f, mod, _):
+            for batch in mod.loader.iter_rows(
+                    f, dtype=dtype, batch_size=batch_size,
+                    max_vocab=max_vocab):
+                yield batch
+
+    @classmethod
+    def _load_cached(cls, cache, path, vocab, dtype, max_vocab, format, binary,
+                     mmap, workers, progress, decompress_thread):
+        options = {
+            'vocab': None if vocab is None else cache.fingerprint(vocab),
+            'dtype': np.dtype(dtype).str,
+            'max_vocab': max_vocab,
+            'format': format,
+            'binary': binary,
+        }
+        source = cache.fingerprint(path)
+        key = cache.key(source, **options)
+        # Entries are not evicted while they are locked
+        with cache.lock(key, shared=True):
+            entry = cache.get(key)
+            if entry is not None:
+                return cls._load_entry(entry, path, vocab, dtype, mmap,
+                                       progress)
+        with cache.lock(key):
+            # Another process may have created the entry while waiting
+            entry = cache.get(key)
+            if entry is None:
+                obj = cls.load(path, vocab=vocab, dtype=dtype,
+                               max_vocab=max_vocab, format=format,
+                               binary=binary, workers=workers,
+                               progress=progress,
+                               decompress_thread=decompress_thread)
+                entry = cache.put(
+                    key, obj.vectors, obj.vocab,
+                    dict(source, format=obj._load_cond.format,
+                         binary=obj._load_cond.binary))
+                if not mmap:
+                    return obj
+            return cls._load_entry(entry, path, vocab, dtype, mmap, progress)
+
+    @classmethod
+    def _load_entry(cls, entry, path, vocab, dtype, mmap, progress):
+        # Load a cached file as if path was loaded
+        obj = cls.load(entry, dtype=dtype, format='wel', mmap=mmap,
+                       progress=progress)
+        with open(entry, mode='rb') as f:
+            source = loader.wel.read_header(f)['source']
+        obj._load_cond = _select_module(source['format'], source['binary'])
+        obj._source = stat_file(path)
+        if vocab is not None:
+            with open(vocab, mode='rb') as f:
+                obj.freqs = loader.vocab.load_vocab(f)
         return obj
 
-    def save(self, path, format, binary=False, use_load_condition=False):
+    def save(self, path, format, binary=False, use_load_condition=False,
+             precision=None, progress=None, compression='infer',
+             content_hash=False):
         """
         Save object as word embedding file. For most arguments, you should refer
         to :func:`~word_embedding_loader.word_embedding.WordEmbedding.load`.
@@ -192,6 +776,26 @@ class WordEmbedding(object):
             use_load_condition (bool): If `True`, options from
                 :func:`~word_embedding_loader.word_embedding.WordEmbedding.load`
                 is used.
+            precision (int or None): Number of digits after the decimal point
+                of the values in text formats (GloVe and text word2vec). Values
+                are then formatted in blocks by NumPy, which is much faster. If
+                ``None``, each value is written in the shortest form that is
+                read back to the same value. It is ignored with a warning for
+                binary formats.
+            progress (word_embedding_loader.progress.Progress or callable):
+                Called periodically with a
+                :class:`~word_embedding_loader.progress.ProgressInfo` of the
+                rows written, as in
+                :func:`~word_embedding_loader.word_embedding.WordEmbedding.load`.
+            compression (str or None): Compression of the file: ``'gzip'``,
+                ``'bz2'``, ``'xz'``, ``'zstd'`` or ``'zip'`` (see
+                :mod:`word_embedding_loader.compression`). ``'infer'``
+                determines it from the extension of ``path`` (e.g. ``.gz``);
+                ``None`` writes it uncompressed.
+            content_hash (bool): Record the checksum of the contents of the
+                file this object was loaded from in ``'wel'`` files, in
+                addition to its path, size and modification time. It requires
+                reading the whole source file.
 
         Raises:
             ValueError: ``use_load_condition == True`` but the object is not
@@ -207,19 +811,426 @@ class WordEmbedding(object):
             mod = self._load_cond
         else:
             mod = _select_module(format, binary)
+        if compression == 'infer':
+            compression = infer_compression(path)
 
+        progress = as_progress(progress)
+        progress.start_phase('write', module=mod.name)
+        itr = vocab_pairs(self.vocab, self.freqs)
 
-        if self.freqs is None:
-            itr = list(
-                sorted(six.iteritems(self.vocab), key=lambda k_v: k_v[1]))
+        with open(path, mode='wb') as fout, progress.timer('format'):
+            with open_compressed(fout, compression, member_name(path)) as f:
+                if mod is _wel:
+                    kwargs = {'progress': progress} if progress.active else {}
+                    mod.saver.save(f, self.vectors, itr,
+                                   source=self._describe_source(content_hash),
+                                   **kwargs)
+                elif progress.active or not isinstance(self.vectors,
+                                                       np.ndarray):
+                    # Write rows in batches rather than converting all the
+                    # vectors (e.g. quantized ones) to an array. Batches also
+                    # report progress.
+                    if not hasattr(itr, '__len__'):
+                        itr = list(itr)
+                    mod.saver.save_rows(
+                        f, iter_batches(self.vectors, itr, 1024,
+                                        progress=progress),
+                        len(itr), self.size, **_saver_options(mod, precision))
+                else:
+                    mod.saver.save(f, self.vectors, itr,
+                                   **_saver_options(mod, precision))
+            if progress.active:
+                fout.flush()
+                progress.update(position=file_position(fout))
+        progress.finish()
+
+    def _describe_source(self, content_hash=False):
+        # Information of the file this object was loaded from, which is
+        # recorded in files saved in 'wel' format
+        if self._source is None:
+            return None
+        source = dict(self._source)
+        if not content_hash:
+            return source
+        try:
+            if stat_file(source['path']) == self._source:
+                source['checksum'] = checksum_file(source['path'])
+        except OSError:
+            # The file has been removed since
+            pass
+        return source
+
+    def quantize(self, bits=8, per_row=True):
+        """
+        Get a copy of this object with compact vectors. Lookups, similarity
+        search and saving work on them directly.
+
+        Args:
+            bits (int): ``8`` to quantize values to ``uint8`` codes with a
+                scale and an offset (see
+                :class:`~word_embedding_loader.arrays.QuantizedVectors`), which
+                takes a quarter of the memory of ``float32`` vectors. Rows are
+                dequantized when they are accessed, and files saved in
+                ``'wel'`` format store the codes. ``16`` to convert them to
+                ``float16``.
+            per_row (bool): For ``bits=8``, quantize each row by its own
+                range instead of the range of all the values, which is more
+                accurate.
+
+        Returns:
+            :class:`~word_embedding_loader.word_embedding.WordEmbedding`
+        """
+        if bits == 8:
+            vectors = QuantizedVectors.quantize(self.vectors, per_row,
+                                                dtype=np.float32)
+        elif bits == 16:
+            vectors = np.asarray(self.vectors, dtype=np.float16)
+        else:
+            raise ValueError(('Unsupported bits: %s' % bits).encode('utf-8'))
+        obj = type(self)(vectors, self.vocab, self.freqs)
+        obj._load_cond = self._load_cond
+        obj._source = self._source
+        return obj
+
+    def lookup_ids(self, tokens):
+        """
+        Get the vector indices of many words at once.
+
+        Args:
+            tokens (iterable): Words (``bytes``).
+
+        Returns:
+            numpy.ndarray: ``int64`` index of each word. Words that are not
+            in :py:attr:`~vocab` get ``-1``.
+        """
+        if isinstance(self.vocab, Vocabulary):
+            return self.vocab.lookup_ids(tokens)
+        get = self.vocab.get
+        if not hasattr(tokens, '__len__'):
+            tokens = list(tokens)
+        return np.fromiter((get(t, -1) for t in tokens), dtype=np.int64,
+                           count=len(tokens))
+
+    def lookup(self, tokens, oov='zero', random_state=None):
+        """
+        Get the vectors of many words at once. Vectors are gathered by a
+        single indexing of :py:attr:`~vectors`.
+
+        Args:
+            tokens (iterable): Words (``bytes``).
+            oov (str or int): Vector of words that are not in
+                :py:attr:`~vocab`. ``'zero'`` for zero vectors, ``'random'``
+                for vectors drawn from the normal distribution with the mean
+                and the standard deviation of :py:attr:`~vectors` (in each
+                dimension), ``'mean'`` for the mean of :py:attr:`~vectors`,
+                ``'error'`` to raise ``KeyError``, or a vector index (such as
+                that of an unknown word token) to use its vector.
+            random_state (int or numpy.random.RandomState or None): Random
+                number generator (or its seed) for ``oov='random'``.
+
+        Returns:
+            numpy.ndarray: Vectors in shape of
+            ``(len(tokens), feature dimension)``.
+
+        Raises:
+            KeyError: ``oov == 'error'`` and some words are not in
+                :py:attr:`~vocab`.
+        """
+        if not hasattr(tokens, '__len__'):
+            tokens = list(tokens)
+        return self._gather(self.lookup_ids(tokens), tokens, oov,
+                            random_state)
+
+    def lookup_padded(self, sentences, oov='zero', max_len=None,
+                      random_state=None):
+        """
+        Get the vectors of a batch of sentences, padded to the same length.
+        For most arguments, you should refer to
+        :func:`~word_embedding_loader.word_embedding.WordEmbedding.lookup`.
+
+        Args:
+            sentences (iterable): Each element is a list of words
+                (``bytes``).
+            max_len (int or None): Sentences are truncated to this length. It
+                is the length of the longest sentence if ``None``.
+
+        Returns:
+            numpy.ndarray: Vectors in shape of
+            ``(len(sentences), max_len, feature dimension)``. Padding
+            positions are zero vectors.
+            numpy.ndarray: Length of each sentence (after truncation).
+        """
+        tokens, lengths, mask = self._flatten(sentences, max_len)
+        flat = self._gather(self.lookup_ids(tokens), tokens, oov,
+                            random_state)
+        out = np.zeros(mask.shape + (self.size, ), dtype=flat.dtype)
+        out[mask] = flat
+        return out, lengths
+
+    def lookup_ids_padded(self, sentences, max_len=None, pad=-1):
+        """
+        Get the vector indices of a batch of sentences, padded to the same
+        length.
+
+        Args:
+            sentences (iterable): Each element is a list of words
+                (``bytes``).
+            max_len (int or None): Sentences are truncated to this length. It
+                is the length of the longest sentence if ``None``.
+            pad (int): Index of padding positions.
+
+        Returns:
+            numpy.ndarray: ``int64`` indices in shape of
+            ``(len(sentences), max_len)``. Words that are not in
+            :py:attr:`~vocab` get ``-1``.
+            numpy.ndarray: Length of each sentence (after truncation).
+        """
+        tokens, lengths, mask = self._flatten(sentences, max_len)
+        out = np.full(mask.shape, pad, dtype=np.int64)
+        out[mask] = self.lookup_ids(tokens)
+        return out, lengths
+
+    @staticmethod
+    def _flatten(sentences, max_len):
+        # Concatenate (truncated) sentences and mark their positions in the
+        # padded batch
+        sentences = [s[:max_len] if max_len is not None else s
+                     for s in sentences]
+        lengths = np.fromiter((len(s) for s in sentences), dtype=np.int64,
+                              count=len(sentences))
+        if max_len is None:
+            max_len = int(lengths.max()) if len(lengths) > 0 else 0
+        mask = np.arange(max_len) < lengths[:, None]
+        tokens = [t for s in sentences for t in s]
+        return tokens, lengths, mask
+
+    def _gather(self, ids, tokens, oov, random_state):
+        missing = ids < 0
+        if isinstance(oov, six.integer_types + (np.integer, )):
+            ids[missing] = oov
+            return np.asarray(self.vectors[ids])
+        if oov not in ('zero', 'random', 'mean', 'error'):
+            raise ValueError(('Unknown oov "%s"' % oov).encode('utf-8'))
+        if oov == 'error' and missing.any():
+            raise KeyError(tokens[int(np.argmax(missing))])
+        ids[missing] = 0
+        out = np.asarray(self.vectors[ids])
+        n = int(missing.sum())
+        if n == 0:
+            return out
+        if oov == 'zero':
+            out[missing] = 0
+        elif oov == 'mean':
+            out[missing] = self._moments()[0]
         else:
-            itr = list(
-                sorted(six.iteritems(self.vocab),
-                       key=lambda k_v: self.freqs[k_v[0]], reverse=True)
-            )
+            if not isinstance(random_state, np.random.RandomState):
+                random_state = np.random.RandomState(random_state)
+            mean, std = self._moments()
+            out[missing] = random_state.normal(mean, std, (n, self.size))
+        return out
+
+    def analogy(self, a, b, c, k=1, method='3cosadd', restrict_vocab=None):
+        """
+        Solve word analogies ``a : b :: c : ?`` (e.g.
+        ``man : king :: woman : queen``) by exact search over the
+        L2-normalized vectors (see
+        :func:`word_embedding_loader.similarity.analogy`). All the queries
+        are scored together by blocked matrix multiplications. The words of
+        each query are not found as its answers.
+
+        Args:
+            a (list): Words (``bytes``) ``a`` of the queries, or a single
+                word.
+            b (list): Words ``b`` of the queries.
+            c (list): Words ``c`` of the queries.
+            k (int): Number of answers to find for each query.
+            method (str): ``'3cosadd'`` or ``'3cosmul'``.
+            restrict_vocab (int or None): Only search the first
+                ``restrict_vocab`` words.
+
+        Returns:
+            numpy.ndarray: Vector indices of the answers, from the best, in
+            shape of ``(number of queries, k)``, or ``(k, )`` for a single
+            query.
+            numpy.ndarray: Scores of the answers.
+
+        Raises:
+            KeyError: A word is not in :py:attr:`~vocab`.
+        """
+        single = isinstance(a, bytes)
+        if single:
+            a, b, c = [a], [b], [c]
+        if not len(a) == len(b) == len(c):
+            raise ValueError(b'a, b and c must have the same length')
+        ids = self.lookup_ids(list(a) + list(b) + list(c))
+        if (ids < 0).any():
+            words = list(a) + list(b) + list(c)
+            raise KeyError(words[int(np.argmax(ids < 0))])
+        ids = ids.reshape(3, -1)
+        vectors, weights = self._unit_vectors()
+        a, b, c = (similarity.normalize(vectors[i]) for i in ids)
+        indices, scores = similarity.analogy(
+            vectors, a, b, c, k, method, ids.T, restrict_vocab, weights)
+        if single:
+            return indices[0], scores[0]
+        return indices, scores
+
+    def _search(self, queries, k, metric, exclude, restrict_vocab):
+        # Exact search of most_similar; queries are vector indices if exclude
+        # is not None
+        norms = None
+        weights = None
+        if metric == 'cosine':
+            vectors, weights = self._unit_vectors()
+            if exclude is not None:
+                queries = vectors[exclude]
+            queries = similarity.normalize(np.asarray(queries))
+        else:
+            vectors = self.vectors
+            if exclude is not None:
+                queries = self.vectors[exclude]
+            if metric == 'l2':
+                norms = self._derived('squared_norms',
+                                      similarity.squared_norms)
+        return similarity.search(
+            vectors, queries, k, 'l2' if metric == 'l2' else 'dot', norms,
+            exclude, restrict_vocab, weights)
+
+    def _unit_vectors(self):
+        # Vectors for cosine similarity and the factors of their rows. Arrays
+        # are normalized once into a copy, while other vectors (such as
+        # quantized ones) are scaled by their inverse norms while searching
+        # so that they are not dequantized as a whole
+        if isinstance(self.vectors, np.ndarray):
+            return self._derived('normalized', similarity.normalize), None
+        return self.vectors, self._derived('inverse_norms',
+                                           similarity.inverse_norms)
+
+    def _derived(self, name, func):
+        # Compute func(vectors) once and reuse it while vectors is the same
+        # object
+        vectors, value = self._derived_cache.get(name, (None, None))
+        if vectors is not self.vectors:
+            value = func(self.vectors)
+            self._derived_cache[name] = (self.vectors, value)
+        return value
 
-        with open(path, mode='wb') as f:
-            mod.saver.save(f, self.vectors, itr)
+    def _moments(self):
+        # Mean and standard deviation of vectors in each dimension, which are
+        # computed in blocks of rows
+        def compute(vectors):
+            n = len(vectors)
+            total = np.zeros(self.size, dtype=np.float64)
+            squares = np.zeros(self.size, dtype=np.float64)
+            step = max(1, (1 << 20) // max(1, self.size))
+            for start in six.moves.range(0, n, step):
+                block = np.asarray(vectors[start:start + step],
+                                   dtype=np.float64)
+                total += block.sum(axis=0)
+                squares += np.square(block).sum(axis=0)
+            mean = total / max(1, n)
+            std = np.sqrt(np.maximum(squares / max(1, n) - mean ** 2, 0))
+            return mean, std
+        return self._derived('moments', compute)
+
+    def most_similar(self, queries, k=10, metric='cosine',
+                     restrict_vocab=None, index=None):
+        """
+        Find the words whose vectors are the most similar to queries by exact
+        search (see :mod:`word_embedding_loader.similarity`). Several
+        queries are scored together by matrix multiplications, which is much
+        faster than searching them one by one.
+
+        Args:
+            queries (bytes, numpy.ndarray or list): A word, a vector, or a
+                list of words or vectors (or a 2-D array) to search at once.
+            k (int): Number of words to find for each query.
+            metric (str): ``'cosine'`` for cosine similarity, ``'dot'`` for
+                dot product or ``'l2'`` for Euclidean distance. For
+                ``'cosine'``, an L2-normalized copy of :py:attr:`~vectors`
+                is computed on the first call and reused afterwards (only the
+                norms of the rows for vectors that are not a
+                :class:`numpy.ndarray`, such as quantized ones).
+            restrict_vocab (int or None): Only search the first
+                ``restrict_vocab`` words, which are usually the most frequent
+                ones.
+            index (word_embedding_loader.index.IVFIndex or None): Search
+                approximately with this index (see :meth:`build_index`)
+                instead of exactly. ``metric`` must be the metric of the
+                index, and ``restrict_vocab`` is not supported.
+
+        Returns:
+            numpy.ndarray: Vector indices of the found words, from the most
+            similar (the smallest distance for ``'l2'``), in shape of
+            ``(number of queries, k)``, or ``(k, )`` for a single query. Use
+            :meth:`~word_embedding_loader.vocabulary.Vocabulary.word` to get
+            the words.
+            numpy.ndarray: Similarities (distances for ``'l2'``) of the found
+            words.
+
+        Raises:
+            KeyError: A query word is not in :py:attr:`~vocab`.
+        """
+        if metric not in similarity.METRICS:
+            raise ValueError(('Unknown metric "%s"' % metric).encode('utf-8'))
+        if index is not None and (index.metric != metric or
+                                  restrict_vocab is not None):
+            raise ValueError(
+                ('The index supports metric="%s" without restrict_vocab' %
+                 index.metric).encode('utf-8'))
+        single = isinstance(queries, bytes) or (
+            isinstance(queries, np.ndarray) and queries.ndim == 1)
+        if single:
+            queries = [queries]
+        exclude = None
+        if not isinstance(queries, np.ndarray) and \
+                all(isinstance(q, bytes) for q in queries):
+            # Words are not found as similar to themselves
+            exclude = self.lookup_ids(queries)
+            if (exclude < 0).any():
+                raise KeyError(queries[int(np.argmax(exclude < 0))])
+
+        if index is not None:
+            if exclude is not None:
+                queries = self.vectors[exclude]
+            indices, scores = index.search(queries, k, exclude=exclude)
+        else:
+            indices, scores = self._search(queries, k, metric, exclude,
+                                           restrict_vocab)
+        if single:
+            return indices[0], scores[0]
+        return indices, scores
+
+    def build_index(self, kind='ivf', nlist=None, nprobe=8, pq=None,
+                    metric='cosine', **kwargs):
+        """
+        Build an index for approximate nearest neighbor search of
+        :py:attr:`~vectors`, which can be passed to
+        :func:`~word_embedding_loader.word_embedding.WordEmbedding.most_similar`.
+        The index can be saved next to the embedding file with
+        :meth:`~word_embedding_loader.index.IVFIndex.save` and its
+        :meth:`~word_embedding_loader.index.IVFIndex.recall` tells how many
+        of the exact nearest neighbors it finds.
+
+        Args:
+            kind (str): Kind of index. Only ``'ivf'`` (inverted file with
+                k-means clustering, see :mod:`word_embedding_loader.index`) is
+                supported.
+            nlist (int or None): Number of clusters.
+            nprobe (int): Default number of clusters to search.
+            pq (int or None): Number of subquantizers to compress vectors
+                with product quantization, or ``None`` to store them in full.
+            metric (str): ``'cosine'``, ``'dot'`` or ``'l2'``.
+            kwargs: Other arguments of
+                :meth:`~word_embedding_loader.index.IVFIndex.build`.
+
+        Returns:
+            word_embedding_loader.index.IVFIndex
+        """
+        if kind != 'ivf':
+            raise ValueError(('Unknown kind "%s"' % kind).encode('utf-8'))
+        return IVFIndex.build(self.vectors, nlist=nlist, nprobe=nprobe, pq=pq,
+                              metric=metric, **kwargs)
 
     def __len__(self):
         return len(self.vectors)